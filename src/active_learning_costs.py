@@ -1,8 +1,10 @@
 import argparse
+import copy
 import logging
 import pathlib
-from collections import deque, defaultdict
-from typing import Callable, Deque, Dict, Iterable, List, Tuple
+from collections import defaultdict
+from functools import partial
+from typing import Callable, Dict, Iterable, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -11,8 +13,13 @@ from tqdm import tqdm
 
 from active_learning_topk import mean_reciprocal_rank
 from data_utils import CIFAR100_SUPERCLASS_LOOKUP, DATAFILE_LIST, COST_MATRIX_FILE_DICT
-from data_utils import RESULTS_DIR
+from data_utils import RESULTS_DIR, load_scores
+from executor import RunExecutor
 from models import DirichletMultinomialCost, Model
+from ranking import select_topk
+from sampling import ClassPool
+from seeding import run_generators
+from shared_data import SharedArrays, SharedResultBuffer
 
 OUTPUT_DIR = RESULTS_DIR + 'costs/cifar100'
 
@@ -32,31 +39,33 @@ class Dataset:
     def __len__(self):
         return self.labels.shape[0]
 
-    def enqueue(self) -> List[Deque[int]]:
-        queues = [deque() for _ in range(self.num_classes)]
-        for label, prediction in zip(self.labels, self.predictions):
-            queues[prediction].append(label)
-        return queues
+    def enqueue(self) -> ClassPool:
+        return ClassPool(self.predictions, self.num_classes)
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self.labels
 
-    def shuffle(self) -> None:
+    def shuffle(self, rng: np.random.Generator) -> None:
         # To make sure the rows still align we shuffle an array of indices, and use these to
         # re-order the dataset's attributes.
         shuffle_ids = np.arange(self.labels.shape[0])
-        np.random.shuffle(shuffle_ids)
+        rng.shuffle(shuffle_ids)
         self.labels = self.labels[shuffle_ids]
         self.scores = self.scores[shuffle_ids]
 
     @classmethod
     def load_from_text(cls, fname: pathlib.Path) -> 'Dataset':
         """
-        Load dataset from a text file. Assumed format is:
+        Load dataset from a text file, or its memory-mapped binary columns if it has been converted with
+        convert_predictions.py. Assumed format is:
 
             correct_class score_0 ... score_k
 
         """
-        array = np.genfromtxt(fname)
-        labels = array[:, 0].astype(np.int)
-        scores = array[:, 1:].astype(np.float)
+        labels, scores = load_scores(fname)
+        labels = labels.astype(np.int64)
+        scores = scores.astype(np.float64, copy=False)
         return cls(labels, scores)
 
     @property
@@ -70,10 +79,14 @@ class Dataset:
 
     @property
     def confusion_prior(self) -> np.ndarray:
+        # Sum the scores of the samples predicted as each class over contiguous runs of samples sorted by prediction
+        predictions = self.predictions
+        order = np.argsort(predictions, kind='stable')
+        predicted_classes, starts = np.unique(predictions[order], return_index=True)
         arr = np.zeros((self.num_classes, self.num_classes))
-        for i in range(self.num_classes):
-            arr[i] = self.scores[self.predictions == i].sum(axis=0) / sum(self.predictions == i)
-        return arr
+        arr[predicted_classes] = np.add.reduceat(self.scores[order], starts, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return arr / np.bincount(predictions, minlength=self.num_classes)[:, np.newaxis]
 
     @property
     def predictions(self) -> np.ndarray:
@@ -95,11 +108,11 @@ class SuperclassDataset:
     def __len__(self):
         return self.labels.shape[0]
 
-    def shuffle(self) -> None:
+    def shuffle(self, rng: np.random.Generator) -> None:
         # To make sure the rows still align we shuffle an array of indices, and use these to
         # re-order the dataset's attributes.
         shuffle_ids = np.arange(self.labels.shape[0])
-        np.random.shuffle(shuffle_ids)
+        rng.shuffle(shuffle_ids)
         self.labels = self.labels[shuffle_ids]
         self.scores = self.scores[shuffle_ids]
 
@@ -113,25 +126,29 @@ class SuperclassDataset:
                 entry = 2
             yield prediction, entry
 
-    def enqueue(self) -> List[Deque[int]]:
-        queues = [deque() for _ in range(self.num_classes)]
-        for prediction, entry in self.generate():
-            queues[prediction].append(entry)
-        return queues
+    def enqueue(self) -> ClassPool:
+        return ClassPool(self.predictions, self.num_classes)
+
+    @property
+    def observations(self) -> np.ndarray:
+        predictions = self.predictions
+        lookup = np.array([self.superclass_lookup[i] for i in range(self.num_classes)])
+        return np.where(self.labels == predictions, 0, np.where(lookup[self.labels] == lookup[predictions], 1, 2))
 
     @classmethod
     def load_from_text(cls,
                        fname: pathlib.Path,
                        superclass_lookup: Dict[int, int]) -> 'Dataset':
         """
-        Load dataset from a text file. Assumed format is:
+        Load dataset from a text file, or its memory-mapped binary columns if it has been converted with
+        convert_predictions.py. Assumed format is:
 
             correct_class score_0 ... score_k
 
         """
-        array = np.genfromtxt(fname)
-        labels = array[:, 0].astype(np.int)
-        scores = array[:, 1:].astype(np.float)
+        labels, scores = load_scores(fname)
+        labels = labels.astype(np.int64)
+        scores = scores.astype(np.float64, copy=False)
         return cls(labels, scores, superclass_lookup)
 
     @property
@@ -167,20 +184,19 @@ class SuperclassDataset:
         return np.argmax(self.scores, axis=-1)
 
 
-def random_choice_fn(sample: np.ndarray) -> np.ndarray:
-    ids = np.arange(sample.shape[0])
-    np.random.shuffle(ids)
-    return ids
+def random_choice_fn(sample: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return rng.random(sample.shape[0])
 
 
-def max_choice_fn(sample: np.ndarray) -> np.ndarray:
-    return np.argsort(sample)[::-1]
+def max_choice_fn(sample: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return sample
 
 
 def select_and_label(dataset: Dataset,
                      model: Model,
                      topk: int,
-                     choice_fn: Callable) -> Tuple[np.ndarray, np.ndarray]:
+                     choice_fn: Callable,
+                     rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
     """
     Selects data points from dataset according to criterion and updates the model.
 
@@ -191,13 +207,18 @@ def select_and_label(dataset: Dataset,
     model : Model
         Bayesian assessment model.
     choice_fn : Callable
-        Function used to identify the next class to be labeled.
+        Function mapping a posterior sample and rng to a priority for each class. The available classes with the
+        highest priorities are labeled next.
+    rng : np.random.Generator
+        Source of randomness of the labeling order and of choice_fn, see seeding.run_generators.
     """
     # Initialize outputs
 
-    # Shuffle the dataset and enqueue queries
-    dataset.shuffle()
-    queues = dataset.enqueue()
+    # Shuffle a copy of the dataset, so that the run does not depend on the runs before it, and enqueue queries
+    dataset = copy.copy(dataset)
+    dataset.shuffle(rng)
+    pool = dataset.enqueue()
+    observations = dataset.observations
 
     n_samples = len(dataset)
 
@@ -208,15 +229,13 @@ def select_and_label(dataset: Dataset,
     i = 0
     while i < n_samples:
         sample = model.sample()
-        choices = choice_fn(sample)
-
-        candidates = [choice for choice in choices if len(queues[choice]) > 0]
-        if len(candidates) < topk:
+        if len(pool.candidates) < topk:
             topk = 1
+        candidates = select_topk(choice_fn(sample, rng), topk, 'max', mask=pool.nonempty, sort=True)
 
         for idx in range(topk):
             choice = candidates[idx]
-            observation = queues[choice].pop()
+            observation = observations[pool.pop(choice)]
             model.update(choice, observation)
 
             i += 1
@@ -231,6 +250,84 @@ def select_and_label(dataset: Dataset,
     return mpe, confusion_log
 
 
+def run_simulation(dataset: Dataset,
+                   alphas: np.ndarray,
+                   costs: np.ndarray,
+                   topk: int,
+                   choice_fn: Callable,
+                   random_seed) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Label the dataset once with a new DirichletMultinomialCost model, see select_and_label.
+
+    Parameters
+    ==========
+    alphas : np.ndarray
+        Prior of the model, see DirichletMultinomialCost.
+    costs : np.ndarray
+        The cost matrix.
+    random_seed : int or sequence of ints
+        Seed of the run, see seeding.run_generators. The run only depends on its seed, not on the process it runs in.
+    """
+    pool_rng, sample_rng = run_generators(random_seed)
+    model = DirichletMultinomialCost(alphas, costs, rng=sample_rng)
+    return select_and_label(dataset=dataset, model=model, topk=topk, choice_fn=choice_fn, rng=pool_rng)
+
+
+# labeling strategies of the experiment: the prior their model starts from and how they choose the classes to label
+STRATEGIES = {
+    'random_no_prior': ('no_prior', random_choice_fn),
+    'random_uniform': ('uniform', random_choice_fn),
+    'random_informed': ('informed', random_choice_fn),
+    'active_uniform': ('uniform', max_choice_fn),
+    'active_informed': ('informed', max_choice_fn),
+}
+
+
+def simulate_strategy(data: SharedArrays,
+                      superclass: bool,
+                      alphas: Dict[str, np.ndarray],
+                      costs: np.ndarray,
+                      topk: int,
+                      seed: int,
+                      results: Dict[str, SharedResultBuffer],
+                      task: Tuple[int, str]) -> np.ndarray:
+    """
+    Task of RunExecutor: one run of one labeling strategy, see run_simulation. Writes the MPE of the run to its row of
+    the results of the strategy.
+
+    Parameters
+    ==========
+    data : SharedArrays
+        Labels and scores of the dataset.
+    superclass : bool
+        Whether the dataset is a SuperclassDataset.
+    alphas : Dict[str, np.ndarray]
+        Priors of the model by name, see STRATEGIES.
+    seed : int
+        Seed of the experiment, the run is seeded with (seed, run index).
+    results : Dict[str, SharedResultBuffer]
+        (N_SIMULATIONS, len(dataset) // LOG_FREQ, num_classes) buffers of each strategy.
+    task : Tuple[int, str]
+        Run index and name of the strategy.
+
+    Returns
+    =======
+    The confusion log of the last run, only the last run is kept. None for the other runs.
+    """
+    run_idx, name = task
+    if superclass:
+        dataset = SuperclassDataset(data['labels'], data['scores'], CIFAR100_SUPERCLASS_LOOKUP)
+    else:
+        dataset = Dataset(data['labels'], data['scores'])
+    prior, choice_fn = STRATEGIES[name]
+    # every run draws from its own streams, seeded by the experiment seed and the run index, to ensure
+    # reproducibility of experiments
+    results[name][run_idx], confusion_log = run_simulation(dataset, alphas[prior], costs, topk, choice_fn,
+                                                           (seed, run_idx))
+    if run_idx == N_SIMULATIONS - 1:
+        return confusion_log
+
+
 def pretty_print(arr):
     for row in arr:
         out = ' '.join('%0.4f' % x for x in row.tolist())
@@ -255,7 +352,7 @@ def eval(results: np.ndarray, ground_truth: list, topk: int) -> Dict[str, np.nda
 
     for idx in range(num_evals):
         current_result = results[:, idx, :]
-        topk_arms = np.argsort(current_result, axis=-1)[:, -topk:]
+        topk_arms = select_topk(current_result, topk, 'max')
         topk_list = topk_arms.flatten().tolist()
         avg_num_agreement[idx] = len([arm for arm in topk_list if arm in ground_truth]) * 1.0 / (
                 topk * num_runs)
@@ -271,9 +368,6 @@ def eval(results: np.ndarray, ground_truth: list, topk: int) -> Dict[str, np.nda
 # Informative priors...avg predicted confidences by predicted class
 
 def main(args: argparse.Namespace) -> None:
-    # Set random seed to ensure reproducibility of experiments
-    np.random.seed(args.seed)
-
     if not args.output.exists():
         args.output.mkdir()
 
@@ -302,57 +396,56 @@ def main(args: argparse.Namespace) -> None:
 
     # Determine the highest cost predicted classes
     expected_costs = (dataset.confusion_probs * costs).sum(axis=-1)
-    ground_truth = expected_costs.argsort()[-args.topk:][::-1].tolist()
+    ground_truth = select_topk(expected_costs, args.topk, 'max', sort=True).tolist()
 
     cost_string = '\n'.join('%i  %0.4f' % x for x in enumerate(expected_costs))
     logging.info('TopK highest expected cost predicted class: %i', *ground_truth)
     logging.info('Classwise expected costs:\n%s', cost_string)
 
     # Run experiments...
-    # stores MPE of classwise cost after every LOG_FREQ steps for each run...
-    random_no_prior_results = np.zeros((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
-    random_uniform_results = np.zeros((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
-    random_informed_results = np.zeros((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
-    active_uniform_results = np.zeros((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
-    active_informed_results = np.zeros((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
+    # publish the dataset in shared memory once, the worker processes read it without copying
+    shared_data = SharedArrays({'labels': dataset.labels, 'scores': dataset.scores})
+    results = {}
+    try:
+        # stores MPE of classwise cost after every LOG_FREQ steps for each run...
+        results = {name: SharedResultBuffer((N_SIMULATIONS, len(dataset) // LOG_FREQ, dataset.num_classes))
+                   for name in STRATEGIES}
 
-    if args.superclass:
-        # will note enter this branch for now...
-        args.pseudocount = 3
-
-    # Sampling...
-    no_prior_alphas = np.ones((dataset.num_classes, dataset.num_classes)) * 1e-3
-    uniform_prior_alphas = np.ones(
-        (dataset.num_classes, dataset.num_classes)) * args.pseudocount / dataset.num_classes
-    informed_prior_alphas = args.pseudocount * dataset.confusion_prior
-    for i in tqdm(range(N_SIMULATIONS)):
-        model = DirichletMultinomialCost(no_prior_alphas, costs)
-        random_no_prior_results[i], random_no_prior_confusion_log = select_and_label(dataset=dataset,
-                                                                                     model=model,
-                                                                                     topk=args.topk,
-                                                                                     choice_fn=random_choice_fn)
-
-        model = DirichletMultinomialCost(uniform_prior_alphas, costs)
-        random_uniform_results[i], random_uniform_confusion_log = select_and_label(dataset=dataset,
-                                                                                   model=model,
-                                                                                   topk=args.topk,
-                                                                                   choice_fn=random_choice_fn)
-        model = DirichletMultinomialCost(informed_prior_alphas, costs)
-        random_informed_results[i], random_informed_confusion_log = select_and_label(dataset=dataset,
-                                                                                     model=model,
-                                                                                     topk=args.topk,
-                                                                                     choice_fn=random_choice_fn)
-
-        model = DirichletMultinomialCost(uniform_prior_alphas, costs)
-        active_uniform_results[i], active_confusion_log = select_and_label(dataset=dataset,
-                                                                           model=model,
-                                                                           topk=args.topk,
-                                                                           choice_fn=max_choice_fn)
-        model = DirichletMultinomialCost(informed_prior_alphas, costs)
-        active_informed_results[i], active_informed_confusion_log = select_and_label(dataset=dataset,
-                                                                                     model=model,
-                                                                                     topk=args.topk,
-                                                                                     choice_fn=max_choice_fn)
+        if args.superclass:
+            # will note enter this branch for now...
+            args.pseudocount = 3
+
+        # Sampling...
+        alphas = {
+            'no_prior': np.ones((dataset.num_classes, dataset.num_classes)) * 1e-3,
+            'uniform': np.ones((dataset.num_classes, dataset.num_classes)) * args.pseudocount / dataset.num_classes,
+            'informed': args.pseudocount * dataset.confusion_prior,
+        }
+        confusion_logs = {}
+        tasks = [(i, name) for i in range(N_SIMULATIONS) for name in STRATEGIES]
+        simulate = partial(simulate_strategy, shared_data, args.superclass, alphas, costs, args.topk, args.seed,
+                           results)
+        with RunExecutor(args.processes) as executor:
+            for confusion_log, (_, name) in zip(tqdm(executor.imap(simulate, tasks), total=len(tasks)), tasks):
+                if confusion_log is not None:
+                    confusion_logs[name] = confusion_log
+    finally:
+        # free the shared memory also if a task failed, the arrays taken from the buffers stay valid
+        shared_data.unlink()
+        for buffer in results.values():
+            buffer.unlink()
+
+    random_no_prior_results = results['random_no_prior'].array
+    random_uniform_results = results['random_uniform'].array
+    random_informed_results = results['random_informed'].array
+    active_uniform_results = results['active_uniform'].array
+    active_informed_results = results['active_informed'].array
+
+    random_no_prior_confusion_log = confusion_logs['random_no_prior']
+    random_uniform_confusion_log = confusion_logs['random_uniform']
+    random_informed_confusion_log = confusion_logs['random_informed']
+    active_confusion_log = confusion_logs['active_uniform']
+    active_informed_confusion_log = confusion_logs['active_informed']
 
     # Evaluation...
     random_no_prior_success = eval(random_no_prior_results, ground_truth, args.topk)['avg_num_agreement']
@@ -431,6 +524,9 @@ if __name__ == '__main__':
     parser.add_argument('-pseudocount', type=float, default=1, help='pseudocount per row for confusion matrix.')
     parser.add_argument('-k', type=float, default=2, help='relative cost')
     parser.add_argument('--superclass', action='store_true')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Number of worker processes that run the simulations. Default: 4, 1 runs them in this '
+                             'process.')
 
     args, _ = parser.parse_known_args()
     args.output = args.output / args.type_cost
@@ -0,0 +1,45 @@
+"""
+Equal-width binning of prediction scores and per-bin statistics, shared by ECE evaluation and histogram binning.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+def equal_width_bin_ids(scores: np.ndarray, num_bins: int, input_range: Tuple[float, float] = (0., 1.)) -> np.ndarray:
+    """
+    Assign scores to equal-width bins, with the same convention as np.digitize on the inner bin edges: bins are
+    closed on the left, the last bin also contains the upper end of the range, and scores out of range are put into
+    the first or last bin.
+    :param scores: np.ndarray (n, )
+        Prediction scores.
+    :param num_bins: int
+        The number of bins.
+    :param input_range: Tuple[float, float]
+        Range of the scores. Default: (0, 1).
+    :return: An (n, ) array of bin indices in [0, num_bins).
+    """
+    edges = np.linspace(input_range[0], input_range[1], num_bins + 1)
+    return np.searchsorted(edges[1:-1], scores, side='right')
+
+
+def bin_statistics(bin_ids: np.ndarray, confidences: np.ndarray, observations: np.ndarray,
+                   num_bins: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the number of samples, the sum of confidences and the sum of observations in each bin, with one
+    np.bincount pass each instead of a boolean mask per bin.
+    :param bin_ids: np.ndarray (n, )
+        Bin index of each sample, in [0, num_bins).
+    :param confidences: np.ndarray (n, )
+        Prediction scores.
+    :param observations: np.ndarray (n, )
+        Boolean or 0/1 observations, e.g. whether the prediction is correct.
+    :param num_bins: int
+        The number of bins.
+    :return: counts, confidence_sums, accuracy_sums
+        Each an (num_bins, ) array.
+    """
+    counts = np.bincount(bin_ids, minlength=num_bins)
+    confidence_sums = np.bincount(bin_ids, weights=confidences, minlength=num_bins)
+    accuracy_sums = np.bincount(bin_ids, weights=observations, minlength=num_bins)
+    return counts, confidence_sums, accuracy_sums
@@ -0,0 +1,143 @@
+"""
+On-disk cache of data derived from the predictions, such as ground truth, priors and train/holdout splits, so that
+repeated runs on the same dataset skip recomputing them. Entries are keyed by a content hash of the inputs and the
+parameters of the computation, and the least recently used entries are evicted when the cache grows over
+CACHE_SIZE_LIMIT bytes.
+
+The cache is off unless the environment variable BLACKBOX_CACHE_DIR names its directory, e.g.
+BLACKBOX_CACHE_DIR=~/.cache/bayesian-blackbox.
+"""
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+from typing import Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Set BLACKBOX_CACHE_DIR to a directory to enable the cache.
+CACHE_DIR = os.path.expanduser(os.environ.get('BLACKBOX_CACHE_DIR', ''))
+CACHE_SIZE_LIMIT = 2 ** 30
+# Part of every key, increase to invalidate entries when a cached computation changes, e.g. 2: ties and NaN in
+# get_ground_truth and get_bayesian_ground_truth are ranked like a stable argsort.
+CACHE_VERSION = 2
+
+
+def _update_digest(digest, value) -> None:
+    """
+    Add a value to a hash by content: arrays and lists of numbers by their bytes, anything else by its repr.
+    """
+    if isinstance(value, (np.ndarray, list)):
+        array = np.ascontiguousarray(value)
+        if array.dtype != object:
+            digest.update(repr((array.dtype.str, array.shape)).encode())
+            digest.update(array.tobytes())
+            return
+    if isinstance(value, (list, tuple)):
+        digest.update(b'(')
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b')')
+        return
+    digest.update(repr(value).encode())
+
+
+def content_key(name: str, *values) -> str:
+    """
+    :param name: str
+        Name of the computation.
+    :param values:
+        Inputs and parameters of the computation.
+    :return: Hex digest identifying the computation on these values.
+    """
+    digest = hashlib.sha256(('%d:%s' % (CACHE_VERSION, name)).encode())
+    for value in values:
+        _update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def _evict(cache_dir: pathlib.Path) -> None:
+    """
+    Delete the least recently used entries until the cache is at most CACHE_SIZE_LIMIT bytes.
+    """
+    entries = []
+    for path in cache_dir.glob('*.pkl'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # evicted by another process
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= CACHE_SIZE_LIMIT:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def cached(key: str, compute: Callable[[], object]):
+    """
+    Return the cached value of key, or compute, store and return it.
+    :param key: str
+        Key of the value, see content_key.
+    :param compute: Callable
+        Computes the value if it is not cached, the value must be picklable.
+    :return: The value.
+    """
+    if not CACHE_DIR:
+        return compute()
+    cache_dir = pathlib.Path(CACHE_DIR)
+    path = cache_dir / ('%s.pkl' % key)
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        # the modification time records the last use for eviction
+        os.utime(path)
+        return value
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+
+    value = compute()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, so that concurrent runs never read a partially written entry
+    f = tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False)
+    try:
+        with f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+    except BaseException:
+        # do not leave a partially written file behind, e.g. if the value is not picklable
+        try:
+            os.unlink(f.name)
+        except FileNotFoundError:
+            pass
+        raise
+    logger.debug('Cached %s' % path)
+    _evict(cache_dir)
+    return value
+
+
+def disk_cached(func: Callable) -> Callable:
+    """
+    Decorator caching the return value of a deterministic function on disk, keyed by the function name and the content
+    of all its arguments.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        key = content_key('%s.%s' % (func.__module__, func.__qualname__), *arguments.arguments.items())
+        return cached(key, lambda: func(*args, **kwargs))
+
+    return wrapper
@@ -21,10 +21,57 @@ from sklearn.utils._joblib import Parallel
 from sklearn.utils._joblib import delayed
 from sklearn.utils.validation import check_is_fitted
 
+from binning import bin_statistics, equal_width_bin_ids
+
 
 # Ignore binned_statistic FutureWarning
 # warnings.simplefilter(action='ignore', category=FutureWarning)
 
+def _merge_sorted(sorted_probs, sorted_y, probs, y):
+    """
+    Merge new samples into samples that are sorted by score, without sorting the samples seen before again.
+    Parameters
+    ----------
+    sorted_probs : array-like, shape (n_samples, )
+        Scores of the samples seen so far, in increasing order.
+    sorted_y : array-like, shape (n_samples, )
+        Targets of the samples seen so far, aligned with sorted_probs.
+    probs : array-like, shape (n_new_samples, )
+        Scores of the new samples.
+    y : array-like, shape (n_new_samples, )
+        Targets of the new samples.
+    Returns
+    -------
+    sorted_probs, sorted_y : arrays, shape (n_samples + n_new_samples, )
+        Scores and targets of all samples, in increasing order of score.
+    """
+    order = np.argsort(probs, kind='stable')
+    probs = np.asarray(probs, dtype=float)[order]
+    y = np.asarray(y)[order]
+    positions = np.searchsorted(sorted_probs, probs, side='right')
+    return np.insert(sorted_probs, positions, probs), np.insert(sorted_y, positions, y)
+
+
+def _sorted_quantile(sorted_probs, q):
+    """
+    Quantiles of sorted data with linear interpolation, the same as np.quantile but without sorting the data again.
+    Parameters
+    ----------
+    sorted_probs : array-like, shape (n_samples, )
+        Data in increasing order.
+    q : array-like, shape (n_quantiles, )
+        Quantiles to compute, in [0, 1].
+    Returns
+    -------
+    quantiles : array, shape (n_quantiles, )
+    """
+    virtual_index = np.asarray(q) * (len(sorted_probs) - 1)
+    lower = np.floor(virtual_index).astype(int)
+    upper = np.minimum(lower + 1, len(sorted_probs) - 1)
+    fraction = virtual_index - lower
+    return sorted_probs[lower] + fraction * (sorted_probs[upper] - sorted_probs[lower])
+
+
 class CalibrationMethod(sklearn.base.BaseEstimator):
     """
     A generic class for probability calibration
@@ -167,31 +214,73 @@ class TemperatureScaling(CalibrationMethod):
             Returns an instance of self.
         """
 
-        # Define objective function (NLL / cross entropy)
-        def objective(T):
-            # Calibrate with given T
-            P = scipy.special.softmax(X / T, axis=1)
+        self.X_ = np.zeros((0, np.shape(X)[1]))
+        self.logit_max_ = np.zeros((0,))
+        self.logit_min_ = np.zeros((0,))
+        self.n_samples_ = 0
+        self.label_logit_sum_ = 0.
+        self._add_samples(X, y)
+        return self._optimize(self.T_init)
 
-            # Compute negative log-likelihood
-            P_y = P[np.array(np.arange(0, X.shape[0])), y]
-            tiny = np.finfo(np.float).tiny  # to avoid division by 0 warning
-            NLL = - np.sum(np.log(P_y + tiny))
-            return NLL
-
-        # Derivative of the objective with respect to the temperature T
-        def gradient(T):
-            # Exponential terms
-            E = np.exp(X / T)
-
-            # Gradient
-            dT_i = (np.sum(E * (X - X[np.array(np.arange(0, X.shape[0])), y].reshape(-1, 1)), axis=1)) \
-                   / np.sum(E, axis=1)
-            grad = - dT_i.sum() / T ** 2
-            return grad
-
-        # Optimize
-        self.T = scipy.optimize.fmin_bfgs(f=objective, x0=self.T_init,
-                                          fprime=gradient, gtol=1e-06, disp=self.verbose)[0]
+    def partial_fit(self, X, y):
+        """
+        Update the calibration method with new samples. The temperature is optimized on all samples seen so far,
+        starting from the temperature fitted before, which takes few iterations when the new samples are a small part of
+        the calibration set.
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_classes)
+            Training data, i.e. predicted probabilities or logits of the base classifier on the calibration set.
+        y : array-like, shape (n_samples,)
+            Target classes.
+        Returns
+        -------
+        self : object
+            Returns an instance of self.
+        """
+        if not hasattr(self, "T"):
+            return self.fit(X, y)
+        self._add_samples(X, y)
+        return self._optimize(self.T)
+
+    def _add_samples(self, X, y):
+        # Cache the statistics of each sample that do not depend on the temperature. The first n_samples_ rows of the
+        # caches are used, their capacity is doubled when full so that repeated calls copy each sample O(1) times.
+        X = np.asarray(X, dtype=float)
+        start, stop = self.n_samples_, self.n_samples_ + X.shape[0]
+        if stop > self.X_.shape[0]:
+            capacity = max(stop, 2 * self.X_.shape[0])
+            self.X_ = np.concatenate([self.X_[:start], np.empty((capacity - start, self.X_.shape[1]))])
+            self.logit_max_ = np.concatenate([self.logit_max_[:start], np.empty((capacity - start,))])
+            self.logit_min_ = np.concatenate([self.logit_min_[:start], np.empty((capacity - start,))])
+        self.X_[start:stop] = X
+        self.logit_max_[start:stop] = X.max(axis=1)
+        self.logit_min_[start:stop] = X.min(axis=1)
+        self.n_samples_ = stop
+        self.label_logit_sum_ += X[np.arange(X.shape[0]), y].sum()
+
+    def _objective_and_gradient(self, T):
+        """
+        Negative log-likelihood of the cached samples for temperature T and its derivative with respect to T, computed
+        with a single exponentiation of the scaled logits.
+        """
+        T = T[0]
+        X = self.X_[:self.n_samples_]
+        # Shift by the largest scaled logit of each sample for a stable log-sum-exp
+        shift = (self.logit_max_ if T > 0 else self.logit_min_)[:self.n_samples_]
+        E = np.exp((X - shift[:, np.newaxis]) / T)
+        normalizer = E.sum(axis=1)
+        log_sum_exp = shift / T + np.log(normalizer)
+        NLL = log_sum_exp.sum() - self.label_logit_sum_ / T
+
+        # Expected logit of each sample under the scaled softmax
+        expected_logit = np.einsum('ij,ij->i', E, X) / normalizer
+        grad = - (expected_logit.sum() - self.label_logit_sum_) / T ** 2
+        return NLL, np.array([grad])
+
+    def _optimize(self, T_init):
+        self.T = scipy.optimize.minimize(self._objective_and_gradient, x0=np.array([T_init]), jac=True,
+                                         method='BFGS', options={'gtol': 1e-06, 'disp': self.verbose}).x[0]
 
         # Check for T > 0
         if self.T <= 0:
@@ -266,6 +355,9 @@ class PlattScaling(CalibrationMethod):
         If `RandomState` instance, `random_state` is the random number generator;
         If `None`, the random number generator is the RandomState instance used
         by `np.random`.
+    warm_start : bool, default=False
+        Whether to start the logistic regression from the solution of the previous call to fit. Speeds up repeated
+        fits on growing calibration sets.
     References
     ----------
     .. [1] Platt, J. C. Probabilistic Outputs for Support Vector Machines and Comparisons to Regularized Likelihood
@@ -274,10 +366,11 @@ class PlattScaling(CalibrationMethod):
            Machine learning 68, 267–276 (2007)
     """
 
-    def __init__(self, regularization=10 ** -12, random_state=None):
+    def __init__(self, regularization=10 ** -12, random_state=None, warm_start=False):
         super().__init__()
         self.regularization = regularization
         self.random_state = sklearn.utils.check_random_state(random_state)
+        self.warm_start = warm_start
 
     def fit(self, X, y, n_jobs=None):
         """
@@ -300,12 +393,15 @@ class PlattScaling(CalibrationMethod):
         if X.ndim == 1:
             raise ValueError("Calibration training data must have shape (n_samples, n_classes).")
         elif np.shape(X)[1] == 2:
-            self.logistic_regressor_ = sklearn.linear_model.LogisticRegression(C=1 / self.regularization,
-                                                                               solver='lbfgs',
-                                                                               random_state=self.random_state)
+            if not (self.warm_start and hasattr(self, "logistic_regressor_")):
+                self.logistic_regressor_ = sklearn.linear_model.LogisticRegression(C=1 / self.regularization,
+                                                                                   solver='lbfgs',
+                                                                                   random_state=self.random_state,
+                                                                                   warm_start=self.warm_start)
             self.logistic_regressor_.fit(X[:, 1].reshape(-1, 1), y)
         elif np.shape(X)[1] > 2:
-            self.onevsrest_calibrator_ = OneVsRestCalibrator(calibrator=clone(self), n_jobs=n_jobs)
+            if not (self.warm_start and hasattr(self, "onevsrest_calibrator_")):
+                self.onevsrest_calibrator_ = OneVsRestCalibrator(calibrator=clone(self), n_jobs=n_jobs)
             self.onevsrest_calibrator_.fit(X, y)
 
         return self
@@ -387,6 +483,33 @@ class IsotonicRegression(CalibrationMethod):
             self.onevsrest_calibrator_.fit(X, y)
         return self
 
+    def partial_fit(self, X, y):
+        """
+        Update the calibration method with new samples. The samples seen so far are kept sorted by score, new samples
+        are merged in and the isotonic fit is recomputed on the merged data, since pool adjacent violators has no
+        cheaper exact update. Only binary calibration data is supported.
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, 2)
+            Training data, i.e. predicted probabilities of the base classifier on the calibration set.
+        y : array-like, shape (n_samples,)
+            Target classes.
+        Returns
+        -------
+        self : object
+            Returns an instance of self.
+        """
+        if X.ndim == 1 or np.shape(X)[1] != 2:
+            raise ValueError("Incremental calibration training data must have shape (n_samples, 2).")
+        if not hasattr(self, "sorted_probs_"):
+            self.sorted_probs_ = np.zeros((0,))
+            self.sorted_y_ = np.zeros((0,))
+        self.sorted_probs_, self.sorted_y_ = _merge_sorted(self.sorted_probs_, self.sorted_y_, X[:, 1], y)
+        self.isotonic_regressor_ = sklearn.isotonic.IsotonicRegression(increasing=True,
+                                                                       out_of_bounds=self.out_of_bounds)
+        self.isotonic_regressor_.fit(self.sorted_probs_, self.sorted_y_)
+        return self
+
     def predict_proba(self, X):
         """
         Compute calibrated posterior probabilities for a given array of posterior probabilities from an arbitrary
@@ -469,11 +592,10 @@ class HistogramBinning(CalibrationMethod):
 
     def _fit_binary(self, X, y):
         if self.mode == 'equal_width':
-            # Compute probability of class 1 in each equal width bin
-            binned_stat = scipy.stats.binned_statistic(x=X[:, 1], values=np.equal(1, y), statistic='mean',
-                                                       bins=self.n_bins, range=self.input_range)
-            self.prob_class_1 = binned_stat.statistic  # TODO: test this and correct attributes
-            self.binning = binned_stat.bin_edges
+            # Compute probability of class 1 in each equal width bin from running counts
+            self.bin_counts_ = np.zeros((self.n_bins,))
+            self.bin_positives_ = np.zeros((self.n_bins,))
+            self.partial_fit(X, y)
         elif self.mode == 'equal_freq':
             # Find binning based on equal frequency
             self.binning = np.quantile(X[:, 1],
@@ -482,10 +604,50 @@ class HistogramBinning(CalibrationMethod):
             # Compute probability of class 1 in equal frequency bins
             digitized = np.digitize(X[:, 1], bins=self.binning)
             digitized[digitized == len(self.binning)] = len(self.binning) - 1  # include rightmost edge in partition
-            self.prob_class_1 = [y[digitized == i].mean() for i in range(1, len(self.binning))]
+            counts, _, positives = bin_statistics(digitized, X[:, 1], y, len(self.binning))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.prob_class_1 = positives[1:] / counts[1:]
 
         return self
 
+    def partial_fit(self, X, y):
+        """
+        Update the calibration method with new samples by adding them to running per-bin counts, without revisiting
+        samples seen before. Only binary calibration data and mode 'equal_width' are supported, equal frequency bins
+        depend on all samples.
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, 2)
+            Training data, i.e. predicted probabilities of the base classifier on the calibration set.
+        y : array-like, shape (n_samples,)
+            Target classes.
+        Returns
+        -------
+        self : object
+            Returns an instance of self.
+        """
+        if X.ndim == 1 or np.shape(X)[1] != 2:
+            raise ValueError("Incremental calibration training data must have shape (n_samples, 2).")
+        if self.mode != 'equal_width':
+            raise ValueError("Incremental calibration is only implemented for mode 'equal_width'.")
+        if not hasattr(self, "bin_counts_"):
+            self.bin_counts_ = np.zeros((self.n_bins,))
+            self.bin_positives_ = np.zeros((self.n_bins,))
+        self.binning = np.linspace(self.input_range[0], self.input_range[1], self.n_bins + 1)
+
+        # Find bin of new samples, same convention as scipy.stats.binned_statistic: samples out of range are ignored
+        in_range = (X[:, 1] >= self.input_range[0]) & (X[:, 1] <= self.input_range[1])
+        probs = X[in_range, 1]
+        counts, _, positives = bin_statistics(equal_width_bin_ids(probs, self.n_bins, self.input_range), probs,
+                                              np.equal(1, y)[in_range], self.n_bins)
+        self.bin_counts_ += counts
+        self.bin_positives_ += positives
+
+        # Probability of class 1 in each bin, NaN for empty bins
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.prob_class_1 = self.bin_positives_ / self.bin_counts_
+        return self
+
     def predict_proba(self, X):
         """
         Compute calibrated posterior probabilities for a given array of posterior probabilities from an arbitrary
@@ -507,7 +669,7 @@ class HistogramBinning(CalibrationMethod):
             digitized = np.digitize(X[:, 1], bins=self.binning)
             digitized[digitized == len(self.binning)] = len(self.binning) - 1  # include rightmost edge in partition
             # Transform to empirical frequency of class 1 in each bin
-            p1 = np.array([self.prob_class_1[j] for j in (digitized - 1)])
+            p1 = np.asarray(self.prob_class_1)[digitized - 1]
             # If empirical frequency is NaN, do not change prediction
             p1 = np.where(np.isfinite(p1), p1, X[:, 1])
             assert np.all(np.isfinite(p1)), "Predictions are not all finite."
@@ -562,20 +724,66 @@ class BayesianBinningQuantiles(CalibrationMethod):
         log_score : float
             Log of Bayesian score for a given binning model
         """
-        # Setup
-        B = len(partition) - 1
-        p = (partition[1:] - partition[:-1]) / 2 + partition[:-1]
-
         # Compute positive and negative samples in given bins
         N = np.histogram(probs, bins=partition)[0]
 
         digitized = np.digitize(probs, bins=partition)
         digitized[digitized == len(partition)] = len(partition) - 1  # include rightmost edge in partition
-        m = [y[digitized == i].sum() for i in range(1, len(partition))]
+        m = np.array([y[digitized == i].sum() for i in range(1, len(partition))])
+
+        return self._binning_model_logscore_from_counts(N, m, partition, N_prime=N_prime)
+
+    def _binning_model_logscore_from_counts(self, N, m, partition, N_prime=2):
+        """
+        Compute the log score of a binning model from the number of samples and positive samples in each bin.
+        Parameters
+        ----------
+        N : array-like, shape (n_bins, )
+            Number of samples in each bin.
+        m : array-like, shape (n_bins, )
+            Number of positive samples in each bin.
+        partition : array-like, shape (n_bins + 1, )
+            Interval partition defining a binning.
+        N_prime : int, default=2
+            Equivalent sample size expressing the strength of the belief in the prior distribution.
+        Returns
+        -------
+        log_score : float
+            Log of Bayesian score for a given binning model
+        """
+        partition = np.asarray(partition, dtype=float)
+        return self._binning_model_logscores(np.asarray(N)[np.newaxis], np.asarray(m)[np.newaxis],
+                                             partition[np.newaxis], np.array([len(partition) - 1]), N_prime=N_prime)[0]
+
+    def _binning_model_logscores(self, N, m, partitions, n_bins, N_prime=2):
+        """
+        Compute the log scores of several binning models at once. Binning models with fewer bins than the largest one
+        are padded with empty bins at the end, which do not contribute to the score.
+        Parameters
+        ----------
+        N : array-like, shape (n_binnings, max_bins)
+            Number of samples in each bin.
+        m : array-like, shape (n_binnings, max_bins)
+            Number of positive samples in each bin.
+        partitions : array-like, shape (n_binnings, max_bins + 1)
+            Interval partitions defining the binnings.
+        n_bins : array-like, shape (n_binnings, )
+            Number of bins of each binning.
+        N_prime : int, default=2
+            Equivalent sample size expressing the strength of the belief in the prior distribution.
+        Returns
+        -------
+        log_scores : array, shape (n_binnings, )
+            Log of Bayesian score for each binning model
+        """
+        # Setup
+        B = n_bins[:, np.newaxis]
+        p = (partitions[:, 1:] - partitions[:, :-1]) / 2 + partitions[:, :-1]
         n = N - m
+        valid = np.arange(N.shape[1]) < B
 
         # Compute the parameters of the Beta priors
-        tiny = np.finfo(np.float).tiny  # Avoid scipy.special.gammaln(0), which can arise if bin has zero width
+        tiny = np.finfo(float).tiny  # Avoid scipy.special.gammaln(0), which can arise if bin has zero width
         alpha = N_prime / B * p
         alpha[alpha == 0] = tiny
         beta = N_prime / B * (1 - p)
@@ -584,13 +792,14 @@ class BayesianBinningQuantiles(CalibrationMethod):
         # Prior for a given binning model (uniform)
         log_prior = - np.log(self.T)
 
-        # Compute the marginal log-likelihood for the given binning model
-        log_likelihood = np.sum(
+        # Compute the marginal log-likelihood for the given binning models
+        log_likelihood = np.sum(np.where(
+            valid,
             scipy.special.gammaln(N_prime / B) + scipy.special.gammaln(m + alpha) + scipy.special.gammaln(n + beta) - (
                     scipy.special.gammaln(N + N_prime / B) + scipy.special.gammaln(alpha) + scipy.special.gammaln(
-                beta)))
+                beta)), 0), axis=1)
 
-        # Compute score for the given binning model
+        # Compute score for the given binning models
         log_score = log_prior + log_likelihood
         return log_score
 
@@ -619,51 +828,89 @@ class BayesianBinningQuantiles(CalibrationMethod):
             self.log_scores = []
             self.prob_class_1 = []
             self.T = 0
+            self.sorted_probs_ = np.zeros((0,))
+            self.sorted_y_ = np.zeros((0,))
             return self._fit_binary(X, y)
         elif np.shape(X)[1] > 2:
             self.onevsrest_calibrator_ = OneVsRestCalibrator(calibrator=clone(self), n_jobs=n_jobs)
             self.onevsrest_calibrator_.fit(X, y)
             return self
 
+    def partial_fit(self, X, y):
+        """
+        Update the calibration method with new samples. The samples seen so far are kept sorted by score with a running
+        count of positives, so that the quantile binnings and the per-bin counts of every binning model are found by
+        binary search instead of sorting and digitizing the whole data again. Only binary calibration data is supported.
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, 2)
+            Training data, i.e. predicted probabilities of the base classifier on the calibration set.
+        y : array-like, shape (n_samples,)
+            Target classes.
+        Returns
+        -------
+        self : object
+            Returns an instance of self.
+        """
+        if X.ndim == 1 or np.shape(X)[1] != 2:
+            raise ValueError("Incremental calibration training data must have shape (n_samples, 2).")
+        if not hasattr(self, "sorted_probs_"):
+            self.sorted_probs_ = np.zeros((0,))
+            self.sorted_y_ = np.zeros((0,))
+        return self._fit_binary(X, y)
+
     def _fit_binary(self, X, y):
+        self.sorted_probs_, self.sorted_y_ = _merge_sorted(self.sorted_probs_, self.sorted_y_, X[:, 1], y)
+        probs = self.sorted_probs_
+        # positives[i] is the number of positive samples among the i lowest scores
+        positives = np.concatenate([[0], np.cumsum(self.sorted_y_)])
+
         # Determine number of bins
-        N = len(y)
+        N = len(probs)
         min_bins = int(max(1, np.floor(N ** (1 / 3) / self.C)))
         max_bins = int(min(np.ceil(N / 5), np.ceil(self.C * N ** (1 / 3))))
         self.T = max_bins - min_bins + 1
 
-        # Define (equal frequency) binning models and compute scores
-        self.binnings = []
-        self.log_scores = []
-        self.prob_class_1 = []
-        for i, n_bins in enumerate(range(min_bins, max_bins + 1)):
-            # Compute binning from data and set outer edges to range
-            binning_tmp = np.quantile(X[:, 1], q=np.linspace(self.input_range[0], self.input_range[1], n_bins + 1))
-            binning_tmp[0] = self.input_range[0]
-            binning_tmp[-1] = self.input_range[1]
-            # Enforce monotonicity of binning (np.quantile does not guarantee monotonicity)
-            self.binnings.append(np.maximum.accumulate(binning_tmp))
-            # Compute score
-            self.log_scores.append(self._binning_model_logscore(probs=X[:, 1], y=y, partition=self.binnings[i]))
-
-            # Compute empirical accuracy for all bins
-            digitized = np.digitize(X[:, 1], bins=self.binnings[i])
-            # include rightmost edge in partition
-            digitized[digitized == len(self.binnings[i])] = len(self.binnings[i]) - 1
-
-            def empty_safe_bin_mean(a, empty_value):
-                """
-                Assign the bin mean to an empty bin. Corresponds to prior assumption of the underlying classifier
-                being calibrated.
-                """
-                if a.size == 0:
-                    return empty_value
-                else:
-                    return a.mean()
-
-            self.prob_class_1.append(
-                [empty_safe_bin_mean(y[digitized == k], empty_value=(self.binnings[i][k] + self.binnings[i][k - 1]) / 2)
-                 for k in range(1, len(self.binnings[i]))])
+        # Define (equal frequency) binning models, padded to max_bins bins by repeating the last edge
+        n_bins = np.arange(min_bins, max_bins + 1)
+        edge_ids = np.arange(max_bins + 1)
+        valid_edges = edge_ids <= n_bins[:, np.newaxis]
+        q = np.where(valid_edges, edge_ids * ((self.input_range[1] - self.input_range[0]) / n_bins[:, np.newaxis]) +
+                     self.input_range[0], self.input_range[1])
+        # Compute binnings from data and set outer edges to range
+        binnings = _sorted_quantile(probs, q=q.ravel()).reshape(q.shape)
+        binnings[:, 0] = self.input_range[0]
+        binnings[~valid_edges | (edge_ids == n_bins[:, np.newaxis])] = self.input_range[1]
+        # Enforce monotonicity of binning (np.quantile does not guarantee monotonicity)
+        binnings = np.maximum.accumulate(binnings, axis=1)
+
+        # Sample index range of each bin, include rightmost edge in partition
+        bounds = np.where(valid_edges & (edge_ids < n_bins[:, np.newaxis]),
+                          np.searchsorted(probs, binnings, side='left'), np.searchsorted(probs, binnings, side='right'))
+        bin_counts = np.diff(bounds, axis=1)
+        bin_positives = np.diff(positives[bounds], axis=1)
+
+        # Compute scores
+        self.log_scores = self._binning_model_logscores(bin_counts, bin_positives, binnings, n_bins)
+
+        # Compute empirical accuracy for all bins. Assign the bin mean to an empty bin, which corresponds to prior
+        # assumption of the underlying classifier being calibrated.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.prob_class_1_table_ = np.where(bin_counts > 0, bin_positives / bin_counts,
+                                                (binnings[:, 1:] + binnings[:, :-1]) / 2)
+        self.n_bins_ = n_bins
+        self.binnings = [binning[:n + 1] for binning, n in zip(binnings, n_bins)]
+        self.prob_class_1 = [prob[:n] for prob, n in zip(self.prob_class_1_table_, n_bins)]
+
+        # Position of every bin edge among the distinct edges of all binnings. edges_below_[i, g] is the number of edges
+        # of binning i that are at most the g-1-th distinct edge, i.e. the bin index of scores between the g-1-th and
+        # g-th distinct edges, which turns finding bins at prediction into a single search.
+        self.edges_ = np.unique(binnings)
+        edge_positions = np.searchsorted(self.edges_, binnings) + 1
+        edges_below = np.zeros((len(n_bins), len(self.edges_) + 1), dtype=np.int64)
+        np.add.at(edges_below, (np.repeat(np.arange(len(n_bins)), max_bins + 1)[valid_edges.ravel()],
+                                edge_positions[valid_edges]), 1)
+        self.edges_below_ = np.cumsum(edges_below, axis=1)
 
         return self
 
@@ -685,16 +932,18 @@ class BayesianBinningQuantiles(CalibrationMethod):
         elif np.shape(X)[1] == 2:
             check_is_fitted(self, ["binnings", "log_scores", "prob_class_1", "T"])
 
-            # Find bin for all binnings and the associated empirical accuracy
-            posterior_prob_binnings = np.zeros(shape=[np.shape(X)[0], len(self.binnings)])
-            for i, binning in enumerate(self.binnings):
-                bin_ids = np.searchsorted(binning, X[:, 1])
-                bin_ids = np.clip(bin_ids, a_min=0, a_max=len(binning) - 1)  # necessary if X is out of range
-                posterior_prob_binnings[:, i] = [self.prob_class_1[i][j] for j in (bin_ids - 1)]
+            # Find bin for all binnings, the number of edges of each binning below the score
+            bin_ids = self.edges_below_[:, np.searchsorted(self.edges_, X[:, 1])]
+            n_bins = self.n_bins_[:, np.newaxis]
+            bin_ids = np.clip(bin_ids, a_min=0, a_max=n_bins)  # necessary if X is out of range
+            # Scores at the lower edge get bin index -1, i.e. the last bin
+            bin_ids = np.where(bin_ids == 0, n_bins, bin_ids) - 1
+            # Associated empirical accuracy, shape (n_binnings, n_samples)
+            posterior_prob_binnings = np.take_along_axis(self.prob_class_1_table_, bin_ids, axis=1)
 
             # Computed score-weighted average
             norm_weights = np.exp(np.array(self.log_scores) - scipy.special.logsumexp(self.log_scores))
-            posterior_prob = np.sum(posterior_prob_binnings * norm_weights, axis=1)
+            posterior_prob = norm_weights @ posterior_prob_binnings
 
             # Compute probability for other class
             return np.column_stack([1 - posterior_prob, posterior_prob])
@@ -748,18 +997,28 @@ class OneVsRestCalibrator(sklearn.base.BaseEstimator):
         # outperform or match a dense label binarizer in all cases and has also
         # resulted in less or equal memory consumption in the fit_ovr function
         # overall.
+        # With a warm started calibrator, refit the calibrators of the previous call to fit, matched by class
+        previous_calibrators = {}
+        if getattr(self.calibrator, "warm_start", False) and hasattr(self, "calibrators_"):
+            previous_calibrators = {cl: calibrator for cl, calibrator in zip(self.classes_, self.calibrators_)
+                                    if not isinstance(calibrator, _ConstantCalibrator)}
+
         self.label_binarizer_ = LabelBinarizer(sparse_output=True)
         Y = self.label_binarizer_.fit_transform(y)
         Y = Y.tocsc()
         self.classes_ = self.label_binarizer_.classes_
         columns = (col.toarray().ravel() for col in Y.T)
+        # Probabilities of the combined other classes are the row sums minus the probability of the class
+        row_sums = np.sum(X, axis=1)
         # In cases where individual estimators are very fast to train setting
         # n_jobs > 1 in can results in slower performance due to the overhead
         # of spawning threads.  See joblib issue #112.
         self.calibrators_ = Parallel(n_jobs=self.n_jobs)(
-            delayed(OneVsRestCalibrator._fit_binary)(self.calibrator, X, column, classes=[
-                "not %s" % self.label_binarizer_.classes_[i], self.label_binarizer_.classes_[i]]) for i, column in
-            enumerate(columns))
+            delayed(OneVsRestCalibrator._fit_binary)(
+                previous_calibrators.get(self.classes_[i], self.calibrator), X, column,
+                classes=["not %s" % self.label_binarizer_.classes_[i], self.label_binarizer_.classes_[i]],
+                row_sums=row_sums, warm_start=self.classes_[i] in previous_calibrators)
+            for i, column in enumerate(columns))
         return self
 
     def predict_proba(self, X):
@@ -778,8 +1037,9 @@ class OneVsRestCalibrator(sklearn.base.BaseEstimator):
         check_is_fitted(self, ["classes_", "calibrators_"])
 
         # Y[i, j] gives the probability that sample i has the label j.
+        row_sums = np.sum(X, axis=1)
         Y = np.array([c.predict_proba(
-            np.column_stack([np.sum(np.delete(X, obj=i, axis=1), axis=1), X[:, self.classes_[i]]]))[:, 1] for i, c in
+            np.column_stack([row_sums - X[:, i], X[:, self.classes_[i]]]))[:, 1] for i, c in
                       enumerate(self.calibrators_)]).T
 
         if len(self.calibrators_) == 1:
@@ -805,7 +1065,7 @@ class OneVsRestCalibrator(sklearn.base.BaseEstimator):
         return self.calibrators_[0]
 
     @staticmethod
-    def _fit_binary(calibrator, X, y, classes=None):
+    def _fit_binary(calibrator, X, y, classes=None, row_sums=None, warm_start=False):
         """
         Fit a single binary calibrator.
         Parameters
@@ -814,12 +1074,18 @@ class OneVsRestCalibrator(sklearn.base.BaseEstimator):
         X
         y
         classes
+        row_sums : array-like, shape (n_samples, ), optional
+            Sums of X over all classes, to avoid summing the other classes for every class.
+        warm_start : bool
+            Whether calibrator was fitted before and is refitted in place instead of cloned.
         Returns
         -------
         """
         # Sum probabilities of combined classes in calibration training data X
         cl = classes[1]
-        X = np.column_stack([np.sum(np.delete(X, cl, axis=1), axis=1), X[:, cl]])
+        if row_sums is None:
+            row_sums = np.sum(X, axis=1)
+        X = np.column_stack([row_sums - X[:, cl], X[:, cl]])
 
         # Check whether only one label is present in training data
         unique_y = np.unique(y)
@@ -833,7 +1099,8 @@ class OneVsRestCalibrator(sklearn.base.BaseEstimator):
                               str(classes[c]))
             calibrator = _ConstantCalibrator().fit(X, unique_y)
         else:
-            calibrator = clone(calibrator)
+            if not warm_start:
+                calibrator = clone(calibrator)
             calibrator.fit(X, y)
         return calibrator
 
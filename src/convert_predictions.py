@@ -0,0 +1,35 @@
+"""
+Convert the prediction and logit text files of datasets to binary columns, see data_utils.convert_to_binary. Loaders in
+data_utils and active_learning_costs memory-map the converted files instead of parsing the text files on every run.
+"""
+import argparse
+import logging
+
+from data_utils import DATAFILE_LIST, DATASET_LIST, LOGITSFILE_DICT, convert_to_binary
+
+logger = logging.getLogger(__name__)
+
+
+def main(args: argparse.Namespace) -> None:
+    for dataset in args.datasets:
+        if dataset not in DATASET_LIST:
+            raise ValueError("%s is not in DATASET_LIST." % dataset)
+        directory = convert_to_binary(DATAFILE_LIST[dataset], store_scores=not args.no_scores)
+        logger.info(f'{dataset}: {DATAFILE_LIST[dataset]} -> {directory}')
+        # logits are only used as a full matrix
+        if dataset in LOGITSFILE_DICT:
+            directory = convert_to_binary(LOGITSFILE_DICT[dataset], store_scores=True)
+            logger.info(f'{dataset}: {LOGITSFILE_DICT[dataset]} -> {directory}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('datasets', type=str, nargs='*', default=DATASET_LIST, help='datasets to convert')
+    parser.add_argument('--no_scores', action='store_true',
+                        help='Only store labels, predicted classes and confidences of predictions, not the full score '
+                             'matrix. Logits are always stored in full.')
+
+    args, _ = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO)
+
+    main(args)
@@ -1,11 +1,15 @@
 import logging
-import warnings
+import pathlib
 from typing import List, Tuple, Dict
 
 import numpy as np
 import pandas as pd
 
+from binning import bin_statistics, equal_width_bin_ids
+from cache import cached, content_key, disk_cached
+from grouped_stats import classwise_accuracy, classwise_confidence, classwise_ece, grouped_bin_statistics
 from models import BetaBernoulli, ClasswiseEce
+from ranking import select_topk
 
 logger = logging.getLogger(__name__)
 
@@ -134,11 +138,156 @@ CIFAR100_SUPERCLASS_LOOKUP = {class_: superclass for superclass, class_list in
 
 
 ############################################################################
+# Binary columnar copies of the prediction and logit text files, written once with convert_predictions.py and
+# memory-mapped when present. A text file path/name.txt is stored as the directory path/name.columns with one .npy file
+# per column.
+BINARY_SUFFIX = '.columns'
+BINARY_COLUMNS = ['labels', 'categories', 'confidences', 'scores']
+# Number of rows of a text file parsed at once
+PARSE_CHUNK_SIZE = 4096
+# Columns held in memory by preload_columns, by file name. Processes forked afterwards, like the jobs of scheduler.py,
+# share them instead of loading the file again.
+_PRELOADED_COLUMNS = {}
+
+
+def read_predictions_text(filename, store_scores: bool = True,
+                          chunksize: int = PARSE_CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """
+    Parse a text file with rows "correct_class score_0 ... score_k" in chunks of rows with the C parser of pandas,
+    into preallocated columns. Predicted classes and confidences are computed chunk by chunk, so the score matrix is
+    only held in memory if it is stored.
+    :param filename: str or pathlib.Path
+    :param store_scores: bool
+        Whether to return the (n, num_classes) score matrix. Default: True.
+    :param chunksize: int
+        Number of rows parsed at once. Default: PARSE_CHUNK_SIZE.
+    :return: Dict with 'labels', 'categories', 'confidences' and, if store_scores, 'scores', in the same layout as
+        load_binary.
+    """
+    with open(filename, 'rb') as f:
+        num_rows = sum(1 for line in f if line.strip())
+    columns = {
+        'labels': np.empty((num_rows,), dtype=np.int64),
+        'categories': np.empty((num_rows,), dtype=np.int64),
+        'confidences': np.empty((num_rows,), dtype=float),
+    }
+
+    # round_trip parses floats exactly like np.genfromtxt
+    start = 0
+    for chunk in pd.read_csv(filename, sep=r'\s+', header=None, engine='c', dtype=float,
+                             float_precision='round_trip', chunksize=chunksize):
+        chunk = chunk.to_numpy()
+        end = start + chunk.shape[0]
+        scores = chunk[:, 1:]
+        if store_scores and 'scores' not in columns:
+            columns['scores'] = np.empty((num_rows, scores.shape[1]), dtype=float)
+        columns['labels'][start:end] = chunk[:, 0]
+        columns['categories'][start:end] = np.argmax(scores, axis=1)
+        columns['confidences'][start:end] = np.max(scores, axis=1)
+        if store_scores:
+            columns['scores'][start:end] = scores
+        start = end
+    return columns
+
+
+def binary_path(filename) -> pathlib.Path:
+    """
+    :param filename: str or pathlib.Path
+        Path of a text file with rows "correct_class score_0 ... score_k".
+    :return: Path of the directory holding the binary columns of filename.
+    """
+    return pathlib.Path(filename).with_suffix(BINARY_SUFFIX)
+
+
+def convert_to_binary(filename, store_scores: bool = True) -> pathlib.Path:
+    """
+    Parse a text file with rows "correct_class score_0 ... score_k" once and store its columns as .npy files: true
+    labels, predicted classes, confidences of the predicted classes and, optionally, the full score matrix.
+    :param filename: str or pathlib.Path
+    :param store_scores: bool
+        Whether to store the (n, num_classes) score matrix, needed for logits and active_learning_costs. Default: True.
+    :return: Path of the directory holding the binary columns.
+    """
+    columns = read_predictions_text(filename, store_scores=store_scores)
+
+    directory = binary_path(filename)
+    directory.mkdir(exist_ok=True)
+    for name, column in columns.items():
+        np.save(directory / ('%s.npy' % name), column)
+    return directory
+
+
+def load_binary(filename, mmap_mode: str = 'r') -> Dict[str, np.ndarray]:
+    """
+    Load the binary columns of a text file converted with convert_to_binary.
+    :param filename: str or pathlib.Path
+        Path of the original text file.
+    :param mmap_mode: str or None
+        Passed on to np.load, by default the columns are memory-mapped read only.
+    :return: Dict mapping column names to arrays, empty if the file has not been converted. 'scores' is missing if the
+        score matrix was not stored.
+    """
+    directory = binary_path(filename)
+    columns = dict()
+    for name in BINARY_COLUMNS:
+        path = directory / ('%s.npy' % name)
+        if path.exists():
+            columns[name] = np.load(path, mmap_mode=mmap_mode)
+    return columns
+
+
+def load_columns(filename, store_scores: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Load the columns of a text file with rows "correct_class score_0 ... score_k": the preloaded columns if there are
+    any, else the memory-mapped binary columns if the file has been converted, else the parsed text file.
+    :param filename: str or pathlib.Path
+    :param store_scores: bool
+        Whether the (n, num_classes) score matrix is needed. Default: True.
+    :return: Dict with 'labels', 'categories', 'confidences' and, if store_scores, 'scores', see read_predictions_text.
+    """
+    columns = _PRELOADED_COLUMNS.get(str(filename), {})
+    if 'categories' not in columns or (store_scores and 'scores' not in columns):
+        columns = load_binary(filename)
+    if 'categories' not in columns or (store_scores and 'scores' not in columns):
+        columns = read_predictions_text(filename, store_scores=store_scores)
+    return columns
+
+
+def preload_columns(filename, store_scores: bool = True) -> None:
+    """
+    Load the columns of a text file once, so that load_columns of this process and of the processes forked from it
+    returns them without parsing the file again. Converted files stay memory-mapped.
+    :param filename: str or pathlib.Path
+    :param store_scores: bool
+        Whether to keep the (n, num_classes) score matrix. Default: True.
+    """
+    _PRELOADED_COLUMNS[str(filename)] = load_columns(filename, store_scores=store_scores)
+
+
+def release_columns(filename) -> None:
+    """
+    Drop the columns of a file loaded by preload_columns, processes forked before keep their copy.
+    :param filename: str or pathlib.Path
+    """
+    _PRELOADED_COLUMNS.pop(str(filename), None)
+
+
+def load_scores(filename) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load true labels and the score (or logit) matrix of a text file with rows "correct_class score_0 ... score_k",
+    memory-mapped from its binary columns if the file has been converted.
+    :param filename: str or pathlib.Path
+    :return: labels (n, ) and scores (n, num_classes)
+    """
+    columns = load_columns(filename)
+    return columns['labels'], columns['scores']
+
 
 def prepare_data(filename, four_column=False) -> Tuple[
     List[int], List[bool], List[float], Dict[int, str], Dict[int, int], List[int]]:
     """
-    Load predictions.
+    Load predictions, from the memory-mapped binary columns of filename if it has been converted with
+    convert_predictions.py.
     :param filename: str
     :param four_column: indicates whether the dataformat is "index, correct class, predicted class, confidence"
                         or true label followed by a vector of scores for each class
@@ -172,12 +321,11 @@ def prepare_data(filename, four_column=False) -> Tuple[
                 labels.append(correct)
 
     else:
-        data = np.genfromtxt(filename)
-        categories = np.argmax(data[:, 1:], axis=1).astype(int)
-        confidences = list(np.max(data[:, 1:], axis=1).astype(float))
-        observations = list((categories == data[:, 0]))
-        categories = list(categories)
-        labels = list(data[:, 0])
+        columns = load_columns(filename, store_scores=False)
+        categories = list(columns['categories'])
+        confidences = list(columns['confidences'])
+        observations = list(columns['categories'] == columns['labels'])
+        labels = list(columns['labels'])
         idx2category = None
         category2idx = None
         logger.debug("Dataset Accuracy: %.3f" % (len([_ for _ in observations if _ == True]) * 1.0 / len(observations)))
@@ -190,21 +338,33 @@ def train_holdout_split(categories: List[int],
                         confidences: List[float],
                         labels: List[int],
                         indices: List[int],
-                        holdout_ratio: float = 0.2) -> Tuple[
+                        holdout_ratio: float = 0.2,
+                        random_seed: int = None) -> Tuple[
     List[int], List[bool], List[float], List[int], List[int], List[int], List[bool], List[float], List[int], List[int]]:
     """
-    Split categories, observations and confidences into train and holdout with hold_ratio.
+    Split categories, observations and confidences into train and holdout with hold_ratio. Splits with a random_seed
+    are cached on disk.
     :param categories: List[int], predicted class
     :param observations: List[bool], whether predicted class is the same as truth class
     :param confidences: List[float], list of scores
     :param labels: List[int], true label fo samples.
     :param indices: List[int], index of data in the raw file
     :param holdout_ratio: float between 0 and 1. Default: 0.2.
+    :param random_seed: int or None, seed of the split. Default: None, draw it from the global NumPy random state.
     :return: train and eval partion of inputs.
     """
+    if random_seed is not None:
+        key = content_key('train_holdout_split', categories, observations, confidences, labels, indices, holdout_ratio,
+                          random_seed)
+        return cached(key, lambda: _train_holdout_split(categories, observations, confidences, labels, indices,
+                                                        holdout_ratio, np.random.RandomState(random_seed)))
+    return _train_holdout_split(categories, observations, confidences, labels, indices, holdout_ratio, np.random)
+
+
+def _train_holdout_split(categories, observations, confidences, labels, indices, holdout_ratio, random_state):
     num_samples = len(categories)
 
-    permutation = np.random.permutation(num_samples)
+    permutation = random_state.permutation(num_samples)
     mask = np.zeros(num_samples)
     mask[permutation[:int(len(categories) * holdout_ratio)]] = 1
 
@@ -235,20 +395,17 @@ def eval_ece(confidences: List[float], observations: List[bool], num_bins=10):
         The number of bins used to estimate ECE. Default: 10
     :return: float
     """
-    confidences = np.array(confidences)
+    confidences = np.array(confidences, dtype=float)
     observations = np.array(observations) * 1.0
-    bins = np.linspace(0, 1, num_bins + 1)
-    digitized = np.digitize(confidences, bins[1:-1])
-
-    w = np.array([(digitized == i).sum() for i in range(num_bins)])
-    w = w / sum(w)
-
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        confidence_bins = np.array([confidences[digitized == i].mean() for i in range(num_bins)])
-        accuracy_bins = np.array([observations[digitized == i].mean() for i in range(num_bins)])
-    confidence_bins[np.isnan(confidence_bins)] = 0
-    accuracy_bins[np.isnan(accuracy_bins)] = 0
+    counts, confidence_sums, accuracy_sums = bin_statistics(equal_width_bin_ids(confidences, num_bins),
+                                                            confidences, observations, num_bins)
+
+    w = counts / counts.sum()
+
+    # empty bins have zero confidence and accuracy
+    nonempty = np.maximum(counts, 1)
+    confidence_bins = confidence_sums / nonempty
+    accuracy_bins = accuracy_sums / nonempty
     diff = np.absolute(confidence_bins - accuracy_bins)
     ece = np.inner(diff, w)
     return ece
@@ -265,9 +422,9 @@ def get_confidence_k(categories: List[int], confidences: List[float], num_classe
     :return: confidence_k: (num_classes, )
         Average score of predicted class.
     """
-    df = pd.DataFrame(list(zip(categories, confidences)), columns=['Predicted', 'Confidence'])
-    confidence_k = np.array([df[(df['Predicted'] == id)]['Confidence'].mean()
-                             for id in range(num_classes)])
+    counts, confidence_sums, _ = grouped_bin_statistics(categories, np.zeros(len(categories)), confidences,
+                                                        num_classes)
+    confidence_k = classwise_confidence(counts, confidence_sums)
     return confidence_k
 
 
@@ -282,10 +439,9 @@ def get_accuracy_k(categories: List[int], observations: List[bool], num_classes:
     :return: accuracy_k: (num_classes, )
         Accuracy of each predicted class.
     """
-    observations = np.array(observations) * 1.0
-    df = pd.DataFrame(list(zip(categories, observations)), columns=['Predicted', 'Observations'])
-    accuracy_k = np.array([df[(df['Predicted'] == class_idx)]['Observations'].mean()
-                           for class_idx in range(num_classes)])
+    counts, _, accuracy_sums = grouped_bin_statistics(categories, observations, np.zeros(len(categories)),
+                                                      num_classes)
+    accuracy_k = classwise_accuracy(counts, accuracy_sums)
     return accuracy_k
 
 
@@ -305,17 +461,11 @@ def get_ece_k(categories: List[int], observations: List[bool], confidences: List
     :return: ece_k: (num_classes, )
         ECE of each predicted class.
     """
-    ece_k = np.zeros((num_classes,))
-
-    for class_idx in range(num_classes):
-        mask_idx = [i for i in range(len(observations)) if categories[i] == class_idx]
-        observations_sublist = [observations[i] for i in mask_idx]
-        confidences_sublist = [confidences[i] for i in mask_idx]
-        ece_k[class_idx] = eval_ece(confidences_sublist, observations_sublist, num_bins)
-
+    ece_k = classwise_ece(*grouped_bin_statistics(categories, observations, confidences, num_classes, num_bins))
     return ece_k
 
 
+@disk_cached
 def get_ground_truth(categories: List[int], observations: List[bool], confidences: List[float], num_classes: int,
                      metric: str, mode: str, topk: int = 1) -> np.ndarray:
     """
@@ -341,15 +491,11 @@ def get_ground_truth(categories: List[int], observations: List[bool], confidence
     elif metric == 'calibration_error':
         metric_val = get_ece_k(categories, observations, confidences, num_classes, num_bins=10)
     output = np.zeros((num_classes,), dtype=np.bool_)
-
-    if mode == 'max':
-        indices = metric_val.argsort()[-topk:]
-    else:
-        indices = metric_val.argsort()[:topk]
-    output[indices] = 1
+    output[select_topk(metric_val, topk, mode)] = 1
     return output
 
 
+@disk_cached
 def get_bayesian_ground_truth(categories: List[int], observations: List[bool], confidences: List[float],
                               num_classes: int,
                               metric: str, mode: str, topk: int = 1, pseudocount: int = 1, prior=None) -> np.ndarray:
@@ -378,17 +524,13 @@ def get_bayesian_ground_truth(categories: List[int], observations: List[bool], c
 
     if metric == 'accuracy':
         model = BetaBernoulli(num_classes, prior=prior)
-        model.update_batch(confidences, observations)
+        model.update_batch(categories, observations)
     elif metric == 'calibration_error':
         model = ClasswiseEce(num_classes, num_bins=10, pseudocount=pseudocount)
         model.update_batch(categories, observations, confidences)
     metric_val = model.eval
 
     output = np.zeros((num_classes,), dtype=np.bool_)
-    if mode == 'max':
-        indices = metric_val.argsort()[-topk:]
-    else:
-        indices = metric_val.argsort()[:topk]
-    output[indices] = 1
+    output[select_topk(metric_val, topk, mode)] = 1
 
     return output
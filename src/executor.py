@@ -0,0 +1,86 @@
+"""
+A persistent pool of worker processes that runs the independent simulation runs of all drivers, in the sampling and
+in the evaluation phase. Tasks are dispatched to the workers in chunks and their results are returned in task order.
+An exception raised by a task, or a worker process that dies, is raised in the calling process and the tasks that have
+not started yet are cancelled.
+"""
+import logging
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Default number of chunks per worker process. More chunks balance tasks of different length better, fewer chunks
+# send fewer messages.
+CHUNKS_PER_PROCESS = 4
+
+
+class RunExecutor:
+    """
+    Runs tasks on a pool of worker processes that is kept alive until shutdown, so that the workers are reused by all
+    phases of an experiment. With processes <= 1 the tasks run in the calling process, which is easier to debug.
+    Task functions and their arguments are pickled: use functions defined at module level, or functools.partial of
+    them, and pass large arrays as shared_data.SharedArrays and SharedResultBuffers.
+    """
+
+    def __init__(self, processes: int = 1) -> None:
+        """
+        :param processes: int
+            The number of worker processes. Default: 1, run the tasks in the calling process.
+        """
+        self._processes = max(processes, 1)
+        self._pool = None
+        if self._processes > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self._processes)
+
+    @property
+    def processes(self) -> int:
+        return self._processes
+
+    def imap(self, fn: Callable, tasks: Iterable, chunksize: int = None) -> Iterator:
+        """
+        Run fn on every task.
+        :param fn: Callable
+            Function of one task.
+        :param tasks: Iterable
+            The tasks, e.g. tuples of a run index and a method.
+        :param chunksize: int or None
+            The number of tasks sent to a worker at once. Default: None, about CHUNKS_PER_PROCESS chunks per worker.
+        :return: An iterator over the results in task order. An exception raised by a task is raised when its result
+            is reached, and the tasks that have not started yet are cancelled.
+        """
+        tasks = list(tasks)
+        if self._pool is None:
+            return map(fn, tasks)
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(tasks) / (self._processes * CHUNKS_PER_PROCESS)))
+        logger.debug('Running %d tasks in chunks of %d on %d processes' % (len(tasks), chunksize, self._processes))
+        return self._pool.map(fn, tasks, chunksize=chunksize)
+
+    def map(self, fn: Callable, tasks: Iterable, chunksize: int = None) -> List:
+        """
+        Same as imap, but waits for all tasks and returns a list of their results.
+        """
+        return list(self.imap(fn, tasks, chunksize))
+
+    def shutdown(self, cancel: bool = False) -> None:
+        """
+        Stop the worker processes after their current tasks.
+        :param cancel: bool
+            Whether to cancel the tasks that have not started yet, e.g. after a task failed. Default: False. Before
+            Python 3.9 the tasks cannot be cancelled and all of them run before the workers stop.
+        """
+        if self._pool is not None:
+            if sys.version_info >= (3, 9):
+                self._pool.shutdown(wait=True, cancel_futures=cancel)
+            else:
+                self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self) -> 'RunExecutor':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.shutdown(cancel=exc_type is not None)
@@ -0,0 +1,68 @@
+"""
+Classwise statistics of predictions for all classes in one pass, with a 2D np.bincount over (class, bin) cells.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from binning import bin_statistics, equal_width_bin_ids
+
+
+def grouped_bin_statistics(categories: np.ndarray, observations: np.ndarray, confidences: np.ndarray,
+                           num_classes: int, num_bins: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the number of samples, the sum of confidences and the sum of observations in each equal-width confidence
+    bin of each predicted class.
+    :param categories: np.ndarray (n, )
+        Predicted classes.
+    :param observations: np.ndarray (n, )
+        Boolean observations, whether the predicted class is correct.
+    :param confidences: np.ndarray (n, )
+        Prediction scores.
+    :param num_classes: int
+    :param num_bins: int
+        The number of confidence bins. Default: 1, statistics per class only.
+    :return: counts, confidence_sums, accuracy_sums
+        Each an (num_classes, num_bins) array.
+    """
+    categories = np.asarray(categories, dtype=np.int64)
+    confidences = np.asarray(confidences, dtype=float)
+    observations = np.asarray(observations) * 1.0
+    cells = categories * num_bins + equal_width_bin_ids(confidences, num_bins)
+    statistics = bin_statistics(cells, confidences, observations, num_classes * num_bins)
+    return tuple(statistic.reshape(num_classes, num_bins) for statistic in statistics)
+
+
+def classwise_accuracy(counts: np.ndarray, accuracy_sums: np.ndarray) -> np.ndarray:
+    """
+    :param counts: np.ndarray (num_classes, num_bins)
+    :param accuracy_sums: np.ndarray (num_classes, num_bins)
+    :return: An (num_classes, ) array of accuracies, NaN for classes without samples.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return accuracy_sums.sum(axis=1) / counts.sum(axis=1)
+
+
+def classwise_confidence(counts: np.ndarray, confidence_sums: np.ndarray) -> np.ndarray:
+    """
+    :param counts: np.ndarray (num_classes, num_bins)
+    :param confidence_sums: np.ndarray (num_classes, num_bins)
+    :return: An (num_classes, ) array of average confidences, NaN for classes without samples.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return confidence_sums.sum(axis=1) / counts.sum(axis=1)
+
+
+def classwise_ece(counts: np.ndarray, confidence_sums: np.ndarray, accuracy_sums: np.ndarray) -> np.ndarray:
+    """
+    ECE of each class from its per-bin statistics, the same as data_utils.eval_ece on the samples of each class.
+    :param counts: np.ndarray (num_classes, num_bins)
+    :param confidence_sums: np.ndarray (num_classes, num_bins)
+    :param accuracy_sums: np.ndarray (num_classes, num_bins)
+    :return: An (num_classes, ) array of ECE, NaN for classes without samples.
+    """
+    # empty bins have zero confidence and accuracy
+    nonempty = np.maximum(counts, 1)
+    diff = np.absolute(confidence_sums / nonempty - accuracy_sums / nonempty)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (diff * counts).sum(axis=1) / counts.sum(axis=1)
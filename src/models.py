@@ -6,7 +6,9 @@ import math
 from typing import List, Tuple
 
 import numpy as np
-from scipy.stats import beta
+from scipy.special import betainc, betaincinv
+
+from seeding import require_generator, require_generators
 
 
 class Model:
@@ -39,27 +41,47 @@ class BetaBernoulli(Model):
     Model classwise accuracy with a Beta Bernoulli distribution for each predicted class.
     """
 
-    def __init__(self, k: int, prior=None):
+    def __init__(self, k: int, prior=None, rng: np.random.Generator = None):
         """
         :param k: int
             The number of classes.
         :param prior: np.ndarray (k, 2) or None
             alpha and beta parameters of prior Beta distributions. Default: None.
+        :param rng: np.random.Generator or None
+            Source of randomness of the posterior samples, required to sample. Default: None, the model can only be
+            evaluated.
         """
         self._k = k
+        self._rng = rng
         self._prior = prior
         if prior is None:
             self._prior = np.ones((k, 2)) * 0.5
 
         self._params = copy.deepcopy(self._prior)
 
+        # posterior moments are cached and refreshed only for the classes touched by an update
+        self._mean = np.empty(k)
+        self._variance = np.empty(k)
+        self._update_moments(slice(None))
+
+    def _update_moments(self, categories) -> None:
+        """
+        Recompute the closed-form posterior mean and variance of the given classes.
+        :param categories: int, slice or np.ndarray
+            Indices of the classes whose parameters changed.
+        """
+        alpha, beta = self._params[categories, 0], self._params[categories, 1]
+        total = alpha + beta
+        self._mean[categories] = alpha / total
+        self._variance[categories] = alpha * beta / (total ** 2 * (total + 1))
+
     @property
     def eval(self) -> np.ndarray:
         """
         MPE of posterior classwise accuracy.
-        :return: An (k, ) array of MPE of posteriors of classwise accuracies.
+        :return: An (k, ) array of MPE of posteriors of classwise accuracies, a copy of the cached moments.
         """
-        return self._params[:, 0] / (self._params[:, 0] + self._params[:, 1])
+        return self._mean.copy()
 
     @property
     def frequentist_eval(self) -> np.ndarray:
@@ -74,9 +96,32 @@ class BetaBernoulli(Model):
     def variance(self) -> np.ndarray:
         """
         Variance of posterior classwise accuracy.
-        :return: An (k, ) array of variance of posteriors of classwise accuracies.
+        :return: An (k, ) array of variance of posteriors of classwise accuracies, a copy of the cached moments.
         """
-        return beta.var(self._params[:, 0], self._params[:, 1])
+        return self._variance.copy()
+
+    def credible_interval(self, level: float = 0.95) -> np.ndarray:
+        """
+        Equal-tailed credible interval of posterior classwise accuracy.
+        :param level: float
+            Probability mass covered by the interval. Default: 0.95.
+        :return: An (k, 2) array of lower and upper bounds of the credible intervals.
+        """
+        tail = (1 - level) / 2
+        return self.quantile(np.array([tail, 1 - tail]))
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        Quantiles of posterior classwise accuracy.
+        :param q: float or np.ndarray (m, )
+            Probabilities at which to evaluate the inverse CDF of every posterior.
+        :return: An (k, ) array if q is a float, otherwise an (k, m) array of quantiles.
+        """
+        q = np.asarray(q, dtype=float)
+        alpha, beta = self._params[:, 0], self._params[:, 1]
+        if q.ndim == 0:
+            return betaincinv(alpha, beta, q)
+        return betaincinv(alpha[:, np.newaxis], beta[:, np.newaxis], q[np.newaxis, :])
 
     def get_params(self) -> np.ndarray:
         """
@@ -92,7 +137,7 @@ class BetaBernoulli(Model):
             Number of times to sample from posterior. Default: 1.
         :return: An (k, num_samples) array of samples of theta. If num_samples == 1 then last dimension is squeezed.
         """
-        theta = np.random.beta(self._params[:, 0], self._params[:, 1], size=(num_samples, self._k))
+        theta = require_generator(self._rng).beta(self._params[:, 0], self._params[:, 1], size=(num_samples, self._k))
         return np.array(theta).T.squeeze()
 
     def update(self, category: int, observation: bool) -> None:
@@ -107,6 +152,7 @@ class BetaBernoulli(Model):
             self._params[category, 0] += 1
         else:
             self._params[category, 1] += 1
+        self._update_moments(category)
 
     def update_batch(self, categories: List[int], observations: List[bool]) -> None:
         """
@@ -117,11 +163,126 @@ class BetaBernoulli(Model):
             A list of boolean observations, each observation represents whether the predicted class agrees with the
                 true class label.
         """
-        for category, observation in zip(categories, observations):
-            if observation:
-                self._params[category, 0] += 1
-            else:
-                self._params[category, 1] += 1
+        categories = np.asarray(categories, dtype=np.int64)
+        observations = np.asarray(observations, dtype=bool)
+        np.add.at(self._params, (categories, (~observations).astype(np.int64)), 1)
+        self._update_moments(np.unique(categories))
+
+
+class BatchedBetaBernoulli(Model):
+    """
+    A stack of independent BetaBernoulli models, one per simulation run, so that many runs can be advanced in lockstep.
+    """
+
+    def __init__(self, num_runs: int, k: int, prior=None, rngs: List[np.random.Generator] = None):
+        """
+        :param num_runs: int
+            The number of independent runs.
+        :param k: int
+            The number of classes.
+        :param prior: np.ndarray (k, 2) or None
+            alpha and beta parameters of prior Beta distributions, shared by all runs. Default: None.
+        :param rngs: List[np.random.Generator] or None
+            Source of randomness of the posterior samples of each run, required to sample, see
+            seeding.batch_generators. Default: None, the models can only be evaluated.
+        """
+        self._num_runs = num_runs
+        self._rngs = rngs
+        self._k = k
+        if prior is None:
+            prior = np.ones((k, 2)) * 0.5
+        self._prior = prior
+
+        self._params = np.repeat(np.asarray(prior, dtype=float)[np.newaxis], num_runs, axis=0)
+
+    @property
+    def eval(self) -> np.ndarray:
+        """
+        MPE of posterior classwise accuracy.
+        :return: An (num_runs, k) array of MPE of posteriors of classwise accuracies.
+        """
+        return self._params[..., 0] / (self._params[..., 0] + self._params[..., 1])
+
+    @property
+    def variance(self) -> np.ndarray:
+        """
+        Variance of posterior classwise accuracy.
+        :return: An (num_runs, k) array of variance of posteriors of classwise accuracies.
+        """
+        a, b = self._params[..., 0], self._params[..., 1]
+        return a * b / ((a + b) ** 2 * (a + b + 1))
+
+    def get_params(self) -> np.ndarray:
+        """
+        Returns alpha and beta parameters of the Beta posterior distribution of classwise accuracies.
+        :return: An (num_runs, k, 2) array of alpha and beta parameters of posterior Beta distributions.
+        """
+        return self._params
+
+    def sample(self, runs: np.ndarray = None) -> np.ndarray:
+        """
+        Draw one sample theta from the posterior of every run, each from the generator of its run, so that a run
+            draws the same numbers as BetaBernoulli.sample with that generator, whatever batch it is simulated in.
+        This takes one call to the random number generator per run: drawing 10 runs of 100 classes takes about twice
+            as long as a single call for the whole batch would.
+        :param runs: np.ndarray or None
+            Indices of the runs to sample. Default: None, sample all runs.
+        :return: An (num_runs, k) array of samples of theta, or (len(runs), k) if runs is given.
+        """
+        if runs is None:
+            runs = range(self._num_runs)
+        rngs = require_generators(self._rngs, self._num_runs)
+        theta = np.empty((len(runs), self._k))
+        for i, run in enumerate(runs):
+            theta[i] = rngs[run].beta(self._params[run, :, 0], self._params[run, :, 1])
+        return theta
+
+    def update(self, run: int, category: int, observation: bool) -> None:
+        """
+        Updates the posterior of one run.
+        :param run: int
+            The index of the run.
+        :param category: int
+            The index of the predicted class.
+        :param observation: bool
+            Indicator for whether the predicted class agrees with the true class label.
+        """
+        self._params[run, category, 0 if observation else 1] += 1
+
+    def update_batch(self, runs: np.ndarray, categories: np.ndarray, observations: np.ndarray) -> None:
+        """
+        Updates the posteriors of many runs at once.
+        :param runs: np.ndarray
+            Indices of the runs to update.
+        :param categories: np.ndarray
+            Predicted class of the sample observed in each run.
+        :param observations: np.ndarray
+            Boolean observations, whether the predicted class agrees with the true class label.
+        """
+        np.add.at(self._params, (runs, categories, 1 - np.asarray(observations, dtype=int)), 1)
+
+
+def _abs_shifted_beta_moments(alpha: np.ndarray, beta: np.ndarray, shift: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form mean and variance of |theta - shift| with theta ~ Beta(alpha, beta), elementwise.
+        E|theta - c| = mu - c + 2 * (c * I_c(alpha, beta) - mu * I_c(alpha + 1, beta)),
+        Var|theta - c| = Var(theta) + (mu - c) ** 2 - E|theta - c| ** 2,
+        where I_c is the regularized incomplete beta function.
+    :param alpha: np.ndarray
+        Alpha parameters of the Beta distributions.
+    :param beta: np.ndarray
+        Beta parameters of the Beta distributions.
+    :param shift: np.ndarray
+        The shift c of each distribution, in [0, 1].
+    :return: Tuple(np.ndarray, np.ndarray)
+        Mean and variance of the absolute shifted Beta distributions.
+    """
+    total = alpha + beta
+    mu = alpha / total
+    theta_variance = alpha * beta / (total ** 2 * (total + 1))
+    mean = mu - shift + 2 * (shift * betainc(alpha, beta, shift) - mu * betainc(alpha + 1, beta, shift))
+    variance = theta_variance + (mu - shift) ** 2 - mean ** 2
+    return mean, np.maximum(variance, 0)
 
 
 class SumOfBetaEce(Model):
@@ -129,8 +290,10 @@ class SumOfBetaEce(Model):
     accuracy per bin.
     """
 
+    NUM_VARIANCE_SAMPLES = 100
+
     def __init__(self, num_bins: int, weight: np.ndarray = None, pseudocount: int = 3, prior_alpha: np.ndarray = None,
-                 prior_beta: np.ndarray = None):
+                 prior_beta: np.ndarray = None, variance_estimator: str = 'sampling', rng: np.random.Generator = None):
         """
         Init model parameters self._alpha and self._beta, either with pseudocount (put mean of beta on diagonal
         with prior strength pseudocount) or with given prior_alpha and prior_beta.
@@ -139,7 +302,17 @@ class SumOfBetaEce(Model):
         :param weight: np.ndarray (num_bins, ), weight of each bin.
         :param prior_alpha: np.ndarray (num_bins, ), alpha parameter of the Beta distribution for each bin
         :param prior_beta: np.ndarray (num_bins, ), beta parameter of the Beta distribution for each bin
+        :param variance_estimator: 'sampling' or 'analytic', how the posterior variance of ECE is computed.
+            'sampling' keeps a buffer of Monte Carlo samples that is only redrawn for bins updated since the last call,
+            'analytic' uses the closed-form moments of each bin's absolute shifted Beta. Default: 'sampling'.
+        :param rng: np.random.Generator or None, source of randomness of the posterior samples, required to sample and
+            by variance_estimator 'sampling'. Default: None, the model can only be evaluated.
         """
+        if variance_estimator not in ('sampling', 'analytic'):
+            raise ValueError("variance_estimator must be 'sampling' or 'analytic', got %s." % variance_estimator)
+
+        self._rng = rng
+
         # constants
         self._num_bins = num_bins
         self._weight = weight
@@ -160,6 +333,11 @@ class SumOfBetaEce(Model):
         else:
             self._beta = np.copy(prior_beta)
 
+        # Monte Carlo samples of bin-wise accuracy reused by variance, bins are redrawn once their posterior changes
+        self._variance_estimator = variance_estimator
+        self._theta_buffer = np.empty((self.NUM_VARIANCE_SAMPLES, num_bins))
+        self._stale_bins = np.ones((num_bins,), dtype=bool)
+
     @property
     def beta_params_mpe(self) -> np.ndarray:
         """
@@ -207,14 +385,29 @@ class SumOfBetaEce(Model):
     @property
     def variance(self) -> float:
         """
-        Variance of posterior ECE estimated with sampling. Variance of a model is used in Bayesian active learning
-            methods like Bayesian UCB.
+        Variance of posterior ECE. Variance of a model is used in Bayesian active learning methods like Bayesian UCB.
         :return: float
-            Variance of posterior ECE estimated with Monte Carlo samples.
+            Variance of posterior ECE, estimated with Monte Carlo samples or computed analytically depending on
+            variance_estimator.
         """
-        num_samples = 100
-        samples = self.sample(num_samples)
-        return np.var(samples)
+        if self._weight is not None:  # pool weights
+            weight = self._weight
+        else:  # online weights
+            tmp = np.sum(self._counts, axis=1)
+            weight = tmp / sum(tmp)
+
+        if self._variance_estimator == 'analytic':
+            # bins are independent, so the variance of the weighted sum is the weighted sum of variances
+            _, variance = _abs_shifted_beta_moments(self._alpha, self._beta, self._confidence)
+            return np.dot(variance, weight ** 2)
+
+        stale = self._stale_bins
+        if stale.any():
+            rng = require_generator(self._rng)
+            self._theta_buffer[:, stale] = rng.beta(self._alpha[stale], self._beta[stale],
+                                                    size=(self.NUM_VARIANCE_SAMPLES, np.sum(stale)))
+            stale[:] = False
+        return np.var(np.dot(np.abs(self._theta_buffer - self._confidence), weight))
 
     def get_params(self) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -231,8 +424,7 @@ class SumOfBetaEce(Model):
         :return: An (num_samples, ) array of ECE. If n_samples == 1 then last dimension is squeezed.
         """
         # draw samples from each Beta distribution
-        theta = np.random.beta(self._alpha, self._beta,
-                               size=(num_samples, self._num_bins))
+        theta = require_generator(self._rng).beta(self._alpha, self._beta, size=(num_samples, self._num_bins))
         # compute ECE with samples
         if self._weight is not None:  # pool weights
             weight = self._weight
@@ -258,6 +450,7 @@ class SumOfBetaEce(Model):
             self._counts[bin_idx][1] += 1
         self._confidence[bin_idx] = (self._confidence[bin_idx] * (self._counts[bin_idx].sum() - 1) + score) / (
             self._counts[bin_idx].sum())
+        self._stale_bins[bin_idx] = True
 
     def update_batch(self, scores: List[float], observations: List[bool]) -> None:
         """
@@ -267,8 +460,25 @@ class SumOfBetaEce(Model):
         :param observations: List[bool]
             A list of boolean observations, whether predicted labels are the same as true labels.
         """
-        for score, observation in zip(scores, observations):
-            self.update(score, observation)
+        scores = np.asarray(scores, dtype=float)
+        observations = np.asarray(observations, dtype=bool)
+        bin_idx = np.floor(scores * self._num_bins).astype(np.int64)
+        bin_idx[scores == 1] -= 1
+
+        hits = np.bincount(bin_idx[observations], minlength=self._num_bins)
+        misses = np.bincount(bin_idx[~observations], minlength=self._num_bins)
+        score_sums = np.bincount(bin_idx, weights=scores, minlength=self._num_bins)
+
+        previous_counts = self._counts.sum(axis=1)
+        self._alpha += hits
+        self._beta += misses
+        self._counts[:, 0] += hits
+        self._counts[:, 1] += misses
+        # running mean of the scores in each bin, only bins that received samples are touched
+        touched = (hits + misses) > 0
+        self._confidence[touched] = (self._confidence[touched] * previous_counts[touched] + score_sums[touched]) / \
+                                    self._counts[touched].sum(axis=1)
+        self._stale_bins |= touched
 
     def calibration_estimation_error(self, ground_truth_model, weight_type='online') -> float:
         """
@@ -332,10 +542,12 @@ class SumOfBetaEce(Model):
 
 class ClasswiseEce(Model):
     """
-    Model classwise ECE with a SumOfBetaECE for each predicted class.
+    Model classwise ECE with a SumOfBetaECE for each predicted class. The parameters of all classes are stored as
+        (k, num_bins) arrays, so that every query is a single broadcasted NumPy operation over all classes.
     """
 
-    def __init__(self, k: int, num_bins: int, pseudocount: float, weight=None, prior=None) -> None:
+    def __init__(self, k: int, num_bins: int, pseudocount: float, weight=None, prior=None,
+                 variance_estimator: str = 'sampling', rng: np.random.Generator = None) -> None:
         """
         :param k: int
             The number of classes
@@ -344,28 +556,57 @@ class ClasswiseEce(Model):
         :param pseudocount: float
             The strength of priors for accuracy of each bin.
         :param weight: a list of (num_bins, ) arrays of length k
-            Weight of each bin. Default: None.
+            Weight of each bin. Classes whose weight is None use online weights. Default: None.
         :param prior: an (number of classes, k, 2) array
             Alpha and beta parameters in the prior Beta distributions.
+        :param variance_estimator: str
+            'sampling' or 'analytic', how the posterior variance of ECE is computed, see SumOfBetaEce.
+            Default: 'sampling'.
+        :param rng: np.random.Generator or None
+            Source of randomness of the posterior samples, required to sample. Default: None, the model can only be
+            evaluated.
         """
+        if variance_estimator not in ('sampling', 'analytic'):
+            raise ValueError("variance_estimator must be 'sampling' or 'analytic', got %s." % variance_estimator)
+
         self._k = k
+        self._rng = rng
         self._num_bins = num_bins
 
-        if weight is None:
-            weight = [None] * self._k
+        # pool weights of the classes that have them, online weights are computed from counts for the others
+        self._weight = np.zeros((k, num_bins))
+        self._pool_weight = np.zeros((k,), dtype=bool)
+        if weight is not None:
+            for class_idx, class_weight in enumerate(weight):
+                if class_weight is not None:
+                    self._weight[class_idx] = class_weight
+                    self._pool_weight[class_idx] = True
+
+        # parameters to update:
+        self._counts = np.ones((k, num_bins, 2)) * 0.0001
+        self._confidence = np.tile((np.arange(num_bins) + 0.5) / num_bins, (k, 1))
 
         if prior is None:
-            self._classwise_ece_models = [SumOfBetaEce(num_bins,
-                                                       weight=weight[class_idx],
-                                                       pseudocount=pseudocount,
-                                                       prior_alpha=None, prior_beta=None)
-                                          for class_idx in range(k)]
+            # initialize the mode of each Beta distribution on diagonal
+            self._alpha = np.tile((np.arange(num_bins) + 0.5) * pseudocount / num_bins, (k, 1))
+            self._beta = pseudocount - self._alpha
         else:
-            self._classwise_ece_models = [SumOfBetaEce(num_bins,
-                                                       weight=weight[class_idx],
-                                                       prior_alpha=prior[class_idx, :, 0].squeeze(),
-                                                       prior_beta=prior[class_idx, :, 1].squeeze())
-                                          for class_idx in range(k)]
+            self._alpha = np.array(prior[:, :, 0], dtype=float)
+            self._beta = np.array(prior[:, :, 1], dtype=float)
+
+        # Monte Carlo samples of bin-wise accuracy reused by variance, cells are redrawn once their posterior changes
+        self._variance_estimator = variance_estimator
+        self._theta_buffer = np.empty((SumOfBetaEce.NUM_VARIANCE_SAMPLES, k, num_bins))
+        self._stale_bins = np.ones((k, num_bins), dtype=bool)
+
+    def _bin_weight(self) -> np.ndarray:
+        """
+        Weight of each bin, pool weights where given and online weights otherwise.
+        :return: An (k, num_bins) array of weights.
+        """
+        tmp = np.sum(self._counts, axis=2)
+        online_weight = tmp / np.sum(tmp, axis=1, keepdims=True)
+        return np.where(self._pool_weight[:, np.newaxis], self._weight, online_weight)
 
     @property
     def eval(self) -> np.ndarray:
@@ -373,8 +614,8 @@ class ClasswiseEce(Model):
         Evaluate ECE for each class.
         :return: An (k,) array of ECE evaluate for each class.
         """
-        classwise_ece = np.array([self._classwise_ece_models[class_idx].eval for class_idx in range(self._k)])
-        return classwise_ece
+        theta = self._alpha / (self._alpha + self._beta)
+        return np.sum(np.abs(theta - self._confidence) * self._bin_weight(), axis=1)
 
     @property
     def frequentist_eval(self) -> np.ndarray:
@@ -382,23 +623,32 @@ class ClasswiseEce(Model):
         Evaluate ECE for each class, accuracy per bin estiamted with the frequentist's method.
         :return: An (k,) array of ECE evaluate for each class.
         """
-        classwise_ece = np.array(
-            [self._classwise_ece_models[class_idx].frequentist_eval for class_idx in range(self._k)])
-        return classwise_ece
-
-        return classwise_ece_variance
+        tmp = np.sum(self._counts, axis=2)
+        accuracy = self._counts[:, :, 0] / tmp
+        weight = tmp / np.sum(tmp, axis=1, keepdims=True)
+        return np.sum(np.abs(accuracy - self._confidence) * weight, axis=1)
 
     @property
     def variance(self) -> np.ndarray:
         """
-        Variance of posterior ECE for each class.
-        :param num_samples: int
-            The number of samples for Monte Carlo estimation of variance, for each class.
+        Variance of posterior ECE for each class, estimated with Monte Carlo samples or computed analytically depending
+            on variance_estimator.
         :return: An (k,) array of variance evaluate for each class.
         """
-        classwise_ece_variance = np.array(
-            [self._classwise_ece_models[class_idx].variance for class_idx in range(self._k)])
-        return classwise_ece_variance
+        weight = self._bin_weight()
+
+        if self._variance_estimator == 'analytic':
+            _, variance = _abs_shifted_beta_moments(self._alpha, self._beta, self._confidence)
+            return np.sum(variance * weight ** 2, axis=1)
+
+        stale = self._stale_bins
+        if stale.any():
+            rng = require_generator(self._rng)
+            self._theta_buffer[:, stale] = rng.beta(self._alpha[stale], self._beta[stale],
+                                                    size=(SumOfBetaEce.NUM_VARIANCE_SAMPLES, np.sum(stale)))
+            stale[:] = False
+        samples = np.sum(np.abs(self._theta_buffer - self._confidence) * weight, axis=2)
+        return np.var(samples, axis=0)
 
     @property
     def beta_params_mpe(self) -> np.ndarray:
@@ -406,7 +656,20 @@ class ClasswiseEce(Model):
         Computes MPE of accuracy per predicted class per bin. This estimation is used for recalibration.
         :return: (self._k, self._num_bins)
         """
-        return np.array([self._classwise_ece_models[class_idx].beta_params_mpe for class_idx in range(self._k)])
+        return self._alpha / (self._alpha + self._beta)
+
+    def _sample(self, num_samples: int) -> np.ndarray:
+        """
+        Draw sample eces of all classes from the posterior with a single call to the random number generator.
+        :param num_samples: int
+            Number of times to sample from posterior.
+        :return: An (k, num_samples) array of samples of ECE.
+        """
+        # thetas are drawn class by class, in the same order as sampling each class separately
+        theta = require_generator(self._rng).beta(self._alpha[:, np.newaxis, :], self._beta[:, np.newaxis, :],
+                                                  size=(self._k, num_samples, self._num_bins))
+        weight = self._bin_weight()[:, np.newaxis, :]
+        return np.sum(np.abs(theta - self._confidence[:, np.newaxis, :]) * weight, axis=2)
 
     def sample(self, num_samples: int = 1) -> np.ndarray:
         """
@@ -415,9 +678,7 @@ class ClasswiseEce(Model):
             Number of times to sample from posterior. Default: 1.
         :return: An (k, num_samples) array of samples of theta. If num_samples == 1 then last dimension is squeezed.
         """
-        samples = np.array(
-            [self._classwise_ece_models[class_idx].sample(num_samples) for class_idx in range(self._k)]).squeeze()
-        return samples
+        return self._sample(num_samples).squeeze()
 
     def update(self, category: int, observation: bool, score: float) -> None:
         """
@@ -429,7 +690,18 @@ class ClasswiseEce(Model):
         :param score: float
             The confidence of the prediction.
         """
-        self._classwise_ece_models[category].update(score, observation)
+        bin_idx = math.floor(score * self._num_bins)
+        if score == 1:
+            bin_idx -= 1
+        if observation:
+            self._alpha[category, bin_idx] += 1
+            self._counts[category, bin_idx, 0] += 1
+        else:
+            self._beta[category, bin_idx] += 1
+            self._counts[category, bin_idx, 1] += 1
+        total = self._counts[category, bin_idx].sum()
+        self._confidence[category, bin_idx] = (self._confidence[category, bin_idx] * (total - 1) + score) / total
+        self._stale_bins[category, bin_idx] = True
 
     def update_batch(self, categories: List[int], observations: List[bool], scores: List[float]) -> None:
         """
@@ -441,8 +713,29 @@ class ClasswiseEce(Model):
         :param scores: List[float]
             A list of confidences of predictions.
         """
-        for (category, observation, score) in zip(categories, observations, scores):
-            self.update(category, observation, score)
+        categories = np.asarray(categories, dtype=np.int64)
+        observations = np.asarray(observations, dtype=bool)
+        scores = np.asarray(scores, dtype=float)
+        bin_idx = np.floor(scores * self._num_bins).astype(np.int64)
+        bin_idx[scores == 1] -= 1
+
+        # counts over the flattened (class, bin) grid
+        cell = categories * self._num_bins + bin_idx
+        size = self._k * self._num_bins
+        hits = np.bincount(cell[observations], minlength=size).reshape(self._k, self._num_bins)
+        misses = np.bincount(cell[~observations], minlength=size).reshape(self._k, self._num_bins)
+        score_sums = np.bincount(cell, weights=scores, minlength=size).reshape(self._k, self._num_bins)
+
+        previous_counts = self._counts.sum(axis=2)
+        self._alpha += hits
+        self._beta += misses
+        self._counts[:, :, 0] += hits
+        self._counts[:, :, 1] += misses
+        # running mean of the scores in each cell, only cells that received samples are touched
+        touched = (hits + misses) > 0
+        self._confidence[touched] = (self._confidence[touched] * previous_counts[touched] + score_sums[touched]) / \
+                                    self._counts[touched].sum(axis=1)
+        self._stale_bins |= touched
 
 
 class DirichletMultinomialCost(Model):
@@ -456,45 +749,58 @@ class DirichletMultinomialCost(Model):
         An array of shape (n_classes, n_classes) where each row parameterizes a single Dirichlet distribution.
     costs : np.ndarray
         An array of shape (n_classes, n_classes). The cost matrix.
+    rng : np.random.Generator or None
+        Source of randomness of the posterior samples, required to sample. Default: None, the model can only be
+        evaluated.
     """
 
-    def __init__(self, alphas: np.ndarray, costs: np.ndarray) -> None:
+    def __init__(self, alphas: np.ndarray, costs: np.ndarray, rng: np.random.Generator = None) -> None:
         assert alphas.shape == costs.shape
+        self._rng = rng
         self._alphas = np.copy(alphas)
         self._costs = np.copy(costs)
 
+        # Row sums, cost-weighted row sums and the normalized alphas are cached and refreshed per updated row
+        self._row_sums = self._alphas.sum(axis=-1)
+        self._weighted_costs = (self._costs * self._alphas).sum(axis=-1)
+        self._confusion = self._alphas / self._row_sums[:, np.newaxis]
+
     def update(self, predicted_class: int, true_class: int) -> None:
         """Update the posterior of the model."""
         self._alphas[predicted_class, true_class] += 1
+        self._row_sums[predicted_class] += 1
+        self._weighted_costs[predicted_class] += self._costs[predicted_class, true_class]
+        self._confusion[predicted_class] = self._alphas[predicted_class] / self._row_sums[predicted_class]
+
+    def sample_confusion(self, n_samples: int = 1) -> np.ndarray:
+        """
+        Draw confusion probabilities from the posterior, all rows at once as normalized Gamma variates.
+        :param n_samples: int
+            Number of times to sample from posterior. Default: 1.
+        :return: An (n, n) array of confusion probabilities, or (n_samples, n, n) if n_samples > 1.
+        """
+        size = self._alphas.shape if n_samples == 1 else (n_samples, *self._alphas.shape)
+        gamma_draw = require_generator(self._rng).standard_gamma(self._alphas, size=size)
+        return gamma_draw / gamma_draw.sum(axis=-1, keepdims=True)
 
     def sample(self, n_samples: int = 1) -> np.ndarray:
         """
         Draw sample expected costs from the posterior.
         :param n_samples: int
             Number of times to sample from posterior. Default: 1.
-        :return: An (n, n_samples) array of expected costs. If n_samples == 1 then last dimension is squeezed.
+        :return: An (n, ) array of expected costs, or (n_samples, n) if n_samples > 1.
         """
-        # Draw multinomial probabilities (e.g. the confusion probabilities) from posterior
-        if n_samples == 1:
-            posterior_draw = np.zeros_like(self._alphas)
-            for i, alpha in enumerate(self._alphas):
-                posterior_draw[i] = np.random.dirichlet(alpha)
-        else:
-            posterior_draw = np.zeros((n_samples, *self._alphas.shape))
-            for i, alpha in enumerate(self._alphas):
-                posterior_draw[:, i, :] = np.random.dirichlet(alpha, size=(n_samples,))
-
-        # Compute expected costs of each predicted class
-        expected_costs = (np.expand_dims(self._costs, 0) * posterior_draw).sum(axis=-1)
+        posterior_draw = self.sample_confusion(n_samples)
+        # Compute expected costs of each predicted class, one row-wise dot product with the cost matrix
+        expected_costs = np.einsum('...ij,ij->...i', posterior_draw, self._costs)
         return expected_costs.squeeze()
 
     def mpe(self) -> np.ndarray:
         """Mean posterior estimate of expected costs"""
-        z = self._alphas.sum(axis=-1, keepdims=True)
-        expected_probs = self._alphas / z
-        expected_costs = (self._costs * expected_probs).sum(axis=-1)
-        return expected_costs
+        return self._weighted_costs / self._row_sums
 
     def confusion_matrix(self) -> np.ndarray:
-        z = self._alphas.sum(axis=-1, keepdims=True)
-        return self._alphas / z
+        """Mean posterior estimate of the confusion probabilities, as a read-only (n, n) array"""
+        confusion = self._confusion.view()
+        confusion.flags.writeable = False
+        return confusion
@@ -0,0 +1,86 @@
+"""
+Helpers for ranking classes by a metric.
+"""
+import numpy as np
+
+# int64 keys of the float64 values -inf and +inf, see select_topk
+_NEG_INF_KEY = np.int64(-0x7ff0000000000001)
+_POS_INF_KEY = np.int64(0x7ff0000000000000)
+_MASKED_KEY = np.iinfo(np.int64).max
+_NON_SIGN_BITS = np.int64(0x7fffffffffffffff)
+
+
+def select_topk(metric_val: np.ndarray, topk: int, mode: str, mask: np.ndarray = None,
+                sort: bool = False) -> np.ndarray:
+    """
+    Select the topk smallest or largest entries along the last axis with np.argpartition, in O(k) instead of the
+        O(k log k) of a full argsort.
+    The selection is the same as with a stable ascending argsort, np.argsort(metric_val)[:topk] in 'min' mode and
+        np.argsort(metric_val)[-topk:] in 'max' mode:
+        - ties go to the lower index in 'min' mode and to the higher index in 'max' mode.
+        - NaN ranks after all numbers in ascending order, so NaN classes are selected last in 'min' mode and first in
+          'max' mode.
+    :param metric_val: np.ndarray (..., k)
+        Value of each class.
+    :param topk: int
+        The number of classes to select.
+    :param mode: str
+        'min' or 'max', select the classes with the lowest/highest values.
+    :param mask: np.ndarray (..., k) or None
+        Boolean mask of the classes that may be selected. Masked out classes are only returned if fewer than topk
+        classes are available, and then after all available ones. Default: None, all classes are available.
+    :param sort: bool
+        Whether to order the selected classes best first, like np.argsort(metric_val)[::-1] in 'max' mode. Only the
+        topk selected entries are sorted. Default: False.
+    :return: An (..., topk) array of class indices.
+    """
+    metric_val = np.asarray(metric_val, dtype=float)
+    if mode == 'max':
+        # rank the reversed negated values like in 'min' mode, so that ties go to the higher original index
+        values = np.negative(metric_val[..., ::-1])
+        nan_key = _NEG_INF_KEY - 1
+    elif mode == 'min':
+        values = np.array(metric_val)
+        nan_key = _POS_INF_KEY + 1
+    else:
+        raise ValueError("mode must be 'min' or 'max', got %s." % mode)
+    # Map the values to int64 keys with the same order, so that NaN and masked out classes can be placed anywhere in
+    # the order. Adding 0. turns -0. into 0., which argsort considers equal, and the bits of negative values but the
+    # sign bit are flipped.
+    nan = np.isnan(values)
+    values += 0.
+    keys = values.view(np.int64)
+    keys ^= (keys >> 63) & _NON_SIGN_BITS
+    keys[nan] = nan_key
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        keys[~(mask[..., ::-1] if mode == 'max' else mask)] = _MASKED_KEY
+
+    num_classes = keys.shape[-1]
+    topk = min(topk, num_classes)
+    if topk == 1:
+        # argmin returns the first of equal keys
+        selected = np.argmin(keys, axis=-1)[..., np.newaxis]
+    elif topk < num_classes:
+        selected = np.argpartition(keys, topk - 1, axis=-1)[..., :topk]
+        # argpartition breaks ties arbitrarily, in rows where keys equal to the topk-th smallest one were left out,
+        # select all smaller keys and as many of the equal ones as fit, lowest index first
+        selected_keys = np.take_along_axis(keys, selected, axis=-1)
+        kth_key = selected_keys.max(axis=-1, keepdims=True)
+        tied = (keys == kth_key).sum(axis=-1) > (selected_keys == kth_key).sum(axis=-1)
+        if tied.any():
+            tied_keys, kth_key = keys[tied], kth_key[tied]
+            below = tied_keys < kth_key
+            ties = tied_keys == kth_key
+            num_ties = topk - below.sum(axis=-1, keepdims=True)
+            selected[tied] = np.nonzero(below | (ties & (np.cumsum(ties, axis=-1) <= num_ties)))[-1].reshape(-1, topk)
+    else:
+        selected = np.broadcast_to(np.arange(num_classes), keys.shape)
+    if sort and topk > 1:
+        # order by index first, so that the stable sort keeps equal keys lowest index first
+        selected = np.sort(selected, axis=-1)
+        order = np.argsort(np.take_along_axis(keys, selected, axis=-1), axis=-1, kind='stable')
+        selected = np.take_along_axis(selected, order, axis=-1)
+    if mode == 'max':
+        selected = num_classes - 1 - selected
+    return selected
@@ -1,47 +1,190 @@
-import random
-from collections import deque
 from typing import List, Union
 
 import numpy as np
 
-from models import BetaBernoulli
+from models import BetaBernoulli, BatchedBetaBernoulli
+from ranking import select_topk
+from seeding import require_generator, require_generators
 
 
-def random_sampling(deques: List[deque], topk: int = 1, **kwargs) -> Union[int, List[int]]:
+class CandidateMask:
+    """
+    Boolean mask of the arms that can still be played, together with the number of such arms.
+    Arms are only ever removed, so the mask is maintained incrementally instead of being recomputed on every step.
+    """
+
+    def __init__(self, mask: np.ndarray) -> None:
+        """
+        :param mask: np.ndarray (k, )
+            Initial boolean mask of available arms. The array is copied.
+        """
+        self._mask = np.array(mask, dtype=bool)
+        self._count = int(self._mask.sum())
+
+    def __len__(self) -> int:
+        """The number of available arms."""
+        return self._count
+
+    def __contains__(self, category: int) -> bool:
+        return bool(self._mask[category])
+
+    @property
+    def mask(self) -> np.ndarray:
+        """A read-only (k, ) boolean view of the available arms."""
+        view = self._mask.view()
+        view.flags.writeable = False
+        return view
+
+    def remove(self, category: int) -> None:
+        """Mark an arm as no longer available."""
+        if self._mask[category]:
+            self._mask[category] = False
+            self._count -= 1
+
+
+class ClassPool:
+    """
+    Pools of unlabeled samples grouped by predicted class.
+    Sample ids are stored in a CSR-style layout: one array of ids grouped by predicted class and an array of class
+    offsets, so that the ids of class c are ids[offsets[c]:offsets[c + 1]]. Each class has a head pointer into its
+    segment; popping a sample advances the head. The classes that still have samples are tracked in a CandidateMask
+    which is updated when a class runs empty.
+    """
+
+    def __init__(self, categories: Union[List[int], np.ndarray], num_classes: int) -> None:
+        """
+        :param categories: List[int] or np.ndarray
+            Predicted class of each sample. The position of a sample in this list is its sample id.
+        :param num_classes: int
+            The number of classes.
+        """
+        self._categories = np.asarray(categories, dtype=np.int64)
+        self._num_classes = num_classes
+        self._offsets = np.zeros((num_classes + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(self._categories, minlength=num_classes), out=self._offsets[1:])
+        self._ids = np.argsort(self._categories, kind='stable').astype(np.int64)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._heads = self._offsets[:-1].copy()
+        self._candidates = CandidateMask(self._heads < self._offsets[1:])
+
+    def __len__(self) -> int:
+        """The number of samples left in all classes."""
+        return int((self._offsets[1:] - self._heads).sum())
+
+    @property
+    def num_classes(self) -> int:
+        return self._num_classes
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """An (num_classes + 1, ) array of class offsets into the grouped sample ids."""
+        return self._offsets
+
+    @property
+    def candidates(self) -> CandidateMask:
+        """The classes that have samples left."""
+        return self._candidates
+
+    @property
+    def nonempty(self) -> np.ndarray:
+        """An (num_classes, ) boolean mask of classes that have samples left."""
+        return self._candidates.mask
+
+    def is_empty(self, category: int) -> bool:
+        return category not in self._candidates
+
+    def pop(self, category: int) -> int:
+        """
+        Remove the next sample of a class from the pool.
+        :param category: int
+            The predicted class to draw from.
+        :return: int
+            The sample id.
+        """
+        head = self._heads[category]
+        end = self._offsets[category + 1]
+        if head == end:
+            raise IndexError("pop from an empty class pool")
+        self._heads[category] = head + 1
+        if head + 1 == end:
+            self._candidates.remove(category)
+        return self._ids[head]
+
+    def shuffle(self, rng: np.random.Generator) -> None:
+        """
+        Shuffle the samples within each class and refill the pool.
+        :param rng: np.random.Generator
+            Source of randomness, e.g. the pool stream of a run, see seeding.run_generators.
+        """
+        self._ids = self.permutations(1, rng)[0]
+        self._reset()
+
+    def permutations(self, num_runs: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Draw independent within-class shuffles of the grouped sample ids, e.g. one for each simulation run.
+        :param num_runs: int
+            The number of shuffles.
+        :param rng: np.random.Generator
+            Source of randomness, e.g. the pool stream of a run, see seeding.run_generators.
+        :return: An (num_runs, num_samples) array. Each row is laid out according to self.offsets.
+        """
+        keys = self._categories + rng.random((num_runs, len(self._categories)))
+        return np.argsort(keys, axis=1)
+
+
+def _select_candidates(metric_val: np.ndarray, candidates: CandidateMask, mode: str,
+                       topk: int) -> Union[int, List[int]]:
+    """
+    Select the topk available arms.
+    :param metric_val: np.ndarray (k, )
+        Value of each arm.
+    :param candidates: CandidateMask
+        The arms that can be played.
+    :param mode: str
+        'min' or 'max'
+    :param topk: int
+        The number of arms to select.
+    :return: Union[int, List[int]]
+        The best arm if topk == 1, else a list of the topk best arms, best first.
+    """
+    selected = select_topk(metric_val, topk, mode, mask=candidates.mask, sort=True)
+    if topk == 1:
+        return int(selected[0])
+    return selected.tolist()
+
+
+def random_sampling(pool: ClassPool, topk: int = 1, rng: np.random.Generator = None, **kwargs) -> Union[int, List[int]]:
     """
     Draw topk samples with random sampling.
-    :param deques: List[deque]
-        A list of deques, each contains a deque of samples from one predicted class.
+    :param pool: ClassPool
+        Unlabeled samples grouped by predicted class.
     :param topk: int
         The number of extreme classes to identify. Default: 1.
+    :param rng: np.random.Generator
+        Source of randomness, required, e.g. the sample stream of a run, see seeding.run_generators.
     :param kwargs:
     :return: Union[int, List[int]]
-        A list of index if topk > 1 and topk < number of non-empty deques; else return one index.
-    """
-    while True:
-        # select each class randomly
-        if topk == 1:
-            category = random.randrange(len(deques))
-            if len(deques[category]) != 0:
-                return category
-        else:
-            # return a list of randomly selected categories:
-            candidates = set([i for i in range(len(deques)) if len(deques[i]) > 0])
-            if len(candidates) < topk:
-                return random_sampling(deques, topk=1)
-            else:  # there are less than topk available arms to play
-                return random.sample(candidates, topk)
-
-
-def thompson_sampling(deques: List[deque],
+        A list of index if topk > 1 and topk < number of non-empty classes; else return one index.
+    """
+    rng = require_generator(rng)
+    # when there are less than topk available arms, topk sampling is reduced to top 1
+    if len(pool.candidates) < topk:
+        topk = 1
+    # rank the available classes by random priorities, the same draws as in batch_random_sampling
+    return _select_candidates(rng.random(pool.num_classes), pool.candidates, 'min', topk)
+
+
+def thompson_sampling(pool: ClassPool,
                       model: BetaBernoulli,
                       mode: str,
                       topk: int = 1,
                       **kwargs) -> Union[int, List[int]]:
     """
     Draw topk samples with Thompson sampling.
-    :param deques: List[deque]
-        A list of deques, each contains a deque of samples from one predicted class.
+    :param pool: ClassPool
+        Unlabeled samples grouped by predicted class.
     :param model: BetaBernoulli
         A model for classwise accuracy.
     :param mode: str
@@ -50,44 +193,28 @@ def thompson_sampling(deques: List[deque],
         The number of extreme classes to identify. Default: 1.
     :param kwargs:
     :return: Union[int, List[int]]
-        A list of index if topk > 1 and topk < number of non-empty deques; else return one index.
+        A list of index if topk > 1 and topk < number of non-empty classes; else return one index.
     """
     samples = model.sample()
-    if mode == 'max':
-        ranked = np.argsort(samples)[::-1]
-    elif mode == 'min':
-        ranked = np.argsort(samples)
-    if topk == 1:
-        for category in ranked:
-            if len(deques[category]) != 0:
-                return category
-    else:
-        categories_list = []
-
-        candidates = set([i for i in range(len(deques)) if len(deques[i]) > 0])
-        # when we go through 'ranked' and len(categories_list) < topk, topk sampling is reduced to top 1
-        if len(candidates) < topk:
-            return thompson_sampling(deques, model, mode, topk=1)
-        else:
-            for category in ranked:
-                if category in candidates:
-                    categories_list.append(category)
-                    if len(categories_list) == topk:
-                        return categories_list
+    # when there are less than topk available arms, topk sampling is reduced to top 1
+    if len(pool.candidates) < topk:
+        topk = 1
+    return _select_candidates(samples, pool.candidates, mode, topk)
 
 
-def top_two_thompson_sampling(deques: List[deque],
+def top_two_thompson_sampling(pool: ClassPool,
                               model: BetaBernoulli,
                               mode: str,
                               max_ttts_trial=50,
                               ttts_beta: float = 0.5,
+                              rng: np.random.Generator = None,
                               **kwargs) -> Union[int, List[int]]:
     """
     Draw topk samples with Top Two Thompson sampling.
         Russo, D.  Simple Bayesian algorithms for best arm iden-tification. InConference on Learning Theory,
             pp. 1417–1418, 2016.
-    :param deques: List[deque]
-        A list of deques, each contains a deque of samples from one predicted class.
+    :param pool: ClassPool
+        Unlabeled samples grouped by predicted class.
     :param model: BetaBernoulli
         A model for classwise accuracy.
     :param mode: str
@@ -96,19 +223,21 @@ def top_two_thompson_sampling(deques: List[deque],
         The number of trials to draw a different arm. Default: 50.
     :param ttts_beta: float
         Between 0 and 1. The probability to play the best arm without further exploration.
+    :param rng: np.random.Generator
+        Source of randomness of the coin toss, required, e.g. the sample stream of a run, see seeding.run_generators.
     :param kwargs:
     :return: Union[int, List[int]]
-        A list of index if topk > 1 and topk < number of non-empty deques; else return one index.
+        A list of index if topk > 1 and topk < number of non-empty classes; else return one index.
     """
-    category_1 = thompson_sampling(deques, model, mode)
+    category_1 = thompson_sampling(pool, model, mode)
     # toss a coin with probability beta
-    B = np.random.binomial(1, ttts_beta)
+    B = require_generator(rng).binomial(1, ttts_beta)
     if B == 1:
         return category_1
     else:
         count = 0
         while True:
-            category_2 = thompson_sampling(deques, model, mode)
+            category_2 = thompson_sampling(pool, model, mode)
             if category_2 != category_1:
                 return category_2
             else:
@@ -117,16 +246,17 @@ def top_two_thompson_sampling(deques: List[deque],
                     return category_1
 
 
-def epsilon_greedy(deques: List[deque],
+def epsilon_greedy(pool: ClassPool,
                    model: BetaBernoulli,
                    mode: str,
                    topk: int = 1,
                    epsilon: float = 0.1,
+                   rng: np.random.Generator = None,
                    **kwargs) -> Union[int, List[int]]:
     """
     Draw topk samples with epsilon greedy.
-    :param deques: List[deque]
-        A list of deques, each contains a deque of samples from one predicted class.
+    :param pool: ClassPool
+        Unlabeled samples grouped by predicted class.
     :param model: BetaBernoulli
         A model for classwise accuracy.
     :param mode: str
@@ -135,39 +265,23 @@ def epsilon_greedy(deques: List[deque],
         The number of extreme classes to identify. Default: 1.
     :param epsilon: float
         The probability to explore at each time step.
+    :param rng: np.random.Generator
+        Source of randomness, required, e.g. the sample stream of a run, see seeding.run_generators.
     :param kwargs:
     :return: Union[int, List[int]]
-        A list of index if topk > 1 and topk < number of non-empty deques; else return one index.
+        A list of index if topk > 1 and topk < number of non-empty classes; else return one index.
     """
-    if random.random() < epsilon:
-        return random_sampling(deques, topk)
+    rng = require_generator(rng)
+    if rng.random() < epsilon:
+        return random_sampling(pool, topk, rng=rng)
     else:
-        samples = model.eval
-        if mode == 'max':
-            ranked = np.argsort(samples)[::-1]
-        elif mode == 'min':
-            ranked = np.argsort(samples)
-
-        if topk == 1:
-            for j in range(len(deques)):
-                category = ranked[j]
-                if len(deques[category]) != 0:
-                    return category
-        else:
-            categories_list = []
-            candidates = set([i for i in range(len(deques)) if len(deques[i]) > 0])
-            # when we go through 'ranked' and len(categories_list) < topk, topk sampling is reduced to top 1
-            if len(candidates) < topk:
-                return epsilon_greedy(deques, model, mode, topk=1)
-            else:
-                for category in ranked:
-                    if category in candidates:
-                        categories_list.append(category)
-                        if len(categories_list) == topk:
-                            return categories_list
+        # when there are less than topk available arms, topk sampling is reduced to top 1
+        if len(pool.candidates) < topk:
+            topk = 1
+        return _select_candidates(model.eval, pool.candidates, mode, topk)
 
 
-def bayesian_UCB(deques: List[deque],
+def bayesian_UCB(pool: ClassPool,
                  model: BetaBernoulli,
                  mode: str,
                  topk: int = 1,
@@ -175,8 +289,8 @@ def bayesian_UCB(deques: List[deque],
                  **kwargs) -> Union[int, List[int]]:
     """
     Draw topk samples with Bayesian Upper Confidence Bounds (UCB).
-    :param deques: List[deque]
-        A list of deques, each contains a deque of samples from one predicted class.
+    :param pool: ClassPool
+        Unlabeled samples grouped by predicted class.
     :param model: BetaBernoulli
         A model for classwise accuracy.
     :param mode: str
@@ -187,33 +301,175 @@ def bayesian_UCB(deques: List[deque],
         How many standard dev to consider as upper confidence bound. Default: 1.
     :param kwargs:
     :return: Union[int, List[int]]
-        A list of index if topk > 1 and topk < number of non-empty deques; else return one index.
+        A list of index if topk > 1 and topk < number of non-empty classes; else return one index.
     """
-    metric_val = model.eval
     if mode == 'max':
-        metric_val += ucb_c * model.variance
-        ranked = np.argsort(metric_val)[::-1]
+        metric_val = model.eval + ucb_c * model.variance
     elif mode == 'min':
-        metric_val -= ucb_c * model.variance
-        ranked = np.argsort(metric_val)
+        metric_val = model.eval - ucb_c * model.variance
+
+    # when there are less than topk available arms, topk sampling is reduced to top 1
+    if len(pool.candidates) < topk:
+        topk = 1
+    return _select_candidates(metric_val, pool.candidates, mode, topk)
+
+
+def _batch_rank(metric_val: np.ndarray, available: np.ndarray, mode: str, topk: int) -> np.ndarray:
+    """
+    Rank the available arms of every run and return the best topk of each, best first.
+    :param metric_val: np.ndarray (num_runs, k)
+        Value of each arm in each run.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left.
+    :param mode: str
+        'min' or 'max'
+    :param topk: int
+        The number of arms to return per run.
+    :return: An (num_runs, topk) array of arm indices. Columns past the number of available arms of a run are
+        arbitrary and must be ignored by the caller.
+    """
+    return select_topk(metric_val, topk, mode, mask=available, sort=True)
 
-    if topk == 1:
-        for j in range(len(deques)):
-            category = ranked[j]
-            if len(deques[category]) != 0:
-                return category
-    else:
-        categories_list = []
-        candidates = set([i for i in range(len(deques)) if len(deques[i]) > 0])
-        # when we go through 'ranked' and len(categories_list) < topk, topk sampling is reduced to top 1
-        if len(candidates) < topk:
-            return bayesian_UCB(deques, model, mode, topk=1)
-        else:
-            for category in ranked:
-                if category in candidates:
-                    categories_list.append(category)
-                    if len(categories_list) == topk:
-                        return categories_list
+
+def batch_random_sampling(available: np.ndarray, topk: int = 1, rngs: List[np.random.Generator] = None,
+                          **kwargs) -> np.ndarray:
+    """
+    Draw topk samples with random sampling for a batch of runs.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left in each run.
+    :param topk: int
+        The number of extreme classes to identify. Default: 1.
+    :param rngs: List[np.random.Generator]
+        Source of randomness of each run, required, e.g. the sample streams of the runs, see seeding.batch_generators.
+    :param kwargs:
+    :return: An (num_runs, topk) array of arm indices, see _batch_rank.
+    """
+    num_runs, num_classes = available.shape
+    priorities = np.array([rng.random(num_classes) for rng in require_generators(rngs, num_runs)])
+    return _batch_rank(priorities, available, 'min', topk)
+
+
+def batch_thompson_sampling(available: np.ndarray,
+                            model: BatchedBetaBernoulli,
+                            mode: str,
+                            topk: int = 1,
+                            **kwargs) -> np.ndarray:
+    """
+    Draw topk samples with Thompson sampling for a batch of runs.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left in each run.
+    :param model: BatchedBetaBernoulli
+        A batch of models for classwise accuracy.
+    :param mode: str
+        'min' or 'max'
+    :param topk: int
+        The number of extreme classes to identify. Default: 1.
+    :param kwargs:
+    :return: An (num_runs, topk) array of arm indices, see _batch_rank.
+    """
+    return _batch_rank(model.sample(), available, mode, topk)
+
+
+def batch_top_two_thompson_sampling(available: np.ndarray,
+                                    model: BatchedBetaBernoulli,
+                                    mode: str,
+                                    max_ttts_trial=50,
+                                    ttts_beta: float = 0.5,
+                                    rngs: List[np.random.Generator] = None,
+                                    **kwargs) -> np.ndarray:
+    """
+    Draw one sample with Top Two Thompson sampling for a batch of runs.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left in each run.
+    :param model: BatchedBetaBernoulli
+        A batch of models for classwise accuracy.
+    :param mode: str
+        'min' or 'max'
+    :param max_ttts_trial: int
+        The number of trials to draw a different arm. Default: 50.
+    :param ttts_beta: float
+        Between 0 and 1. The probability to play the best arm without further exploration.
+    :param rngs: List[np.random.Generator]
+        Source of randomness of the coin toss of each run, required, see seeding.batch_generators.
+    :param kwargs:
+    :return: An (num_runs, 1) array of arm indices.
+    """
+    category_1 = _batch_rank(model.sample(), available, mode, 1)[:, 0]
+    categories = category_1.copy()
+    # toss a coin with probability beta for every run
+    coins = [rng.binomial(1, ttts_beta) for rng in require_generators(rngs, available.shape[0])]
+    pending = np.flatnonzero(np.array(coins) == 0)
+    for _ in range(max_ttts_trial):
+        if len(pending) == 0:
+            break
+        category_2 = _batch_rank(model.sample(pending), available[pending], mode, 1)[:, 0]
+        accepted = category_2 != category_1[pending]
+        categories[pending[accepted]] = category_2[accepted]
+        pending = pending[~accepted]
+    return categories[:, np.newaxis]
+
+
+def batch_epsilon_greedy(available: np.ndarray,
+                         model: BatchedBetaBernoulli,
+                         mode: str,
+                         topk: int = 1,
+                         epsilon: float = 0.1,
+                         rngs: List[np.random.Generator] = None,
+                         **kwargs) -> np.ndarray:
+    """
+    Draw topk samples with epsilon greedy for a batch of runs.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left in each run.
+    :param model: BatchedBetaBernoulli
+        A batch of models for classwise accuracy.
+    :param mode: str
+        'min' or 'max'
+    :param topk: int
+        The number of extreme classes to identify. Default: 1.
+    :param epsilon: float
+        The probability to explore at each time step.
+    :param rngs: List[np.random.Generator]
+        Source of randomness of each run, required, e.g. the sample streams of the runs, see seeding.batch_generators.
+    :param kwargs:
+    :return: An (num_runs, topk) array of arm indices, see _batch_rank.
+    """
+    num_runs, num_classes = available.shape
+    rngs = require_generators(rngs, num_runs)
+    categories = _batch_rank(model.eval, available, mode, topk)
+    # exploring runs play random sampling instead, with the same draws as epsilon_greedy
+    explore = np.array([rng.random() < epsilon for rng in rngs])
+    if explore.any():
+        priorities = np.array([rngs[run].random(num_classes) for run in np.flatnonzero(explore)])
+        categories[explore] = _batch_rank(priorities, available[explore], 'min', topk)
+    return categories
+
+
+def batch_bayesian_UCB(available: np.ndarray,
+                       model: BatchedBetaBernoulli,
+                       mode: str,
+                       topk: int = 1,
+                       ucb_c: int = 1,
+                       **kwargs) -> np.ndarray:
+    """
+    Draw topk samples with Bayesian Upper Confidence Bounds (UCB) for a batch of runs.
+    :param available: np.ndarray (num_runs, k)
+        Boolean mask of arms that still have samples left in each run.
+    :param model: BatchedBetaBernoulli
+        A batch of models for classwise accuracy.
+    :param mode: str
+        'min' or 'max'
+    :param topk: int
+        The number of extreme classes to identify. Default: 1.
+    :param ucb_c: float
+        How many standard dev to consider as upper confidence bound. Default: 1.
+    :param kwargs:
+    :return: An (num_runs, topk) array of arm indices, see _batch_rank.
+    """
+    if mode == 'max':
+        metric_val = model.eval + ucb_c * model.variance
+    elif mode == 'min':
+        metric_val = model.eval - ucb_c * model.variance
+    return _batch_rank(metric_val, available, mode, topk)
 
 
 SAMPLE_CATEGORY = {
@@ -223,3 +479,11 @@ SAMPLE_CATEGORY = {
     'epsilon_greedy': epsilon_greedy,
     'bayesian_ucb': bayesian_UCB
 }
+
+BATCH_SAMPLE_CATEGORY = {
+    'random': batch_random_sampling,
+    'ts': batch_thompson_sampling,
+    'ttts': batch_top_two_thompson_sampling,
+    'epsilon_greedy': batch_epsilon_greedy,
+    'bayesian_ucb': batch_bayesian_UCB
+}
@@ -0,0 +1,270 @@
+"""
+Run a matrix of top-k active learning experiments on one machine under a global CPU and memory budget, instead of
+starting all drivers at once in the background. Jobs are started longest first, each in a process forked from the
+scheduler, and every prediction file is loaded once by the scheduler and shared by all jobs that read it.
+
+The experiment matrix is a JSON list of blocks. A block maps the options of a job to a value or a list of values and
+stands for the jobs of all combinations of its lists, e.g.
+
+    [{"policy": ["ts", "baselines"], "dataset": ["cifar100", "imagenet"], "metric": "accuracy", "mode": "min",
+      "topk": [1, 10], "pseudocount": [2, 10, 100]}]
+
+The options policy, dataset, metric, mode, topk and pseudocount are required. calibration_model, processes,
+online_eval, spill_samples and output are optional and default to the defaults of the drivers.
+"""
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import time
+from multiprocessing.connection import wait
+from typing import Dict, List, Tuple
+
+from data_utils import DATAFILE_LIST, DATASET_LIST, DATASIZE_DICT, LOGITSFILE_DICT, NUM_CLASSES_DICT
+from data_utils import preload_columns, release_columns
+from utils import CALIBRATION_MODEL, RUNS
+
+logger = logging.getLogger(__name__)
+
+# driver module of each policy and the number of sequences it samples per run, by metric
+POLICIES = {
+    'ts': ('active_learning_topk', {'accuracy': 3, 'calibration_error': 2}),  # non-active and Thompson sampling
+    'ttts': ('active_learning_topk_ttts', {'accuracy': 2, 'calibration_error': 1}),
+    'baselines': ('active_learning_topk_baselines', {'accuracy': 2, 'calibration_error': 2}),
+}
+REQUIRED_OPTIONS = ['policy', 'dataset', 'metric', 'mode', 'topk', 'pseudocount']
+OPTIONAL_OPTIONS = ['calibration_model', 'processes', 'online_eval', 'spill_samples', 'output']
+# relative cost of sampling one class in one step of one run, ClasswiseEce keeps 10 bins per class
+STEP_COST = {'accuracy': 1, 'calibration_error': 10}
+# bytes per step of a sampled sequence: categories, observations, scores, labels and indices
+SAMPLE_BYTES = 33
+# bytes per sample of the loaded dataset, held as Python lists by the drivers
+DATA_BYTES = 256
+# memory of a driver or worker process besides its data, mostly the imported libraries
+PROCESS_MEMORY = 2 ** 28
+
+
+class Job:
+    """
+    One run of a driver, main_accuracy_topk or main_calibration_error_topk, with the options of one point of the
+    experiment matrix.
+    """
+
+    def __init__(self, options: Dict) -> None:
+        """
+        :param options: Dict
+            Options of the job, see the module docstring.
+        """
+        if options['policy'] not in POLICIES:
+            raise ValueError("Unknown policy %s, expected one of %s." % (options['policy'], list(POLICIES)))
+        if options['dataset'] not in DATASET_LIST:
+            raise ValueError("%s is not in DATASET_LIST." % options['dataset'])
+        if options['metric'] not in STEP_COST:
+            raise ValueError("Unknown metric %s." % options['metric'])
+        if options['mode'] not in ('min', 'max'):
+            raise ValueError("Unknown mode %s." % options['mode'])
+        self.options = options
+        self.driver, num_sequences = POLICIES[options['policy']]
+        self._num_sequences = num_sequences[options['metric']]
+
+    @property
+    def name(self) -> str:
+        return '%s_%s_%s_%s_top%d_pseudocount%.2f' % (self.options['policy'], self.options['dataset'],
+                                                      self.options['metric'], self.options['mode'],
+                                                      self.options['topk'], self.options['pseudocount'])
+
+    @property
+    def processes(self) -> int:
+        return max(self.options['processes'], 1)
+
+    @property
+    def cost(self) -> float:
+        """
+        Relative duration of the job, proportional to the number of class posteriors sampled by all runs.
+        """
+        dataset = self.options['dataset']
+        return (STEP_COST[self.options['metric']] * RUNS * self._num_sequences * DATASIZE_DICT[dataset] *
+                NUM_CLASSES_DICT[dataset])
+
+    @property
+    def memory(self) -> int:
+        """
+        Estimated peak memory of the job and its worker processes in bytes.
+        """
+        dataset = self.options['dataset']
+        num_samples = DATASIZE_DICT[dataset]
+        memory = num_samples * DATA_BYTES + (self.processes + 1) * PROCESS_MEMORY
+        if not (self.options.get('online_eval') and not self.options.get('spill_samples')):
+            memory += RUNS * self._num_sequences * num_samples * SAMPLE_BYTES
+        if self.options['metric'] == 'calibration_error' and dataset in LOGITSFILE_DICT:
+            # the logits are loaded and copied to shared memory
+            memory += 2 * num_samples * NUM_CLASSES_DICT[dataset] * 8
+        return memory
+
+    def files(self) -> List[Tuple[str, bool]]:
+        """
+        :return: The files the job reads, each with whether its score matrix is needed.
+        """
+        dataset = self.options['dataset']
+        files = [(DATAFILE_LIST[dataset], False)]
+        if self.options['metric'] == 'calibration_error' and dataset in LOGITSFILE_DICT:
+            files.append((LOGITSFILE_DICT[dataset], True))
+        return files
+
+    def args(self) -> argparse.Namespace:
+        """
+        :return: The arguments of the driver, as parsed by its command line interface.
+        """
+        driver = importlib.import_module(self.driver)
+        return argparse.Namespace(dataset=self.options['dataset'],
+                                  output=pathlib.Path(self.options.get('output', driver.OUTPUT_DIR)),
+                                  topk=self.options['topk'],
+                                  metric=self.options['metric'],
+                                  pseudocount=self.options['pseudocount'],
+                                  mode=self.options['mode'],
+                                  calibration_model=self.options.get('calibration_model', CALIBRATION_MODEL),
+                                  processes=self.options['processes'],
+                                  online_eval=self.options.get('online_eval', False),
+                                  spill_samples=self.options.get('spill_samples', False),
+                                  debug=False)
+
+    def run(self) -> None:
+        driver = importlib.import_module(self.driver)
+        if self.options['metric'] == 'accuracy':
+            driver.main_accuracy_topk(self.args(), sample=True, eval=True, plot=True)
+        else:
+            driver.main_calibration_error_topk(self.args(), sample=True, eval=True, plot=True)
+
+
+def load_matrix(filename: pathlib.Path, processes: int = 4) -> List[Job]:
+    """
+    Expand an experiment matrix into jobs.
+    :param filename: pathlib.Path
+        JSON file of the experiment matrix, see the module docstring.
+    :param processes: int
+        Number of worker processes of the jobs that do not set processes. Default: 4.
+    :return: The jobs, duplicates are dropped.
+    """
+    with open(filename, 'r') as f:
+        blocks = json.load(f)
+
+    jobs = {}
+    for block in blocks:
+        missing = [key for key in REQUIRED_OPTIONS if key not in block]
+        unknown = [key for key in block if key not in REQUIRED_OPTIONS + OPTIONAL_OPTIONS]
+        if missing or unknown:
+            raise ValueError("Invalid block %s: missing options %s, unknown options %s." % (block, missing, unknown))
+        keys = list(block)
+        values = [value if isinstance(value, list) else [value] for value in block.values()]
+        for combination in itertools.product(*values):
+            options = dict(zip(keys, combination))
+            options.setdefault('processes', processes)
+            key = json.dumps(options, sort_keys=True)
+            if key in jobs:
+                logger.warning('Skipping duplicate job %s' % key)
+                continue
+            jobs[key] = Job(options)
+    return list(jobs.values())
+
+
+def run_jobs(jobs: List[Job], cpus: int, memory: int) -> List[Job]:
+    """
+    Run jobs in forked processes, longest first, as long as their processes and estimated memory fit into the budget.
+    A job that does not fit into the budget at all is run alone. The files of the jobs are loaded once, before the
+    first job that reads them starts, and released once the last job that reads them has started.
+    :param cpus: int
+        The number of CPUs, each job uses one per worker process.
+    :param memory: int
+        Memory budget in bytes.
+    :return: The failed jobs.
+    """
+    pending = sorted(jobs, key=lambda job: job.cost, reverse=True)
+    readers = {}
+    for job in pending:
+        for filename, _ in job.files():
+            readers[filename] = readers.get(filename, 0) + 1
+
+    # fork, so that the jobs inherit the loaded files
+    context = multiprocessing.get_context('fork')
+    running = {}
+    free_cpus, free_memory = cpus, memory
+    failed = []
+    try:
+        while pending or running:
+            # strictly in order, so that smaller jobs do not delay the longest pending job
+            while pending and (not running or (pending[0].processes <= free_cpus and pending[0].memory <= free_memory)):
+                job = pending.pop(0)
+                for filename, store_scores in job.files():
+                    preload_columns(filename, store_scores=store_scores)
+                process = context.Process(target=job.run, name=job.name)
+                process.start()
+                running[process.sentinel] = (job, process, time.time())
+                free_cpus -= job.processes
+                free_memory -= job.memory
+                logger.info('Started %s (%d pending, %d running)' % (job.name, len(pending), len(running)))
+                for filename, _ in job.files():
+                    readers[filename] -= 1
+                    if not readers[filename]:
+                        release_columns(filename)
+
+            for sentinel in wait(list(running)):
+                job, process, start = running.pop(sentinel)
+                process.join()
+                free_cpus += job.processes
+                free_memory += job.memory
+                if process.exitcode:
+                    failed.append(job)
+                    logger.error('%s failed with exit code %d' % (job.name, process.exitcode))
+                else:
+                    logger.info('Finished %s in %.0fs' % (job.name, time.time() - start))
+    finally:
+        for job, process, _ in running.values():
+            process.terminate()
+            process.join()
+    return failed
+
+
+def _total_memory() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def main(args: argparse.Namespace) -> None:
+    jobs = load_matrix(args.matrix, processes=args.processes)
+    memory = int(args.memory * 2 ** 30)
+    logger.info('%d jobs on %d CPUs with %.1f GiB of memory' % (len(jobs), args.cpus, memory / 2 ** 30))
+    if args.dry_run:
+        for job in sorted(jobs, key=lambda job: job.cost, reverse=True):
+            print('%s\tcost %.3g\tprocesses %d\tmemory %.2f GiB' % (job.name, job.cost, job.processes,
+                                                                   job.memory / 2 ** 30))
+        return
+
+    failed = run_jobs(jobs, args.cpus, memory)
+    if failed:
+        raise RuntimeError('%d of %d jobs failed: %s' % (len(failed), len(jobs), ', '.join(job.name for job in failed)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('matrix', type=pathlib.Path, help='JSON file of the experiment matrix')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count(),
+                        help='Number of CPUs shared by all jobs. Default: all CPUs.')
+    parser.add_argument('--memory', type=float, default=_total_memory() / 2 ** 30,
+                        help='Memory shared by all jobs in GiB. Default: all physical memory.')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Number of worker processes of each job that does not set processes in the matrix.')
+    parser.add_argument('--dry_run', action='store_true', help='Only list the jobs, longest first.')
+    parser.add_argument('--debug', action='store_true', help='Enables debug statements')
+
+    args, _ = parser.parse_known_args()
+
+    if args.debug:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+    logging.basicConfig(level=level)
+
+    main(args)
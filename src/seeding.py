@@ -0,0 +1,65 @@
+"""
+Random number streams of the simulation runs. Every run draws from generators spawned from its own seed, so that it
+does not depend on which process or host executes it, nor on the other runs simulated with it.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+def run_generators(random_seed=0) -> Tuple[np.random.Generator, np.random.Generator]:
+    """
+    Independent random number streams of one run, spawned from SeedSequence(random_seed): one to shuffle the pool and
+    one for the posterior samples and the decisions of the sampling policy. Runs with the same seed share the pool
+    shuffle whatever their policy.
+    :param random_seed: int or sequence of ints
+        Seed of the run, e.g. the run index, or (experiment seed, run index). Default: 0.
+    :return: pool_rng, sample_rng
+    """
+    pool_seed, sample_seed = np.random.SeedSequence(random_seed).spawn(2)
+    return np.random.default_rng(pool_seed), np.random.default_rng(sample_seed)
+
+
+def batch_generators(random_seed: int, num_runs: int) -> Tuple[List[np.random.Generator], List[np.random.Generator]]:
+    """
+    The streams of num_runs consecutive runs, simulated in lockstep. Run i is seeded with random_seed + i, so it draws
+    the same numbers whatever batch it is simulated in.
+    :param random_seed: int
+        Seed of the first run, e.g. its run index.
+    :param num_runs: int
+        The number of runs.
+    :return: pool_rngs, sample_rngs, lists of the streams of each run, see run_generators.
+    """
+    pool_rngs, sample_rngs = zip(*[run_generators(random_seed + i) for i in range(num_runs)])
+    return list(pool_rngs), list(sample_rngs)
+
+
+def require_generator(rng: np.random.Generator) -> np.random.Generator:
+    """
+    :param rng: np.random.Generator or None
+        Generator passed to a model or policy.
+    :return: rng
+    :raises ValueError: if rng is None. There is no process-wide default stream, which forked worker processes would
+        share, every run passes its own generators, see run_generators.
+    """
+    if rng is None:
+        raise ValueError("No random number generator given, pass the generators of the run, see "
+                         "seeding.run_generators.")
+    return rng
+
+
+def require_generators(rngs: List[np.random.Generator], num_runs: int) -> List[np.random.Generator]:
+    """
+    :param rngs: List[np.random.Generator] or None
+        Generators passed to a batched model or policy, one per run.
+    :param num_runs: int
+        The number of runs.
+    :return: rngs
+    :raises ValueError: if rngs is None or does not hold num_runs distinct generators.
+    """
+    if rngs is None:
+        raise ValueError("No random number generators given, pass the generators of the runs, see "
+                         "seeding.batch_generators.")
+    if len(rngs) != num_runs or len(set(map(id, rngs))) != num_runs:
+        raise ValueError("Expected %d distinct generators, one per run, got %d." % (num_runs, len(set(map(id, rngs)))))
+    return rngs
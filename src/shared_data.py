@@ -0,0 +1,182 @@
+"""
+NumPy arrays in multiprocessing.shared_memory blocks: the loaded dataset, published once read only, and the result
+buffers that worker processes fill in place. Worker processes attach to the blocks by name without copying them, with
+any start method.
+"""
+import ctypes
+import os
+import weakref
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+class _BlockView:
+    """
+    Exposes a shared memory block to np.asarray through the array interface. Arrays created from it keep it, and so
+    the block, alive: SharedMemory.close unmaps the memory even while NumPy views of SharedMemory.buf exist.
+    """
+
+    def __init__(self, block: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: np.dtype,
+                 readonly: bool) -> None:
+        self.block = block
+        address = ctypes.addressof(ctypes.c_char.from_buffer(block.buf))
+        self.__array_interface__ = {'shape': tuple(shape), 'typestr': np.dtype(dtype).str, 'data': (address, readonly),
+                                    'version': 3}
+
+
+def _block_array(block: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: np.dtype,
+                 readonly: bool = True) -> np.ndarray:
+    return np.asarray(_BlockView(block, shape, dtype, readonly))
+
+
+class SharedArrays:
+    """
+    A set of named arrays in shared memory. The process that publishes the arrays owns the blocks and has to unlink
+    them, other processes attach to them when a SharedArrays is unpickled, e.g. when it is passed to a worker process.
+    The arrays are read only in every process.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        """
+        Copy arrays into new shared memory blocks.
+        :param arrays: Dict[str, np.ndarray]
+            Arrays to publish by name. None values are kept as None.
+        """
+        self._owner = True
+        self._spec = {}
+        self._arrays = {}
+        blocks = []
+        for name, array in arrays.items():
+            if array is None:
+                self._spec[name] = None
+                self._arrays[name] = None
+                continue
+            array = np.ascontiguousarray(array)
+            # shared memory blocks cannot be empty
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            _block_array(block, array.shape, array.dtype, readonly=False)[...] = array
+            blocks.append(block)
+            self._spec[name] = (block.name, array.shape, array.dtype.str)
+            self._arrays[name] = _block_array(block, array.shape, array.dtype)
+        # free the blocks when the publisher is garbage collected or exits without calling unlink
+        self._finalizer = weakref.finalize(self, _unlink_blocks, blocks, os.getpid())
+
+    @classmethod
+    def attach(cls, spec: Dict[str, Tuple[str, Tuple[int, ...], str]]) -> 'SharedArrays':
+        """
+        Attach to arrays published by another process.
+        :param spec: Dict mapping names to (block name, shape, dtype), as returned by SharedArrays.spec.
+        """
+        self = cls.__new__(cls)
+        self._owner = False
+        self._finalizer = None
+        self._spec = dict(spec)
+        self._arrays = {}
+        for name, entry in spec.items():
+            if entry is None:
+                self._arrays[name] = None
+                continue
+            block_name, shape, dtype = entry
+            self._arrays[name] = _block_array(shared_memory.SharedMemory(name=block_name), shape, dtype)
+        return self
+
+    @property
+    def spec(self) -> Dict[str, Tuple[str, Tuple[int, ...], str]]:
+        return dict(self._spec)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._arrays
+
+    def __getstate__(self):
+        # pickling only transfers the block names, the receiving process attaches to the same memory
+        return self._spec
+
+    def __setstate__(self, spec):
+        self.__dict__.update(SharedArrays.attach(spec).__dict__)
+
+    def unlink(self) -> None:
+        """
+        Free the shared memory blocks, only in the publishing process once all workers are done. Arrays that are
+        still referenced stay valid, the memory is unmapped once they are garbage collected.
+        """
+        if self._owner:
+            self._finalizer()
+
+
+class SharedResultBuffer:
+    """
+    A zero-initialized (runs, ...) result array in shared memory, filled in place by worker processes. Every run is
+    written by exactly one worker, so rows are written without locking. The process that creates the buffer owns the
+    block, other processes attach to it when the buffer is unpickled.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=float) -> None:
+        """
+        :param shape: Tuple[int, ...]
+            Shape of the results, the first axis indexes the runs.
+        :param dtype:
+            Type of the results. Default: float.
+        """
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._owner = True
+        # shared memory blocks cannot be empty
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(self._shape)) * self._dtype.itemsize, 1))
+        self._name = block.name
+        self._array = _block_array(block, self._shape, self._dtype, readonly=False)
+        self._array[...] = 0
+        # free the block when the buffer is garbage collected, the array stays valid while it is referenced
+        self._finalizer = weakref.finalize(self, _unlink_blocks, [block], os.getpid())
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        The results of all runs, without copying them.
+        """
+        return self._array
+
+    def row(self, run_idx: int) -> np.ndarray:
+        """
+        :param run_idx: int
+        :return: A writable view of the results of run run_idx.
+        """
+        return self._array[run_idx]
+
+    def __setitem__(self, run_idx: int, value) -> None:
+        self._array[run_idx] = value
+
+    def __getstate__(self):
+        # pickling only transfers the block name, the receiving process attaches to the same memory
+        return self._name, self._shape, self._dtype.str
+
+    def __setstate__(self, state):
+        self._name, self._shape, dtype = state
+        self._dtype = np.dtype(dtype)
+        self._owner = False
+        self._finalizer = None
+        self._array = _block_array(shared_memory.SharedMemory(name=self._name), self._shape, self._dtype,
+                                   readonly=False)
+
+    def unlink(self) -> None:
+        """
+        Free the shared memory block, only in the creating process once all workers are done. The array stays valid
+        while it is referenced.
+        """
+        if self._owner:
+            self._finalizer()
+
+
+def _unlink_blocks(blocks, owner_pid: int) -> None:
+    # forked workers inherit the finalizer, only the publishing process removes the blocks
+    if os.getpid() != owner_pid:
+        return
+    for block in blocks:
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
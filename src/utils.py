@@ -1,27 +1,56 @@
 import argparse
-import ctypes
-import random
-from collections import deque
-from functools import reduce
-from multiprocessing import Array
 
 import matplotlib.pyplot as plt
 
 from calibration import CALIBRATION_MODELS
 from data_utils import *
-from models import BetaBernoulli
-from sampling import SAMPLE_CATEGORY
+from models import BetaBernoulli, BatchedBetaBernoulli
+from ranking import select_topk
+from sampling import SAMPLE_CATEGORY, BATCH_SAMPLE_CATEGORY, ClassPool
+from seeding import batch_generators, run_generators
+from shared_data import SharedArrays, SharedResultBuffer
 
 COLUMN_WIDTH = 3.25  # Inches
 GOLDEN_RATIO = 1.61803398875
 FONT_SIZE = 8
 
 RUNS = 100
+# number of runs sampled in lockstep by one task, each run draws from its own streams whatever its batch
+RUN_BATCH_SIZE = 10
 LOG_FREQ = 100
 CALIBRATION_FREQ = 100
 PRIOR_STRENGTH = 3
 CALIBRATION_MODEL = 'classwise_histogram_binning'
 HOLDOUT_RATIO = 0.1
+HOLDOUT_SEED = 0
+EVAL_CHUNK_SIZE = 2 ** 24
+
+
+# columns of a top-k dataset and the dtype they are shared with
+TOPK_COLUMN_DTYPES = {
+    'categories': np.int64,
+    'observations': bool,
+    'confidences': float,
+    'labels': np.int64,
+    'indices': np.int64,
+}
+
+
+def share_topk_data(arrays: Dict[str, object]) -> SharedArrays:
+    """
+    Publish a dataset in shared memory once, as typed arrays that worker processes read without copying.
+    :param arrays: Dict[str, object]
+        Columns of the dataset, named like the keys of TOPK_COLUMN_DTYPES, optionally with a 'holdout_' prefix, are
+        converted to that dtype. Other arrays, e.g. logits, are shared as they are, None values stay None.
+    :return: SharedArrays
+    """
+    typed_arrays = {}
+    for name, array in arrays.items():
+        column = name[len('holdout_'):] if name.startswith('holdout_') else name
+        if array is not None and column in TOPK_COLUMN_DTYPES:
+            array = np.asarray(array).astype(TOPK_COLUMN_DTYPES[column])
+        typed_arrays[name] = array
+    return SharedArrays(typed_arrays)
 
 
 #########################SAMPLE AND EVAL FOR ACTIVE TOPK##########################
@@ -36,30 +65,40 @@ def get_samples_topk(args: argparse.Namespace,
                      sample_method: str,
                      prior=None,
                      weight=None,
-                     random_seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    # prepare model, deques, thetas, choices
-
-    random.seed(random_seed)
+                     random_seed: int = 0,
+                     evaluator=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample a sequence of num_samples labeled samples with sample_method.
+    :param random_seed: int
+        Seed of the run, e.g. the run index. The run only depends on its seed, not on the process it runs in.
+        Default: 0.
+    :param evaluator: TopkEvaluator or None
+        If given, every sample is passed to the evaluator as soon as it is drawn, so that sampling and evaluation
+        happen in a single pass. Default: None.
+    :return: Five (num_samples, ) arrays of sampled categories, observations, scores, labels and indices.
+    """
+    # prepare model, pool, thetas, choices
+    pool_rng, sample_rng = run_generators(random_seed)
 
     if args.metric == 'accuracy':
-        model = BetaBernoulli(num_classes, prior)
+        model = BetaBernoulli(num_classes, prior, rng=sample_rng)
     elif args.metric == 'calibration_error':
-        model = ClasswiseEce(num_classes, num_bins=10, pseudocount=args.pseudocount, weight=weight, prior=None)
+        model = ClasswiseEce(num_classes, num_bins=10, pseudocount=args.pseudocount, weight=weight, prior=None,
+                             rng=sample_rng)
 
-    deques = [deque() for _ in range(num_classes)]
-    for category, score, observation, label, index in zip(categories, confidences, observations, labels, indices):
-        if args.metric == 'accuracy':
-            deques[category].append(observation)
-        elif args.metric == 'calibration_error':
-            deques[category].append((observation, score, label, index))
-    for _deque in deques:
-        random.shuffle(_deque)
+    pool = ClassPool(categories, num_classes)
+    pool.shuffle(pool_rng)
+
+    observations = np.asarray(observations, dtype=bool)
+    confidences = np.asarray(confidences, dtype=float)
+    labels = np.asarray(labels).astype(np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
 
-    sampled_categories = np.zeros((num_samples,), dtype=np.int)
-    sampled_observations = np.zeros((num_samples,), dtype=np.int)
-    sampled_scores = np.zeros((num_samples,), dtype=np.float)
-    sampled_labels = np.zeros((num_samples,), dtype=np.int)
-    sampled_indices = np.zeros((num_samples,), dtype=np.int)
+    sampled_categories = np.zeros((num_samples,), dtype=np.int64)
+    sampled_observations = np.zeros((num_samples,), dtype=np.int64)
+    sampled_scores = np.zeros((num_samples,), dtype=float)
+    sampled_labels = np.zeros((num_samples,), dtype=np.int64)
+    sampled_indices = np.zeros((num_samples,), dtype=np.int64)
 
     sample_fct = SAMPLE_CATEGORY[sample_method]
 
@@ -72,8 +111,8 @@ def get_samples_topk(args: argparse.Namespace,
         # If the sampling method has been switched to top1, then the return 'category_list' is an int
 
         # get a list of length topk
-        categories_list = sample_fct(deques=deques,
-                                     random_seed=random_seed,
+        categories_list = sample_fct(pool=pool,
+                                     rng=sample_rng,
                                      model=model,
                                      mode=args.mode,
                                      topk=topk,
@@ -87,27 +126,345 @@ def get_samples_topk(args: argparse.Namespace,
             if topk != 1:
                 topk = 1
 
-        # update model, deques, thetas, choices
+        # update model, pool, thetas, choices
         for category in categories_list:
+            sample_id = pool.pop(category)
+            observation = observations[sample_id]
             if args.metric == 'accuracy':
-                observation = deques[category].pop()
                 model.update(category, observation)
 
             elif args.metric == 'calibration_error':
-                observation, score, label, index = deques[category].pop()
+                score = confidences[sample_id]
                 model.update(category, observation, score)
                 sampled_scores[idx] = score
-                sampled_labels[idx] = label
-                sampled_indices[idx] = index
+                sampled_labels[idx] = labels[sample_id]
+                sampled_indices[idx] = indices[sample_id]
 
             sampled_categories[idx] = category
             sampled_observations[idx] = observation
 
+            if evaluator is not None:
+                evaluator.update(category, observation, confidences[sample_id], labels[sample_id], indices[sample_id])
+
             idx += 1
 
     return sampled_categories, sampled_observations, sampled_scores, sampled_labels, sampled_indices
 
 
+def get_samples_topk_batch(args: argparse.Namespace,
+                           categories: List[int],
+                           observations: List[bool],
+                           confidences: List[float],
+                           labels: List[int],
+                           indices: List[int],
+                           num_classes: int,
+                           num_samples: int,
+                           sample_method: str,
+                           num_runs: int,
+                           prior=None,
+                           random_seed: int = 0,
+                           evaluators: List['BatchedTopkEvaluator'] = None,
+                           return_samples: bool = True) -> Tuple[np.ndarray, ...]:
+    """
+    Same as get_samples_topk, but simulates num_runs independent runs in lockstep. The posteriors of all runs are kept
+        in one BatchedBetaBernoulli model and the class pools of each run are head pointers into one row of
+        ClassPool.permutations.
+    Only implemented for args.metric == 'accuracy'.
+    :param random_seed: int
+        Seed of the first run of the batch. Run i draws from the streams of seed random_seed + i, see
+        seeding.batch_generators, so that it does not depend on the other runs of the batch. Default: 0.
+    :param evaluators: List[BatchedTopkEvaluator] or None
+        Evaluators that are fed every sample as soon as it is drawn. Default: None.
+    :param return_samples: bool
+        Whether to store and return the sampled sequences. Evaluating online with evaluators and return_samples=False
+        avoids materializing five (num_runs, num_samples) arrays. Default: True.
+    :return: Five (num_runs, num_samples) arrays of sampled categories, observations, scores, labels and indices,
+        or None if return_samples is False.
+    """
+    if args.metric != 'accuracy':
+        raise ValueError("Batched sampling is not implemented for metric %s." % args.metric)
+
+    pool_rngs, sample_rngs = batch_generators(random_seed, num_runs)
+
+    categories = np.asarray(categories, dtype=np.int64)
+    observations = np.asarray(observations, dtype=bool)
+    confidences = np.asarray(confidences, dtype=float)
+    labels = np.asarray(labels).astype(np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+
+    model = BatchedBetaBernoulli(num_runs, num_classes, prior, rngs=sample_rngs)
+
+    # sample ids grouped by predicted class, shuffled within each class independently for every run
+    pool = ClassPool(categories, num_classes)
+    class_offsets = pool.offsets
+    shuffled_ids = np.concatenate([pool.permutations(1, pool_rng) for pool_rng in pool_rngs])
+    heads = np.repeat(class_offsets[np.newaxis, :-1], num_runs, axis=0)
+    available = heads < class_offsets[1:]
+
+    if evaluators is None:
+        evaluators = []
+    if return_samples:
+        sampled_categories = np.zeros((num_runs, num_samples), dtype=np.int64)
+        sampled_observations = np.zeros((num_runs, num_samples), dtype=bool)
+        sampled_scores = np.zeros((num_runs, num_samples), dtype=float)
+        sampled_labels = np.zeros((num_runs, num_samples), dtype=np.int64)
+        sampled_indices = np.zeros((num_runs, num_samples), dtype=np.int64)
+
+    sample_fct = BATCH_SAMPLE_CATEGORY[sample_method]
+
+    positions = np.zeros((num_runs,), dtype=np.int64)
+    while (positions < num_samples).any():
+        categories_array = sample_fct(available=available,
+                                      rngs=sample_rngs,
+                                      model=model,
+                                      mode=args.mode,
+                                      topk=args.topk,
+                                      max_ttts_trial=50,
+                                      ttts_beta=0.5,
+                                      epsilon=0.1,
+                                      ucb_c=1)
+
+        # if there are less than topk available arms to play, a run switches to top 1.
+        topk = categories_array.shape[1]
+        num_choices = np.where(available.sum(axis=1) < topk, 1, topk)
+        num_choices[positions >= num_samples] = 0
+
+        # update model, pools and outputs of every run that plays its j-th arm in this step
+        for j in range(topk):
+            runs = np.flatnonzero(num_choices > j)
+            run_categories = categories_array[runs, j]
+            sample_ids = shuffled_ids[runs, heads[runs, run_categories]]
+            heads[runs, run_categories] += 1
+            available[runs, run_categories] = heads[runs, run_categories] < class_offsets[run_categories + 1]
+
+            run_observations = observations[sample_ids]
+            model.update_batch(runs, run_categories, run_observations)
+
+            run_positions = positions[runs]
+            for evaluator in evaluators:
+                evaluator.update(runs, run_positions, run_categories, run_observations)
+            if return_samples:
+                sampled_categories[runs, run_positions] = run_categories
+                sampled_observations[runs, run_positions] = run_observations
+                sampled_scores[runs, run_positions] = confidences[sample_ids]
+                sampled_labels[runs, run_positions] = labels[sample_ids]
+                sampled_indices[runs, run_positions] = indices[sample_ids]
+            positions[runs] += 1
+
+    if return_samples:
+        return sampled_categories, sampled_observations, sampled_scores, sampled_labels, sampled_indices
+
+
+class TopkEvaluator:
+    """
+    Online counterpart of evaluate: consumes labeled samples one at a time, in the order they were sampled, and
+        evaluates topk agreement, MRR and (for calibration error) recalibrated holdout ECE at the usual checkpoints.
+        This lets sampling and evaluation run in a single pass without storing the sampled sequences.
+    """
+
+    def __init__(self,
+                 args: argparse.Namespace,
+                 ground_truth: np.ndarray,
+                 num_classes: int,
+                 num_samples: int,
+                 holdout_categories: List[int] = None,  # will be used if train classwise calibration model
+                 holdout_observations: List[bool] = None,
+                 holdout_confidences: List[float] = None,
+                 holdout_labels: List[int] = None,
+                 holdout_indices: List[int] = None,
+                 prior=None,
+                 weight=None,
+                 logits=None) -> None:
+        """
+        :param ground_truth: np.ndarray (num_classes, )
+            Boolean mask of the ground truth topk classes.
+        :param num_samples: int
+            The number of samples that will be consumed, sets the number of checkpoints.
+        """
+        self._args = args
+        self._ground_truth = ground_truth
+        self._num_classes = num_classes
+        self._holdout_categories = holdout_categories
+        self._holdout_observations = holdout_observations
+        self._holdout_confidences = holdout_confidences
+        self._logits = logits
+        self._idx = 0
+
+        if args.metric == 'accuracy':
+            self._model = BetaBernoulli(num_classes, prior)
+        elif args.metric == 'calibration_error':
+            self._model = ClasswiseEce(num_classes, num_bins=10, pseudocount=args.pseudocount, weight=weight)
+
+        self._avg_num_agreement = np.zeros((num_samples // LOG_FREQ + 1,))
+        self._mrr = np.zeros((num_samples // LOG_FREQ + 1,))
+        self._topk_arms = np.zeros((num_classes,), dtype=np.bool_)
+
+        if args.metric == 'calibration_error':
+
+            self._holdout_calibrated_ece = np.zeros((num_samples // CALIBRATION_FREQ + 1,))
+
+            # samples seen so far, recalibration is fit on all of them
+            self._categories = np.zeros((num_samples,), dtype=np.int64)
+            self._observations = np.zeros((num_samples,), dtype=bool)
+            self._confidences = np.zeros((num_samples,), dtype=float)
+            self._labels = np.zeros((num_samples,), dtype=np.int64)
+            self._indices = np.zeros((num_samples,), dtype=np.int64)
+
+            if args.calibration_model in ['histogram_binning', 'isotonic_regression', 'bayesian_binning_quantiles',
+                                          'classwise_histogram_binning', 'two_group_histogram_binning']:
+                holdout_X = np.array(holdout_confidences)
+                self._holdout_X = np.array([1 - holdout_X, holdout_X]).T
+                if args.calibration_model in ['histogram_binning', 'isotonic_regression',
+                                              'bayesian_binning_quantiles']:
+                    # fit incrementally at each checkpoint on the samples since the previous one
+                    self._calibration_model = CALIBRATION_MODELS[args.calibration_model]()
+                    self._num_calibrated = 0
+
+            elif args.calibration_model in ['platt_scaling', 'temperature_scaling']:
+                holdout_indices_array = np.array(holdout_indices, dtype=np.int64)
+                self._holdout_X = logits[holdout_indices_array]
+                # warm start each checkpoint from the parameters fitted at the previous one
+                if args.calibration_model == 'temperature_scaling':
+                    self._calibration_model = CALIBRATION_MODELS['temperature_scaling']()
+                else:
+                    self._calibration_model = CALIBRATION_MODELS['platt_scaling'](warm_start=True)
+                self._num_calibrated = 0
+
+    def update(self, category: int, observation: bool, confidence: float, label: int, index: int) -> None:
+        """
+        Update the model with the next sampled sample and evaluate if a checkpoint is reached.
+        :param category: int
+            The predicted class of the sample.
+        :param observation: bool
+            Whether predicted label is the same as true label.
+        :param confidence: float
+            The confidence of the prediction.
+        :param label: int
+            The true label of the sample.
+        :param index: int
+            The index of the sample in the dataset.
+        """
+        args = self._args
+        idx = self._idx
+        self._idx += 1
+
+        if args.metric == 'accuracy':
+            self._model.update(category, observation)
+        elif args.metric == 'calibration_error':
+            self._model.update(category, observation, confidence)
+            self._categories[idx] = category
+            self._observations[idx] = observation
+            self._confidences[idx] = confidence
+            self._labels[idx] = label
+            self._indices[idx] = index
+
+        if idx % LOG_FREQ == 0:
+            # select TOPK arms
+            self._topk_arms[:] = 0
+            metric_val = self._model.eval
+            self._topk_arms[select_topk(metric_val, args.topk, args.mode)] = 1
+            # evaluation
+            self._avg_num_agreement[idx // LOG_FREQ] = self._topk_arms[self._ground_truth == 1].mean()
+
+            # MRR
+            self._mrr[idx // LOG_FREQ] = mean_reciprocal_rank(metric_val, self._ground_truth, args.mode)
+
+        if args.metric == 'calibration_error' and idx % CALIBRATION_FREQ == 0:
+            self._recalibrate(idx)
+
+    def _recalibrate(self, idx: int) -> None:
+        """
+        Recalibrate with the first idx samples and evaluate ECE on the recalibrated holdout set.
+        :param idx: int
+            The number of samples to fit the calibration model on.
+        """
+        args = self._args
+        holdout_categories = self._holdout_categories
+        holdout_confidences = self._holdout_confidences
+        holdout_observations = self._holdout_observations
+        holdout_X = self._holdout_X
+        ground_truth = self._ground_truth
+
+        # before calibration
+        if idx == 0:
+            self._holdout_calibrated_ece[idx] = eval_ece(holdout_confidences, holdout_observations, num_bins=10)
+            return
+
+        if args.calibration_model in ['histogram_binning', 'isotonic_regression', 'bayesian_binning_quantiles']:
+            calibration_model = self._calibration_model
+            X = self._confidences[self._num_calibrated:idx]
+            X = np.array([1 - X, X]).T
+            y = self._observations[self._num_calibrated:idx] * 1
+            calibration_model.partial_fit(X, y)
+            self._num_calibrated = idx
+            calibrated_holdout_confidences = calibration_model.predict_proba(holdout_X)[:, 1].tolist()
+
+        elif args.calibration_model in ['platt_scaling', 'temperature_scaling']:
+            calibration_model = self._calibration_model
+            if args.calibration_model == 'temperature_scaling':
+                # the model caches the logits seen so far, only pass the new ones
+                X = self._logits[self._indices[self._num_calibrated:idx]]
+                y = self._labels[self._num_calibrated:idx]
+                calibration_model.partial_fit(X, y)
+            else:
+                X = self._logits[self._indices[:idx]]
+                y = self._labels[:idx]
+                calibration_model.fit(X, y)
+            self._num_calibrated = idx
+
+            pred_array = np.array(holdout_categories).astype(int).reshape(-1, 1)
+            calibrated_holdout_confidences = calibration_model.predict_proba(holdout_X)
+            calibrated_holdout_confidences = np.take_along_axis(calibrated_holdout_confidences, pred_array,
+                                                                axis=1).squeeze().tolist()
+
+        elif args.calibration_model in ['classwise_histogram_binning']:
+            # use the current MPE reliability diagram for calibration, no need to train a separate calibration model
+            calibration_mapping = self._model.beta_params_mpe
+            bin_idx = np.floor(np.array(holdout_confidences) * 10).astype(int)
+            bin_idx[bin_idx == 10] = 9
+            calibrated_holdout_confidences = calibration_mapping[holdout_categories, bin_idx].tolist()
+
+        elif args.calibration_model in ['two_group_histogram_binning']:
+
+            calibrated_holdout_confidences = np.zeros(len(holdout_confidences))
+
+            calibration_model_less_calibrated = CALIBRATION_MODELS['histogram_binning']()
+            calibration_model_more_calibrated = CALIBRATION_MODELS['histogram_binning']()
+            X = self._confidences[:idx]
+            X = np.array([1 - X, X]).T
+            y = self._observations[:idx] * 1
+
+            train_mask = ground_truth[self._categories[:idx]]
+            holdout_mask = np.array([ground_truth[val] for val in holdout_categories])
+
+            calibration_model_less_calibrated.fit(X[train_mask], y[train_mask])
+            calibration_model_more_calibrated.fit(X[np.invert(train_mask)],
+                                                  y[np.invert(train_mask)])
+
+            calibrated_holdout_confidences[holdout_mask] = calibration_model_less_calibrated.predict_proba(
+                holdout_X[holdout_mask])[:, 1]
+            calibrated_holdout_confidences[
+                np.invert(holdout_mask)] = calibration_model_more_calibrated.predict_proba(
+                holdout_X[np.invert(holdout_mask)])[:, 1]
+
+            calibrated_holdout_confidences = calibrated_holdout_confidences.tolist()
+        else:
+            raise ValueError("%s is not an implemented calibration method." % args.calibration_model)
+
+        self._holdout_calibrated_ece[idx // CALIBRATION_FREQ] = eval_ece(calibrated_holdout_confidences,
+                                                                         holdout_observations, num_bins=10)
+
+    def result(self) -> Tuple[np.ndarray, ...]:
+        """
+        :return: The same arrays as evaluate, (avg_num_agreement, mrr) for accuracy and
+            (avg_num_agreement, holdout_calibrated_ece, mrr) for calibration error.
+        """
+        if self._args.metric == 'accuracy':
+            return self._avg_num_agreement, self._mrr
+        elif self._args.metric == 'calibration_error':
+            return self._avg_num_agreement, self._holdout_calibrated_ece, self._mrr
+
+
 def evaluate(args: argparse.Namespace,
              categories: List[int],
              observations: List[bool],
@@ -134,121 +491,300 @@ def evaluate(args: argparse.Namespace,
     :return mrr: (num_samples // LOG_FREQ, ) array.
             MRR of ground truth topk at each step.
     """
-    num_samples = len(categories)
-
-    if args.metric == 'accuracy':
-        model = BetaBernoulli(num_classes, prior)
-    elif args.metric == 'calibration_error':
-        model = ClasswiseEce(num_classes, num_bins=10, pseudocount=args.pseudocount, weight=weight)
-
-    avg_num_agreement = np.zeros((num_samples // LOG_FREQ + 1,))
-    mrr = np.zeros((num_samples // LOG_FREQ + 1,))
-
-    if args.metric == 'calibration_error':
-
-        holdout_calibrated_ece = np.zeros((num_samples // CALIBRATION_FREQ + 1,))
-
-        if args.calibration_model in ['histogram_binning', 'isotonic_regression', 'bayesian_binning_quantiles',
-                                      'classwise_histogram_binning', 'two_group_histogram_binning']:
-            holdout_X = np.array(holdout_confidences)
-            holdout_X = np.array([1 - holdout_X, holdout_X]).T
-
-        elif args.calibration_model in ['platt_scaling', 'temperature_scaling']:
-            holdout_indices_array = np.array(holdout_indices, dtype=np.int)
-            holdout_X = logits[holdout_indices_array]
-
-    topk_arms = np.zeros((num_classes,), dtype=np.bool_)
-
-    for idx, (category, observation, confidence, label, index) in enumerate(
-            zip(categories, observations, confidences, labels, indices)):
-
-        if args.metric == 'accuracy':
-            model.update(category, observation)
-        elif args.metric == 'calibration_error':
-            model.update(category, observation, confidence)
-
-        if idx % LOG_FREQ == 0:
-            # select TOPK arms
-            topk_arms[:] = 0
-            metric_val = model.eval
-            if args.mode == 'min':
-                topk_indices = metric_val.argsort()[:args.topk]
-            elif args.mode == 'max':
-                topk_indices = metric_val.argsort()[-args.topk:]
-            topk_arms[topk_indices] = 1
-            # evaluation
-            avg_num_agreement[idx // LOG_FREQ] = topk_arms[ground_truth == 1].mean()
-
-            # MRR
-            mrr[idx // LOG_FREQ] = mean_reciprocal_rank(metric_val, ground_truth, args.mode)
-
-        ########RECALIBRATION#############
-        if args.metric == 'calibration_error' and idx % CALIBRATION_FREQ == 0:
-            # before calibration
-            if idx == 0:
-                holdout_calibrated_ece[idx] = eval_ece(holdout_confidences, holdout_observations, num_bins=10)
+    evaluator = TopkEvaluator(args, ground_truth, num_classes, len(categories),
+                              holdout_categories=holdout_categories,
+                              holdout_observations=holdout_observations,
+                              holdout_confidences=holdout_confidences,
+                              holdout_labels=holdout_labels,
+                              holdout_indices=holdout_indices,
+                              prior=prior,
+                              weight=weight,
+                              logits=logits)
+    for category, observation, confidence, label, index in zip(categories, observations, confidences, labels,
+                                                                indices):
+        evaluator.update(category, observation, confidence, label, index)
+    return evaluator.result()
+
+
+def evaluate_batch(args: argparse.Namespace,
+                   categories: np.ndarray,
+                   observations: np.ndarray,
+                   ground_truth: np.ndarray,
+                   num_classes: int,
+                   prior=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized version of evaluate for many runs of stored samples. Instead of replaying every run through a model,
+        the posterior MPE at every log point is built from cumulative bincounts of the sampled categories, and
+        agreement and MRR are computed for all runs and log points at once. Runs are processed in chunks of at most
+        EVAL_CHUNK_SIZE (run, log point, class) entries to bound memory.
+    Only implemented for args.metric == 'accuracy'.
+    :param categories: np.ndarray (num_runs, num_samples)
+        Sampled categories of each run.
+    :param observations: np.ndarray (num_runs, num_samples)
+        Sampled observations of each run.
+    :return avg_num_agreement: (num_runs, num_samples // LOG_FREQ + 1) array.
+            Average number of agreement between selected topk and ground truth topk at each step.
+    :return mrr: (num_runs, num_samples // LOG_FREQ + 1) array.
+            MRR of ground truth topk at each step.
+    """
+    if args.metric != 'accuracy':
+        raise ValueError("Batched evaluation is not implemented for metric %s." % args.metric)
+
+    categories = np.asarray(categories, dtype=np.int64)
+    observations = np.asarray(observations, dtype=bool)
+    ground_truth = np.asarray(ground_truth, dtype=bool)
+    if prior is None:
+        prior = np.ones((num_classes, 2)) * 0.5
+    num_runs, num_samples = categories.shape
+
+    avg_num_agreement = np.zeros((num_runs, num_samples // LOG_FREQ + 1))
+    mrr = np.zeros((num_runs, num_samples // LOG_FREQ + 1))
+
+    # the model is evaluated after the update at idx = 0, LOG_FREQ, 2 * LOG_FREQ, ..., so sample idx first shows up
+    # at log point ceil(idx / LOG_FREQ); samples after the last log point are never evaluated.
+    num_checkpoints = (num_samples - 1) // LOG_FREQ + 1
+    checkpoint = (np.arange(num_samples) + LOG_FREQ - 1) // LOG_FREQ
+    evaluated = checkpoint < num_checkpoints
+    checkpoint = checkpoint[evaluated]
+    # cell id of each sample in a flattened (checkpoint, class, observation) grid
+    cell = (checkpoint * num_classes + categories[:, evaluated]) * 2 + (~observations[:, evaluated])
+    grid_size = num_checkpoints * num_classes * 2
+
+    chunk = max(1, EVAL_CHUNK_SIZE // (num_checkpoints * num_classes))
+    for start in range(0, num_runs, chunk):
+        runs = slice(start, min(start + chunk, num_runs))
+        num_chunk_runs = runs.stop - runs.start
+        chunk_cells = cell[runs] + np.arange(num_chunk_runs)[:, np.newaxis] * grid_size
+        counts = np.bincount(chunk_cells.ravel(), minlength=num_chunk_runs * grid_size)
+        counts = np.cumsum(counts.reshape(num_chunk_runs, num_checkpoints, num_classes, 2), axis=1)
+
+        params = prior + counts
+        metric_val = params[..., 0] / (params[..., 0] + params[..., 1])
+
+        avg_num_agreement[runs, :num_checkpoints], mrr[runs, :num_checkpoints] = _topk_agreement_and_mrr(
+            args, metric_val, ground_truth)
+
+    return avg_num_agreement, mrr
+
+
+def _topk_agreement_and_mrr(args: argparse.Namespace,
+                            metric_val: np.ndarray,
+                            ground_truth: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Agreement of the selected topk classes with the ground truth and MRR, along the last axis.
+    :param metric_val: np.ndarray (..., num_classes)
+    :param ground_truth: np.ndarray (num_classes, )
+        Boolean mask of the ground truth topk classes.
+    :return: Two (..., ) arrays of average number of agreement and MRR.
+    """
+    topk_arms = np.zeros(metric_val.shape, dtype=np.bool_)
+    np.put_along_axis(topk_arms, select_topk(metric_val, args.topk, args.mode), True, axis=-1)
+    return topk_arms[..., ground_truth].mean(axis=-1), mean_reciprocal_rank_batch(metric_val, ground_truth, args.mode)
 
-            else:
-                if args.calibration_model in ['histogram_binning', 'isotonic_regression', 'bayesian_binning_quantiles']:
-                    calibration_model = CALIBRATION_MODELS[args.calibration_model]()
-                    X = np.array(confidences[:idx])
-                    X = np.array([1 - X, X]).T
-                    y = np.array(observations[:idx]) * 1
-                    calibration_model.fit(X, y)
-                    calibrated_holdout_confidences = calibration_model.predict_proba(holdout_X)[:, 1].tolist()
-
-                elif args.calibration_model in ['platt_scaling', 'temperature_scaling']:
-                    calibration_model = CALIBRATION_MODELS[args.calibration_model]()
-                    X = logits[indices[:idx]]
-                    y = np.array(labels[:idx], dtype=np.int)
-                    calibration_model.fit(X, y)
-
-                    pred_array = np.array(holdout_categories).astype(int).reshape(-1, 1)
-                    calibrated_holdout_confidences = calibration_model.predict_proba(holdout_X)
-                    calibrated_holdout_confidences = np.take_along_axis(calibrated_holdout_confidences, pred_array,
-                                                                        axis=1).squeeze().tolist()
-
-                elif args.calibration_model in ['classwise_histogram_binning']:
-                    # use the current MPE reliability diagram for calibration, no need to train a separate calibration model
-                    calibration_mapping = model.beta_params_mpe
-                    bin_idx = np.floor(np.array(holdout_confidences) * 10).astype(int)
-                    bin_idx[bin_idx == 10] = 9
-                    calibrated_holdout_confidences = calibration_mapping[holdout_categories, bin_idx].tolist()
-
-                elif args.calibration_model in ['two_group_histogram_binning']:
-
-                    calibrated_holdout_confidences = np.zeros(len(holdout_confidences))
-
-                    calibration_model_less_calibrated = CALIBRATION_MODELS['histogram_binning']()
-                    calibration_model_more_calibrated = CALIBRATION_MODELS['histogram_binning']()
-                    X = np.array(confidences[:idx])
-                    X = np.array([1 - X, X]).T
-                    y = np.array(observations[:idx]) * 1
-
-                    train_mask = np.array([ground_truth[val] for val in categories[:idx]])
-                    holdout_mask = np.array([ground_truth[val] for val in holdout_categories])
-
-                    calibration_model_less_calibrated.fit(X[train_mask], y[train_mask])
-                    calibration_model_more_calibrated.fit(X[np.invert(train_mask)],
-                                                          y[np.invert(train_mask)])
-
-                    calibrated_holdout_confidences[holdout_mask] = calibration_model_less_calibrated.predict_proba(
-                        holdout_X[holdout_mask])[:, 1]
-                    calibrated_holdout_confidences[
-                        np.invert(holdout_mask)] = calibration_model_more_calibrated.predict_proba(
-                        holdout_X[np.invert(holdout_mask)])[:, 1]
-
-                    calibrated_holdout_confidences = calibrated_holdout_confidences.tolist()
-                else:
-                    raise ValueError("%s is not an implemented calibration method." % args.calibration_model)
 
-                holdout_calibrated_ece[idx // CALIBRATION_FREQ] = eval_ece(calibrated_holdout_confidences,
-                                                                           holdout_observations, num_bins=10)
+class BatchedTopkEvaluator:
+    """
+    Online counterpart of evaluate_batch, fed by get_samples_topk_batch while it samples. Keeps a
+        BatchedBetaBernoulli per evaluation prior and evaluates every run when it reaches a checkpoint.
+    Only implemented for args.metric == 'accuracy'.
+    """
 
-    if args.metric == 'accuracy':
-        return avg_num_agreement, mrr
-    elif args.metric == 'calibration_error':
-        return avg_num_agreement, holdout_calibrated_ece, mrr
+    def __init__(self,
+                 args: argparse.Namespace,
+                 ground_truth: np.ndarray,
+                 num_classes: int,
+                 num_samples: int,
+                 num_runs: int,
+                 prior=None) -> None:
+        """
+        :param ground_truth: np.ndarray (num_classes, )
+            Boolean mask of the ground truth topk classes.
+        :param num_samples: int
+            The number of samples of every run, sets the number of checkpoints.
+        :param num_runs: int
+            The number of runs sampled in lockstep.
+        :param prior: np.ndarray (num_classes, 2) or None
+            Prior of the evaluation model, which may differ from the prior used for sampling.
+        """
+        if args.metric != 'accuracy':
+            raise ValueError("Batched evaluation is not implemented for metric %s." % args.metric)
+
+        self._args = args
+        self._ground_truth = np.asarray(ground_truth, dtype=bool)
+        self._model = BatchedBetaBernoulli(num_runs, num_classes, prior)
+        self._avg_num_agreement = np.zeros((num_runs, num_samples // LOG_FREQ + 1))
+        self._mrr = np.zeros((num_runs, num_samples // LOG_FREQ + 1))
+
+    def update(self, runs: np.ndarray, positions: np.ndarray, categories: np.ndarray,
+               observations: np.ndarray) -> None:
+        """
+        Update the models of some runs with the sample each of them just drew.
+        :param runs: np.ndarray
+            Indices of the runs, each run appears at most once.
+        :param positions: np.ndarray
+            Position of the sample in the sequence of each run.
+        :param categories: np.ndarray
+            Predicted class of the sample drawn by each run.
+        :param observations: np.ndarray
+            Whether the predicted class agrees with the true class label.
+        """
+        self._model.update_batch(runs, categories, observations)
+
+        logged = positions % LOG_FREQ == 0
+        if logged.any():
+            runs, checkpoints = runs[logged], positions[logged] // LOG_FREQ
+            metric_val = self._model.eval[runs]
+            self._avg_num_agreement[runs, checkpoints], self._mrr[runs, checkpoints] = _topk_agreement_and_mrr(
+                self._args, metric_val, self._ground_truth)
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: The same arrays as evaluate_batch, (avg_num_agreement, mrr), each of shape
+            (num_runs, num_samples // LOG_FREQ + 1).
+        """
+        return self._avg_num_agreement, self._mrr
+
+
+#########################PARALLEL RUNS##########################
+# Tasks that the drivers run on an executor.RunExecutor. They are defined at module level so that they can be pickled,
+# the driver binds the shared dataset and result buffers with functools.partial. Every task writes only the rows of its
+# own runs, so the buffers are filled without locking.
+def _shared_columns(data: SharedArrays) -> List[np.ndarray]:
+    return [data[name] for name in TOPK_COLUMN_DTYPES]
+
+
+def _holdout_kwargs(data: SharedArrays) -> Dict[str, np.ndarray]:
+    kwargs = {'holdout_' + name: data['holdout_' + name] for name in TOPK_COLUMN_DTYPES}
+    kwargs['logits'] = data['logits'] if 'logits' in data else None
+    return kwargs
+
+
+def sample_accuracy_runs(args: argparse.Namespace,
+                         data: SharedArrays,
+                         sampled: Tuple[Dict[str, SharedResultBuffer], ...],
+                         results: Tuple[Dict[str, SharedResultBuffer], ...],
+                         eval_priors: Dict[str, List[Tuple[str, np.ndarray]]],
+                         ground_truth: np.ndarray,
+                         num_classes: int,
+                         task: Tuple) -> None:
+    """
+    Sample the runs start to stop of one method in lockstep with get_samples_topk_batch, run i is seeded with i.
+    :param data: SharedArrays
+        The dataset, published with share_topk_data.
+    :param sampled: Tuple of five Dict[str, SharedResultBuffer] or None
+        Buffers of the sampled categories, observations, scores, labels and indices of each method. If None, the sampled
+        sequences are not kept.
+    :param results: Tuple of two Dict[str, SharedResultBuffer]
+        Buffers of avg_num_agreement and mrr of each evaluation method, filled if ground_truth is given.
+    :param eval_priors: Dict[str, List[Tuple[str, np.ndarray]]]
+        Evaluation methods of each sampled method and the prior of their evaluation model.
+    :param ground_truth: np.ndarray or None
+        If given, the runs are evaluated online while they are sampled.
+    :param task: Tuple
+        (method, sample_method, prior, start, stop)
+    """
+    method, sample_method, prior, start, stop = task
+    num_samples = len(data['observations'])
+    evaluators = {}
+    if ground_truth is not None:
+        evaluators = {eval_method: BatchedTopkEvaluator(args, ground_truth, num_classes, num_samples, stop - start,
+                                                        prior=eval_prior)
+                      for eval_method, eval_prior in eval_priors[method]}
+    samples = get_samples_topk_batch(args, *_shared_columns(data), num_classes, num_samples,
+                                     sample_method=sample_method, num_runs=stop - start, prior=prior,
+                                     random_seed=start, evaluators=list(evaluators.values()),
+                                     return_samples=sampled is not None)
+    if sampled is not None:
+        for buffers, sample in zip(sampled, samples):
+            buffers[method][start:stop] = sample
+    for eval_method, evaluator in evaluators.items():
+        for buffers, result in zip(results, evaluator.result()):
+            buffers[eval_method][start:stop] = result
+
+
+def evaluate_accuracy_runs(args: argparse.Namespace,
+                           sampled: Tuple[Dict[str, SharedResultBuffer], ...],
+                           results: Tuple[Dict[str, SharedResultBuffer], ...],
+                           ground_truth: np.ndarray,
+                           num_classes: int,
+                           task: Tuple) -> None:
+    """
+    Evaluate the runs start to stop of one sampled method with evaluate_batch.
+    :param sampled: Tuple of five Dict[str, SharedResultBuffer]
+        See sample_accuracy_runs.
+    :param results: Tuple of two Dict[str, SharedResultBuffer]
+        Buffers of avg_num_agreement and mrr of each evaluation method.
+    :param task: Tuple
+        (method, sampled_method, prior, start, stop)
+    """
+    method, sampled_method, prior, start, stop = task
+    sampled_categories, sampled_observations = sampled[0], sampled[1]
+    for buffers, result in zip(results, evaluate_batch(args,
+                                                       sampled_categories[sampled_method].array[start:stop],
+                                                       sampled_observations[sampled_method].array[start:stop],
+                                                       ground_truth,
+                                                       num_classes,
+                                                       prior=prior)):
+        buffers[method][start:stop] = result
+
+
+def sample_calibration_run(args: argparse.Namespace,
+                           data: SharedArrays,
+                           sampled: Tuple[Dict[str, SharedResultBuffer], ...],
+                           results: Tuple[Dict[str, SharedResultBuffer], ...],
+                           ground_truth: np.ndarray,
+                           num_classes: int,
+                           task: Tuple) -> None:
+    """
+    Sample one run of one method with get_samples_topk, seeded with the run index.
+    :param data: SharedArrays
+        The dataset and the holdout set, published with share_topk_data.
+    :param sampled: Tuple of five Dict[str, SharedResultBuffer] or None
+        See sample_accuracy_runs.
+    :param results: Tuple of three Dict[str, SharedResultBuffer]
+        Buffers of avg_num_agreement, holdout_ece and mrr of each method, filled if ground_truth is given.
+    :param ground_truth: np.ndarray or None
+        If given, the run is evaluated online while it is sampled.
+    :param task: Tuple
+        (run_idx, method, sample_method)
+    """
+    run_idx, method, sample_method = task
+    num_samples = len(data['observations'])
+    evaluator = None
+    if ground_truth is not None:
+        evaluator = TopkEvaluator(args, ground_truth, num_classes, num_samples, **_holdout_kwargs(data))
+    samples = get_samples_topk(args, *_shared_columns(data), num_classes, num_samples, sample_method=sample_method,
+                               random_seed=run_idx, evaluator=evaluator)
+    if sampled is not None:
+        for buffers, sample in zip(sampled, samples):
+            buffers[method][run_idx] = sample
+    if evaluator is not None:
+        for buffers, result in zip(results, evaluator.result()):
+            buffers[method][run_idx] = result
+
+
+def evaluate_calibration_run(args: argparse.Namespace,
+                             data: SharedArrays,
+                             sampled: Tuple[Dict[str, SharedResultBuffer], ...],
+                             results: Tuple[Dict[str, SharedResultBuffer], ...],
+                             ground_truth: np.ndarray,
+                             num_classes: int,
+                             task: Tuple) -> None:
+    """
+    Evaluate one sampled run of one method with evaluate.
+    :param data: SharedArrays
+        The dataset and the holdout set, published with share_topk_data.
+    :param sampled: Tuple of five Dict[str, SharedResultBuffer]
+        See sample_accuracy_runs.
+    :param results: Tuple of three Dict[str, SharedResultBuffer]
+        Buffers of avg_num_agreement, holdout_ece and mrr of each method.
+    :param task: Tuple
+        (run_idx, method)
+    """
+    run_idx, method = task
+    run = [buffers[method].array[run_idx].tolist() for buffers in sampled]
+    for buffers, result in zip(results, evaluate(args, *run, ground_truth, num_classes, **_holdout_kwargs(data))):
+        buffers[method][run_idx] = result
 
 
 #########################PLOT##########################
@@ -346,31 +882,29 @@ def mean_reciprocal_rank(metric_val: np.ndarray,
     return (1 / adjusted_rank).mean()
 
 
-#########################MULTIPROCESSING##########################
-class MpSafeSharedArray:
-    """Multiprocessing-safe shared array."""
-    DTYPE_TO_CTYPE = {
-        np.int: ctypes.c_long,
-        np.bool: ctypes.c_bool,
-        np.float: ctypes.c_double
-    }
-
-    def __init__(self, shape, dtype=np.float):
-        warnings.warn('MpSafeSharedArray is experimental. Use at your own risk.')
-
-        if dtype not in MpSafeSharedArray.DTYPE_TO_CTYPE:
-            raise ValueError('Unsupported dtype')
-        self._shape = shape
-        self._dtype = dtype
+def mean_reciprocal_rank_batch(metric_val: np.ndarray,
+                               ground_truth: np.ndarray,
+                               mode: str) -> np.ndarray:
+    """
+    Computes mean reciprocal rank along the last axis, see mean_reciprocal_rank.
+    :param metric_val: np.ndarray (..., num_classes)
+    :param ground_truth: np.ndarray (num_classes, )
+        Boolean mask of the ground truth topk classes.
+    :return: An (..., ) array of MRR.
+    """
+    num_classes = metric_val.shape[-1]
+    k = np.sum(ground_truth)
 
-        ctype = MpSafeSharedArray.DTYPE_TO_CTYPE[dtype]
-        num_elements = reduce(lambda x, y: x * y, shape)
-        self._mp_arr = Array(ctype, num_elements)
+    # Compute rank of each class
+    argsort = metric_val.argsort(axis=-1)
+    rank = np.empty_like(argsort)
+    np.put_along_axis(rank, argsort, np.arange(num_classes) + 1, axis=-1)
+    if mode == 'max':  # Need to flip so that largest class has rank 1
+        rank = num_classes - rank + 1
 
-    def get_lock(self):
-        return self._mp_arr.get_lock()
+    # Other ground truth classes ranked above a ground truth class are not counted, the i-th best ranked ground truth
+    # class is moved up by i.
+    raw_rank = np.sort(rank[..., ground_truth], axis=-1)
+    adjusted_rank = raw_rank - np.arange(k)
 
-    def get_array(self):
-        buffer = self._mp_arr.get_obj()
-        arr = np.ndarray(shape=self._shape, dtype=self._dtype, buffer=buffer)
-        return arr
+    return (1 / adjusted_rank).mean(axis=-1)
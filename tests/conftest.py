@@ -0,0 +1,26 @@
+import pathlib
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# the modules in src import each other by their flat names, as when the drivers are run from src
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'src'))
+
+
+@pytest.fixture
+def predictions() -> SimpleNamespace:
+    """
+    600 toy predictions of 8 classes with accuracies from 0.3 to 0.9. columns holds the categories, observations,
+    confidences, labels and indices in the order the samplers take them.
+    """
+    rng = np.random.default_rng(0)
+    num_classes, num_samples = 8, 600
+    categories = rng.integers(0, num_classes, num_samples)
+    accuracies = np.linspace(0.3, 0.9, num_classes)
+    observations = rng.random(num_samples) < accuracies[categories]
+    confidences = np.clip(accuracies[categories] + rng.normal(0, 0.1, num_samples), 0.01, 1.)
+    labels = np.where(observations, categories, (categories + 1) % num_classes)
+    return SimpleNamespace(num_classes=num_classes, num_samples=num_samples,
+                           columns=(categories, observations, confidences, labels, np.arange(num_samples)))
@@ -0,0 +1,51 @@
+"""
+Checks of the bincount binning kernel against np.digitize and the per-bin masks it replaces.
+"""
+import numpy as np
+import pytest
+
+from binning import bin_statistics, equal_width_bin_ids
+from data_utils import eval_ece
+
+
+def _reference_ece(confidences: np.ndarray, observations: np.ndarray, num_bins: int) -> float:
+    digitized = np.digitize(confidences, np.linspace(0, 1, num_bins + 1)[1:-1])
+    ece = 0.
+    for bin_idx in range(num_bins):
+        in_bin = digitized == bin_idx
+        if in_bin.any():
+            ece += in_bin.mean() * abs(confidences[in_bin].mean() - observations[in_bin].mean())
+    return ece
+
+
+@pytest.mark.parametrize('input_range', [(0., 1.), (-2., 3.)])
+@pytest.mark.parametrize('num_bins', [1, 7, 10])
+def test_equal_width_bin_ids_match_digitize(input_range, num_bins):
+    edges = np.linspace(input_range[0], input_range[1], num_bins + 1)
+    scores = np.concatenate([np.random.default_rng(0).uniform(input_range[0] - 1, input_range[1] + 1, 500), edges])
+    np.testing.assert_array_equal(equal_width_bin_ids(scores, num_bins, input_range),
+                                  np.digitize(scores, edges[1:-1]))
+
+
+def test_bin_statistics_match_masks():
+    rng = np.random.default_rng(1)
+    bin_ids = rng.integers(0, 6, 300)
+    bin_ids[bin_ids == 4] = 3  # an empty bin
+    confidences, observations = rng.random(300), rng.random(300) < 0.5
+    counts, confidence_sums, accuracy_sums = bin_statistics(bin_ids, confidences, observations, 6)
+    for bin_idx in range(6):
+        in_bin = bin_ids == bin_idx
+        assert counts[bin_idx] == in_bin.sum()
+        assert confidence_sums[bin_idx] == pytest.approx(confidences[in_bin].sum())
+        assert accuracy_sums[bin_idx] == observations[in_bin].sum()
+
+
+@pytest.mark.parametrize('num_bins', [5, 10, 15])
+def test_eval_ece_matches_per_bin_loop(predictions, num_bins):
+    _, observations, confidences = predictions.columns[:3]
+    confidences = np.concatenate([confidences, [0., 1., 0.5]])
+    observations = np.concatenate([observations, [False, True, True]])
+    assert eval_ece(confidences, observations, num_bins) == pytest.approx(
+        _reference_ece(confidences, observations * 1., num_bins), rel=1e-12)
+    assert eval_ece(confidences.tolist(), observations.tolist(), num_bins) == eval_ece(confidences, observations,
+                                                                                       num_bins)
@@ -0,0 +1,93 @@
+"""
+Checks of the keys and the eviction of the on-disk cache of derived data.
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _counting(value):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value
+
+    return compute, calls
+
+
+def test_content_key_depends_on_the_content():
+    values = np.arange(5)
+    key = cache.content_key('f', values, 'accuracy', 3)
+    assert cache.content_key('f', values.tolist(), 'accuracy', 3) == key
+    assert cache.content_key('f', values.copy(), 'accuracy', 3) == key
+    for other in [cache.content_key('g', values, 'accuracy', 3),
+                  cache.content_key('f', values[::-1], 'accuracy', 3),
+                  cache.content_key('f', values.astype(np.int32), 'accuracy', 3),
+                  cache.content_key('f', values.reshape(5, 1), 'accuracy', 3),
+                  cache.content_key('f', values, 'calibration_error', 3),
+                  cache.content_key('f', values, 'accuracy', 4)]:
+        assert other != key
+
+
+def test_cached_computes_once(cache_dir):
+    compute, calls = _counting([1, 2])
+    assert cache.cached('key', compute) == [1, 2]
+    assert cache.cached('key', compute) == [1, 2]
+    assert len(calls) == 1
+    assert [path.name for path in cache_dir.iterdir()] == ['key.pkl']
+
+
+def test_cache_is_off_without_a_directory(monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', '')
+    compute, calls = _counting(1)
+    cache.cached('key', compute)
+    cache.cached('key', compute)
+    assert len(calls) == 2
+
+
+def test_failed_writes_leave_no_file(cache_dir):
+    with pytest.raises(Exception):
+        cache.cached('key', lambda: lambda: None)
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_disk_cached_keys_by_arguments_with_defaults(cache_dir):
+    calls = []
+
+    @cache.disk_cached
+    def scale(values, factor=2):
+        calls.append(factor)
+        return np.asarray(values) * factor
+
+    np.testing.assert_array_equal(scale([1, 2]), [2, 4])
+    np.testing.assert_array_equal(scale(np.array([1, 2]), factor=2), [2, 4])
+    np.testing.assert_array_equal(scale([1, 2], 3), [3, 6])
+    assert calls == [2, 3]
+
+
+def test_least_recently_used_entries_are_evicted(cache_dir, monkeypatch):
+    value = bytes(1000)
+    cache.cached('a', lambda: value)
+    cache.cached('b', lambda: value)
+    entry_size = (cache_dir / 'a.pkl').stat().st_size
+    monkeypatch.setattr(cache, 'CACHE_SIZE_LIMIT', int(2.5 * entry_size))
+    now = time.time()
+    os.utime(cache_dir / 'a.pkl', (now - 200, now - 200))
+    os.utime(cache_dir / 'b.pkl', (now - 100, now - 100))
+    # reading an entry marks it as used
+    compute, calls = _counting(value)
+    cache.cached('a', compute)
+    assert not calls
+    cache.cached('c', lambda: value)
+    assert sorted(path.name for path in cache_dir.iterdir()) == ['a.pkl', 'c.pkl']
@@ -0,0 +1,103 @@
+"""
+Checks of the incremental and vectorized calibration methods against a full fit and the per-binning loops they replace.
+"""
+import numpy as np
+import pytest
+import scipy.special
+import scipy.stats
+
+
+def _binary_data(seed: int = 0, num_samples: int = 600):
+    rng = np.random.default_rng(seed)
+    p = rng.random(num_samples)
+    y = (rng.random(num_samples) < p ** 2).astype(int)
+    return np.stack([1 - p, p], axis=1), y
+
+
+def _logit_data(seed: int = 0, num_samples: int = 600, num_classes: int = 5):
+    rng = np.random.default_rng(seed)
+    logits = rng.normal(size=(num_samples, num_classes)) * 3
+    y = np.where(rng.random(num_samples) < 0.6, logits.argmax(axis=1), rng.integers(0, num_classes, num_samples))
+    return logits, y
+
+
+@pytest.mark.parametrize('name', ['histogram_binning', 'isotonic_regression', 'bayesian_binning_quantiles'])
+def test_partial_fit_matches_fit(name):
+    calibration = pytest.importorskip('calibration')
+    X, y = _binary_data()
+    incremental = calibration.CALIBRATION_MODELS[name]()
+    for stop in range(100, 700, 100):
+        incremental.partial_fit(X[stop - 100:stop], y[stop - 100:stop])
+        refit = calibration.CALIBRATION_MODELS[name]().fit(X[:stop], y[:stop])
+        np.testing.assert_allclose(incremental.predict_proba(X), refit.predict_proba(X), atol=1e-6)
+
+
+def test_temperature_scaling_objective_and_gradient():
+    calibration = pytest.importorskip('calibration')
+    logits, y = _logit_data()
+    model = calibration.TemperatureScaling().fit(logits, y)
+    for T in [0.3, 1., 4.]:
+        nll, grad = model._objective_and_gradient(np.array([T]))
+        expected = -np.sum(scipy.special.log_softmax(logits / T, axis=1)[np.arange(len(y)), y])
+        np.testing.assert_allclose(nll, expected, rtol=1e-12)
+        step = 1e-6 * T
+        numeric = (model._objective_and_gradient(np.array([T + step]))[0] -
+                   model._objective_and_gradient(np.array([T - step]))[0]) / (2 * step)
+        np.testing.assert_allclose(grad[0], numeric, rtol=1e-5)
+
+
+def test_temperature_scaling_partial_fit_matches_fit():
+    calibration = pytest.importorskip('calibration')
+    logits, y = _logit_data()
+    incremental = calibration.TemperatureScaling()
+    for stop in range(100, 700, 100):
+        incremental.partial_fit(logits[stop - 100:stop], y[stop - 100:stop])
+        refit = calibration.TemperatureScaling().fit(logits[:stop], y[:stop])
+        assert incremental.T == pytest.approx(refit.T, rel=1e-5)
+        np.testing.assert_allclose(incremental.predict_proba(logits), refit.predict_proba(logits), atol=1e-5)
+
+
+def test_warm_started_platt_scaling_matches_cold_fits():
+    calibration = pytest.importorskip('calibration')
+    logits, y = _logit_data()
+    probabilities = scipy.special.softmax(logits, axis=1)
+    warm = calibration.PlattScaling(warm_start=True)
+    for stop in range(200, 700, 200):
+        warm.fit(probabilities[:stop], y[:stop])
+        cold = calibration.PlattScaling().fit(probabilities[:stop], y[:stop])
+        np.testing.assert_allclose(warm.predict_proba(probabilities), cold.predict_proba(probabilities), atol=1e-3)
+
+
+def test_bayesian_binning_quantiles_matches_per_binning_loop():
+    calibration = pytest.importorskip('calibration')
+    X, y = _binary_data(seed=1, num_samples=500)
+    model = calibration.BayesianBinningQuantiles().fit(X, y)
+    # every binning model scored on its own, with np.histogram and np.digitize
+    expected_scores = [model._binning_model_logscore(X[:, 1], y, binning) for binning in model.binnings]
+    np.testing.assert_allclose(model.log_scores, expected_scores, rtol=1e-10)
+    for binning, prob_class_1 in zip(model.binnings, model.prob_class_1):
+        bin_ids = np.minimum(np.digitize(X[:, 1], bins=binning), len(binning) - 1) - 1
+        counts = np.bincount(bin_ids, minlength=len(binning) - 1)
+        positives = np.bincount(bin_ids, weights=y, minlength=len(binning) - 1)
+        nonempty = counts > 0
+        np.testing.assert_allclose(prob_class_1[nonempty], positives[nonempty] / counts[nonempty], rtol=1e-12)
+
+    scores = np.concatenate([np.linspace(-0.1, 1.1, 50), model.binnings[-1], X[:50, 1]])
+    weights = np.exp(np.array(expected_scores) - scipy.special.logsumexp(expected_scores))
+    expected = np.zeros(len(scores))
+    for weight, binning, prob_class_1 in zip(weights, model.binnings, model.prob_class_1):
+        bin_ids = np.clip(np.searchsorted(binning, scores), 0, len(binning) - 1)
+        # scores at the lower edge get bin -1, i.e. the last bin
+        expected += weight * prob_class_1[bin_ids - 1]
+    np.testing.assert_allclose(model.predict_proba(np.stack([1 - scores, scores], axis=1))[:, 1], expected,
+                               rtol=1e-12)
+
+
+def test_histogram_binning_matches_binned_statistic():
+    calibration = pytest.importorskip('calibration')
+    X, y = _binary_data(seed=2)
+    X = np.concatenate([X, [[1.2, -0.2], [0., 1.], [0.5, 0.5]]])
+    y = np.concatenate([y, [1, 1, 0]])
+    model = calibration.HistogramBinning(n_bins=15).fit(X, y)
+    expected = scipy.stats.binned_statistic(X[:, 1], y, statistic='mean', bins=15, range=[0, 1]).statistic
+    np.testing.assert_allclose(model.prob_class_1, expected, rtol=1e-12)
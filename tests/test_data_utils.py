@@ -0,0 +1,101 @@
+"""
+Checks of the prediction file parser and of the binary columnar store against np.genfromtxt.
+"""
+import numpy as np
+import pytest
+
+import data_utils
+
+
+@pytest.fixture
+def predictions_file(tmp_path):
+    """A text file of 50 rows "correct_class score_0 ... score_5" and its columns parsed with np.genfromtxt."""
+    rng = np.random.default_rng(0)
+    scores = rng.dirichlet(np.ones(6), 50)
+    labels = rng.integers(0, 6, 50)
+    filename = tmp_path / 'predictions.txt'
+    with open(filename, 'w') as f:
+        for label, row in zip(labels, scores):
+            f.write('%d %s\n' % (label, ' '.join(repr(float(score)) for score in row)))
+    data = np.genfromtxt(filename)
+    columns = {'labels': data[:, 0].astype(np.int64), 'categories': np.argmax(data[:, 1:], axis=1),
+               'confidences': np.max(data[:, 1:], axis=1), 'scores': data[:, 1:]}
+    return filename, columns
+
+
+def _assert_columns_equal(columns, expected):
+    assert sorted(columns) == sorted(expected)
+    for name in expected:
+        np.testing.assert_array_equal(columns[name], expected[name])
+
+
+def test_binary_columns_round_trip(predictions_file):
+    filename, expected = predictions_file
+    assert data_utils.load_binary(filename) == {}
+    directory = data_utils.convert_to_binary(filename)
+    assert directory == filename.with_suffix('.columns')
+    columns = data_utils.load_binary(filename)
+    assert all(isinstance(column, np.memmap) for column in columns.values())
+    _assert_columns_equal(columns, expected)
+    _assert_columns_equal(data_utils.load_columns(filename), expected)
+    labels, scores = data_utils.load_scores(filename)
+    np.testing.assert_array_equal(labels, expected['labels'])
+    np.testing.assert_array_equal(scores, expected['scores'])
+
+    categories, observations, confidences, _, _, labels = data_utils.prepare_data(str(filename))
+    np.testing.assert_array_equal(categories, expected['categories'])
+    np.testing.assert_array_equal(observations, expected['categories'] == expected['labels'])
+    np.testing.assert_array_equal(confidences, expected['confidences'])
+    np.testing.assert_array_equal(labels, expected['labels'])
+
+
+def test_columns_without_scores_fall_back_to_the_text_file(predictions_file, monkeypatch):
+    filename, expected = predictions_file
+    data_utils.convert_to_binary(filename, store_scores=False)
+    assert 'scores' not in data_utils.load_binary(filename)
+    parsed = []
+    read_predictions_text = data_utils.read_predictions_text
+
+    def counting_read(*args, **kwargs):
+        parsed.append(args)
+        return read_predictions_text(*args, **kwargs)
+
+    monkeypatch.setattr(data_utils, 'read_predictions_text', counting_read)
+    assert 'scores' not in data_utils.load_columns(filename, store_scores=False)
+    assert not parsed
+    _assert_columns_equal(data_utils.load_columns(filename), expected)
+    assert len(parsed) == 1
+
+
+def test_preloaded_columns(predictions_file):
+    filename, expected = predictions_file
+    data_utils.preload_columns(filename)
+    try:
+        filename.unlink()
+        _assert_columns_equal(data_utils.load_columns(filename), expected)
+    finally:
+        data_utils.release_columns(filename)
+    with pytest.raises(OSError):
+        data_utils.load_columns(filename)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 50, 4096])
+def test_chunked_parser_matches_genfromtxt(predictions_file, chunksize):
+    filename, expected = predictions_file
+    _assert_columns_equal(data_utils.read_predictions_text(filename, chunksize=chunksize), expected)
+    del expected['scores']
+    _assert_columns_equal(data_utils.read_predictions_text(filename, store_scores=False, chunksize=chunksize),
+                          expected)
+
+
+def test_parser_reads_any_float_format(tmp_path):
+    filename = tmp_path / 'logits.txt'
+    filename.write_text('3 1e-3\t-2.5E+01  7.000000000000001 0.1\n'
+                        '\n'
+                        '0 .5 -0 1.7976931348623157e308 2.2250738585072014e-308   \n')
+    data = np.genfromtxt(filename)
+    columns = data_utils.read_predictions_text(filename, chunksize=1)
+    np.testing.assert_array_equal(columns['labels'], [3, 0])
+    np.testing.assert_array_equal(columns['categories'], [2, 2])
+    np.testing.assert_array_equal(columns['scores'], data[:, 1:])
+    np.testing.assert_array_equal(columns['confidences'], data[:, 1:].max(axis=1))
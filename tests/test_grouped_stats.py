@@ -0,0 +1,44 @@
+"""
+Checks of the one-pass classwise statistics against filtering the samples of each class.
+"""
+import numpy as np
+import pytest
+
+from data_utils import eval_ece, get_accuracy_k, get_confidence_k, get_ece_k
+from grouped_stats import grouped_bin_statistics
+
+
+@pytest.fixture
+def samples(predictions):
+    """The toy predictions with one more class that has no samples."""
+    categories, observations, confidences = predictions.columns[:3]
+    return categories, observations, confidences, predictions.num_classes + 1
+
+
+def test_grouped_bin_statistics_match_masks(samples):
+    categories, observations, confidences, num_classes = samples
+    counts, confidence_sums, accuracy_sums = grouped_bin_statistics(categories, observations, confidences,
+                                                                    num_classes, num_bins=5)
+    assert counts.shape == confidence_sums.shape == accuracy_sums.shape == (num_classes, 5)
+    bin_ids = np.digitize(confidences, np.linspace(0, 1, 6)[1:-1])
+    for category in range(num_classes):
+        for bin_idx in range(5):
+            cell = (categories == category) & (bin_ids == bin_idx)
+            assert counts[category, bin_idx] == cell.sum()
+            assert confidence_sums[category, bin_idx] == pytest.approx(confidences[cell].sum())
+            assert accuracy_sums[category, bin_idx] == observations[cell].sum()
+
+
+def test_classwise_statistics_match_per_class_filtering(samples):
+    categories, observations, confidences, num_classes = samples
+    accuracy_k = get_accuracy_k(categories, observations, num_classes)
+    confidence_k = get_confidence_k(categories, confidences, num_classes)
+    ece_k = get_ece_k(categories, observations, confidences, num_classes, num_bins=10)
+    # classes without samples get NaN
+    assert np.isnan(accuracy_k[-1]) and np.isnan(confidence_k[-1]) and np.isnan(ece_k[-1])
+    for category in range(num_classes - 1):
+        selected = categories == category
+        assert accuracy_k[category] == pytest.approx(observations[selected].mean(), rel=1e-12)
+        assert confidence_k[category] == pytest.approx(confidences[selected].mean(), rel=1e-12)
+        assert ece_k[category] == pytest.approx(eval_ece(confidences[selected], observations[selected], 10),
+                                                rel=1e-12)
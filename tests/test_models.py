@@ -0,0 +1,177 @@
+"""
+Checks of the closed-form, cached and vectorized computations of the assessment models against scipy.stats and the
+per-sample updates they replace.
+"""
+import numpy as np
+import pytest
+import scipy.stats
+
+from models import BetaBernoulli, ClasswiseEce, DirichletMultinomialCost, SumOfBetaEce, _abs_shifted_beta_moments
+
+# update rounds the counts, which start at 0.0001, and the running mean of the scores in each bin once per sample,
+# update_batch adds the counts of a batch at once and divides one sum of the scores, so the two differ by a few units in
+# the last place
+MAX_ULP = 8
+
+
+def _updated_beta_bernoulli(rng: np.random.Generator) -> BetaBernoulli:
+    model = BetaBernoulli(6, prior=np.stack([np.linspace(0.5, 3, 6), np.full(6, 2.)], axis=1))
+    model.update_batch(rng.integers(0, 5, 40), rng.random(40) < 0.6)
+    model.update(1, True)
+    model.update(2, False)
+    return model
+
+
+def test_beta_bernoulli_moments_match_scipy():
+    model = _updated_beta_bernoulli(np.random.default_rng(0))
+    alpha, beta = model.get_params().T
+    np.testing.assert_allclose(model.eval, scipy.stats.beta.mean(alpha, beta), rtol=1e-12)
+    np.testing.assert_allclose(model.variance, scipy.stats.beta.var(alpha, beta), rtol=1e-12)
+    np.testing.assert_allclose(model.quantile(0.3), scipy.stats.beta.ppf(0.3, alpha, beta), rtol=1e-10)
+    interval = np.stack(scipy.stats.beta.interval(0.9, alpha, beta), axis=1)
+    np.testing.assert_allclose(model.credible_interval(0.9), interval, rtol=1e-10)
+
+
+def test_beta_bernoulli_moments_are_copies():
+    model = BetaBernoulli(3)
+    mean, variance = model.eval, model.variance
+    mean[1] = variance[1] = 7.
+    model.update(0, True)
+    np.testing.assert_array_equal(mean, [0.5, 7., 0.5])
+    np.testing.assert_array_equal(variance, [0.125, 7., 0.125])
+    assert model.eval[0] == 0.75 and model.eval[1] == 0.5
+
+
+def test_beta_bernoulli_update_batch_matches_update(predictions):
+    categories, observations = predictions.columns[:2]
+    sequential, batch = BetaBernoulli(predictions.num_classes), BetaBernoulli(predictions.num_classes)
+    for category, observation in zip(categories, observations):
+        sequential.update(category, observation)
+    batch.update_batch(categories[:250], observations[:250])
+    batch.update_batch(categories[250:], observations[250:])
+    np.testing.assert_array_equal(batch.get_params(), sequential.get_params())
+    np.testing.assert_array_equal(batch.eval, sequential.eval)
+    np.testing.assert_array_equal(batch.variance, sequential.variance)
+
+
+def test_sum_of_beta_ece_update_batch_matches_update(predictions):
+    _, observations, confidences = predictions.columns[:3]
+    confidences = confidences.copy()
+    confidences[:3] = 1.
+    sequential = SumOfBetaEce(10, variance_estimator='analytic')
+    batch = SumOfBetaEce(10, variance_estimator='analytic')
+    for score, observation in zip(confidences, observations):
+        sequential.update(score, observation)
+    batch.update_batch(confidences[:250], observations[:250])
+    batch.update_batch(confidences[250:], observations[250:])
+    np.testing.assert_array_equal(batch.get_params(), sequential.get_params())
+    np.testing.assert_array_max_ulp(batch.counts_per_bin, sequential.counts_per_bin, maxulp=MAX_ULP)
+    np.testing.assert_array_max_ulp(batch._confidence, sequential._confidence, maxulp=MAX_ULP)
+    np.testing.assert_allclose(batch.eval, sequential.eval, rtol=1e-13)
+    np.testing.assert_allclose(batch.variance, sequential.variance, rtol=1e-12)
+
+
+def test_classwise_ece_update_batch_matches_update(predictions):
+    categories, observations, confidences = predictions.columns[:3]
+    sequential = ClasswiseEce(predictions.num_classes, 10, pseudocount=3, variance_estimator='analytic')
+    batch = ClasswiseEce(predictions.num_classes, 10, pseudocount=3, variance_estimator='analytic')
+    for category, observation, score in zip(categories, observations, confidences):
+        sequential.update(category, observation, score)
+    batch.update_batch(categories[:250], observations[:250], confidences[:250])
+    batch.update_batch(categories[250:], observations[250:], confidences[250:])
+    np.testing.assert_array_equal(batch.beta_params_mpe, sequential.beta_params_mpe)
+    np.testing.assert_array_max_ulp(batch._counts, sequential._counts, maxulp=MAX_ULP)
+    np.testing.assert_array_max_ulp(batch._confidence, sequential._confidence, maxulp=MAX_ULP)
+    np.testing.assert_allclose(batch.eval, sequential.eval, rtol=1e-13)
+    np.testing.assert_allclose(batch.variance, sequential.variance, rtol=1e-12)
+
+
+def test_classwise_ece_matches_sum_of_beta_ece_per_class(predictions):
+    categories, observations, confidences = predictions.columns[:3]
+    num_classes = predictions.num_classes
+    weight = [None if category % 2 else np.full(10, 0.1) for category in range(num_classes)]
+    classwise = ClasswiseEce(num_classes, 10, pseudocount=2, weight=weight, variance_estimator='analytic',
+                             rng=np.random.default_rng(4))
+    classwise.update_batch(categories, observations, confidences)
+    samples = classwise.sample(5)
+    assert samples.shape == (num_classes, 5)
+    # the classes are sampled in order from the same stream
+    rng = np.random.default_rng(4)
+    for category in range(num_classes):
+        selected = categories == category
+        model = SumOfBetaEce(10, weight=weight[category], pseudocount=2, variance_estimator='analytic', rng=rng)
+        model.update_batch(confidences[selected], observations[selected])
+        np.testing.assert_allclose(classwise.eval[category], model.eval, rtol=1e-12)
+        np.testing.assert_allclose(classwise.frequentist_eval[category], model.frequentist_eval, rtol=1e-12)
+        np.testing.assert_allclose(classwise.variance[category], model.variance, rtol=1e-12)
+        np.testing.assert_allclose(classwise.beta_params_mpe[category], model.beta_params_mpe, rtol=1e-12)
+        np.testing.assert_allclose(samples[category], model.sample(5), rtol=1e-12)
+
+
+def test_abs_shifted_beta_moments_match_integration():
+    alpha = np.array([0.3, 1., 2.5, 40., 7.])
+    beta = np.array([0.8, 1., 6., 3., 7.])
+    shift = np.array([0.05, 0.5, 0.95, 0.9, 0.])
+    mean, variance = _abs_shifted_beta_moments(alpha, beta, shift)
+    for a, b, c, m, v in zip(alpha, beta, shift, mean, variance):
+        distribution = scipy.stats.beta(a, b)
+        expected_mean = distribution.expect(lambda theta: abs(theta - c), points=[c])
+        expected_square = distribution.expect(lambda theta: (theta - c) ** 2)
+        np.testing.assert_allclose(m, expected_mean, rtol=1e-7)
+        np.testing.assert_allclose(v, expected_square - expected_mean ** 2, rtol=1e-6)
+
+
+def test_sampled_ece_variance_matches_analytic(predictions, monkeypatch):
+    _, observations, confidences = predictions.columns[:3]
+    monkeypatch.setattr(SumOfBetaEce, 'NUM_VARIANCE_SAMPLES', 20000)
+    sampled = SumOfBetaEce(10, rng=np.random.default_rng(6))
+    analytic = SumOfBetaEce(10, variance_estimator='analytic')
+    for model in [sampled, analytic]:
+        model.update_batch(confidences[:60], observations[:60])
+    np.testing.assert_allclose(sampled.variance, analytic.variance, rtol=0.05)
+
+    # the samples are only redrawn for the bins updated since the last call
+    buffer = sampled._theta_buffer.copy()
+    assert sampled.variance == sampled.variance
+    sampled.update(0.55, True)
+    sampled.variance  # redraws the updated bin
+    changed = np.any(sampled._theta_buffer != buffer, axis=0)
+    np.testing.assert_array_equal(changed, np.arange(10) == 5)
+
+
+def _cost_model(rng: np.random.Generator = None) -> DirichletMultinomialCost:
+    alphas = np.random.default_rng(7).uniform(0.5, 3., (4, 4))
+    costs = 1 - np.eye(4) + np.arange(4)[:, np.newaxis]
+    return DirichletMultinomialCost(alphas, costs, rng=rng)
+
+
+def test_dirichlet_samples_match_the_posterior():
+    model = _cost_model(np.random.default_rng(8))
+    assert model.sample_confusion().shape == (4, 4)
+    assert model.sample().shape == (4,)
+    confusion = model.sample_confusion(20000)
+    assert confusion.shape == (20000, 4, 4)
+    np.testing.assert_allclose(confusion.sum(axis=-1), 1.)
+    alphas = model._alphas
+    np.testing.assert_allclose(confusion.mean(axis=0), alphas / alphas.sum(axis=1, keepdims=True), atol=0.01)
+    # the Dirichlet variance of each entry
+    row_sums = alphas.sum(axis=1, keepdims=True)
+    expected_variance = alphas * (row_sums - alphas) / (row_sums ** 2 * (row_sums + 1))
+    np.testing.assert_allclose(confusion.var(axis=0), expected_variance, rtol=0.1)
+
+    # expected costs are the row-wise dot products of the same draws with the cost matrix
+    expected = np.einsum('sij,ij->si', _cost_model(np.random.default_rng(9)).sample_confusion(3), model._costs)
+    np.testing.assert_allclose(_cost_model(np.random.default_rng(9)).sample(3), expected)
+
+
+def test_dirichlet_cost_caches_match_recomputed_moments():
+    model = _cost_model()
+    rng = np.random.default_rng(10)
+    for predicted_class, true_class in rng.integers(0, 4, (50, 2)):
+        model.update(predicted_class, true_class)
+    alphas, costs = model._alphas, model._costs
+    confusion = alphas / alphas.sum(axis=1, keepdims=True)
+    np.testing.assert_allclose(model.mpe(), (confusion * costs).sum(axis=1), rtol=1e-12)
+    np.testing.assert_allclose(model.confusion_matrix(), confusion, rtol=1e-12)
+    with pytest.raises(ValueError):
+        model.confusion_matrix()[0, 0] = 1.
@@ -0,0 +1,52 @@
+"""
+Checks of select_topk against a stable ascending sort of the values.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from ranking import select_topk
+
+
+def _reference_topk(row: np.ndarray, mask: np.ndarray, topk: int, mode: str) -> list:
+    """The topk classes, best first, of a stable ascending sort with NaN after all numbers and masked classes last."""
+    def key(idx):
+        tie = idx if mode == 'min' else -idx
+        if not mask[idx]:
+            return 2, 0., tie
+        if math.isnan(row[idx]):
+            return (1 if mode == 'min' else 0), 0., tie
+        return (0 if mode == 'min' else 1), (row[idx] if mode == 'min' else -row[idx]), tie
+
+    return sorted(range(len(row)), key=key)[:topk]
+
+
+@pytest.mark.parametrize('mode', ['min', 'max'])
+@pytest.mark.parametrize('topk', [1, 2, 5, 12, 15])
+def test_select_topk_matches_stable_argsort(mode, topk):
+    rng = np.random.default_rng(3)
+    values = rng.integers(-2, 3, (200, 12)).astype(float)
+    special = rng.random(values.shape)
+    values[special < 0.05] = -0.
+    values[(special >= 0.05) & (special < 0.1)] = np.nan
+    values[(special >= 0.1) & (special < 0.13)] = np.inf
+    values[(special >= 0.13) & (special < 0.16)] = -np.inf
+    mask = rng.random(values.shape) < 0.7
+
+    selected = select_topk(values, topk, mode, mask=mask, sort=True)
+    for row, row_mask, row_selected in zip(values, mask, selected):
+        assert row_selected.tolist() == _reference_topk(row, row_mask, topk, mode)
+
+    # without a mask, the selection is the one of np.argsort for the rows without NaN
+    finite = ~np.isnan(values).any(axis=1)
+    expected = np.argsort(values[finite], axis=1, kind='stable')
+    expected = expected[:, :topk] if mode == 'min' else expected[:, ::-1][:, :topk]
+    np.testing.assert_array_equal(select_topk(values[finite], topk, mode, sort=True), expected)
+    unsorted = select_topk(values[finite], topk, mode)
+    np.testing.assert_array_equal(np.sort(unsorted, axis=1), np.sort(expected, axis=1))
+
+
+def test_select_topk_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        select_topk(np.zeros(3), 1, 'mean')
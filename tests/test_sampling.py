@@ -0,0 +1,85 @@
+"""
+Checks of the class pools and of the sampling policies against the straightforward implementations they replace.
+"""
+import argparse
+
+import numpy as np
+import pytest
+
+from sampling import BATCH_SAMPLE_CATEGORY, SAMPLE_CATEGORY, CandidateMask, ClassPool
+
+
+def test_candidate_mask():
+    candidates = CandidateMask([True, False, True, True])
+    assert len(candidates) == 3
+    assert 0 in candidates and 1 not in candidates
+    candidates.remove(2)
+    candidates.remove(2)
+    candidates.remove(1)
+    assert len(candidates) == 2
+    np.testing.assert_array_equal(candidates.mask, [True, False, False, True])
+    with pytest.raises(ValueError):
+        candidates.mask[0] = False
+
+
+def test_class_pool_tracks_the_nonempty_classes():
+    pool = ClassPool([1, 1, 3], num_classes=4)
+    assert len(pool.candidates) == 2
+    pool.pop(1)
+    assert 1 in pool.candidates
+    pool.pop(1)
+    assert 1 not in pool.candidates and len(pool.candidates) == 1
+    np.testing.assert_array_equal(pool.nonempty, [False, False, False, True])
+
+
+def test_class_pool_pops_like_lists():
+    categories = [2, 0, 2, 3, 0, 2]
+    pool = ClassPool(categories, num_classes=5)
+    lists = [[idx for idx, category in enumerate(categories) if category == c] for c in range(5)]
+    assert len(pool) == 6
+    np.testing.assert_array_equal(pool.offsets, [0, 2, 2, 5, 6, 6])
+    np.testing.assert_array_equal(pool.nonempty, [True, False, True, True, False])
+    for category in [2, 0, 2, 3, 2, 0]:
+        assert not pool.is_empty(category)
+        assert pool.pop(category) == lists[category].pop(0)
+        assert pool.is_empty(category) == (not lists[category])
+    assert len(pool) == 0 and not pool.nonempty.any()
+    with pytest.raises(IndexError):
+        pool.pop(2)
+
+
+def test_class_pool_permutations():
+    categories = np.random.default_rng(1).integers(0, 6, 200)
+    pool = ClassPool(categories, num_classes=6)
+    permutations = pool.permutations(3, np.random.default_rng(2))
+    assert permutations.shape == (3, 200)
+    for permutation in permutations:
+        # every row holds each sample once, grouped by class as laid out by the offsets
+        np.testing.assert_array_equal(np.sort(permutation), np.arange(200))
+        np.testing.assert_array_equal(categories[permutation], np.sort(categories))
+    assert not np.array_equal(permutations[0], permutations[1])
+    np.testing.assert_array_equal(permutations, pool.permutations(3, np.random.default_rng(2)))
+
+    pool.pop(0)
+    pool.shuffle(np.random.default_rng(2))
+    assert len(pool) == 200
+    popped = [pool.pop(0) for _ in range(np.sum(categories == 0))]
+    np.testing.assert_array_equal(popped, permutations[0, :len(popped)])
+
+
+@pytest.mark.parametrize('sample_method', list(SAMPLE_CATEGORY))
+@pytest.mark.parametrize('mode', ['min', 'max'])
+@pytest.mark.parametrize('topk', [1, 3])
+def test_batched_engine_matches_sequential_runs(predictions, sample_method, mode, topk):
+    utils = pytest.importorskip('utils')
+    assert set(BATCH_SAMPLE_CATEGORY) == set(SAMPLE_CATEGORY)
+    args = argparse.Namespace(metric='accuracy', mode=mode, topk=topk)
+    prior = np.ones((predictions.num_classes, 2))
+    batch = utils.get_samples_topk_batch(args, *predictions.columns, predictions.num_classes, predictions.num_samples,
+                                         sample_method, 4, prior=prior, random_seed=5)
+    for run in range(4):
+        # a run gives the same samples whichever engine simulates it
+        samples = utils.get_samples_topk(args, *predictions.columns, predictions.num_classes, predictions.num_samples,
+                                         sample_method, prior=prior, random_seed=5 + run)
+        np.testing.assert_array_equal(batch[0][run], samples[0])
+        np.testing.assert_array_equal(batch[1][run], samples[1])
@@ -0,0 +1,99 @@
+"""
+Checks of the expansion of experiment matrices and of the order in which jobs are run under a CPU and memory budget.
+"""
+import json
+import time
+
+import pytest
+
+scheduler = pytest.importorskip('scheduler')
+
+
+class _RecordingJob(scheduler.Job):
+    """A job that records when it runs instead of running a driver."""
+
+    def __init__(self, name: str, cost: float, processes: int, memory: int, log_dir, fail: bool = False) -> None:
+        self._name, self._cost, self._processes, self._memory = name, cost, processes, memory
+        self._log_dir = log_dir
+        self._fail = fail
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def cost(self) -> float:
+        return self._cost
+
+    @property
+    def processes(self) -> int:
+        return self._processes
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def files(self):
+        return []
+
+    def run(self) -> None:
+        start = time.time()
+        time.sleep(0.2)
+        (self._log_dir / self._name).write_text('%r %r' % (start, time.time()))
+        if self._fail:
+            raise RuntimeError('failed on purpose')
+
+
+def test_load_matrix_expands_blocks(tmp_path):
+    block = {'policy': ['ts', 'ttts'], 'dataset': 'cifar100', 'metric': 'accuracy', 'mode': ['min', 'max'],
+             'topk': 1, 'pseudocount': [2, 10, 100]}
+    # the second block repeats one job of the first
+    duplicate = {'policy': 'ts', 'dataset': 'cifar100', 'metric': 'accuracy', 'mode': 'min', 'topk': 1,
+                 'pseudocount': 2}
+    other = dict(duplicate, dataset='svhn', processes=2)
+    filename = tmp_path / 'matrix.json'
+    filename.write_text(json.dumps([block, duplicate, other]))
+
+    jobs = scheduler.load_matrix(filename, processes=3)
+    assert len(jobs) == 2 * 2 * 3 + 1
+    assert len({job.name for job in jobs}) == len(jobs)
+    assert sorted((job.options['policy'], job.options['mode'], job.options['pseudocount']) for job in jobs[:12]) == \
+        sorted((policy, mode, pseudocount) for policy in ['ts', 'ttts'] for mode in ['min', 'max']
+               for pseudocount in [2, 10, 100])
+    assert [job.processes for job in jobs] == [3] * 12 + [2]
+    assert jobs[-1].options['dataset'] == 'svhn'
+
+
+@pytest.mark.parametrize('block', [{'policy': 'ts', 'dataset': 'cifar100'},
+                                   {'policy': 'ts', 'dataset': 'cifar100', 'metric': 'accuracy', 'mode': 'min',
+                                    'topk': 1, 'pseudocount': 2, 'runs': 10},
+                                   {'policy': 'greedy', 'dataset': 'cifar100', 'metric': 'accuracy', 'mode': 'min',
+                                    'topk': 1, 'pseudocount': 2}])
+def test_load_matrix_rejects_invalid_blocks(tmp_path, block):
+    filename = tmp_path / 'matrix.json'
+    filename.write_text(json.dumps([block]))
+    with pytest.raises(ValueError):
+        scheduler.load_matrix(filename)
+
+
+def test_jobs_run_longest_first_within_the_budget(tmp_path):
+    jobs = [_RecordingJob('c', 3, processes=1, memory=10, log_dir=tmp_path),
+            _RecordingJob('e', 1, processes=1, memory=200, log_dir=tmp_path, fail=True),
+            _RecordingJob('a', 5, processes=3, memory=10, log_dir=tmp_path),
+            _RecordingJob('d', 2, processes=8, memory=10, log_dir=tmp_path),
+            _RecordingJob('b', 4, processes=2, memory=10, log_dir=tmp_path)]
+    failed = scheduler.run_jobs(jobs, cpus=4, memory=100)
+    assert [job.name for job in failed] == ['e']
+
+    intervals = {job.name: tuple(map(float, (tmp_path / job.name).read_text().split())) for job in jobs}
+    assert sorted(intervals, key=lambda name: intervals[name][0]) == ['a', 'b', 'c', 'd', 'e']
+
+    def overlap(first, second):
+        return intervals[first][0] < intervals[second][1] and intervals[second][0] < intervals[first][1]
+
+    # b does not fit next to a, and c waits for b although it would fit next to a
+    assert not overlap('a', 'b') and not overlap('a', 'c')
+    assert overlap('b', 'c')
+    # d needs more CPUs and e more memory than the budget, they run alone
+    assert not any(overlap('d', name) for name in 'abce')
+    assert not any(overlap('e', name) for name in 'abcd')
@@ -0,0 +1,75 @@
+"""
+Checks that every simulation run draws from its own random number streams: its samples depend on its seed only, not on
+the runs simulated with it or on the number of worker processes.
+"""
+import argparse
+from functools import partial
+
+import numpy as np
+import pytest
+
+from executor import RunExecutor
+from models import BatchedBetaBernoulli, BetaBernoulli
+from sampling import BATCH_SAMPLE_CATEGORY, ClassPool, random_sampling
+from seeding import batch_generators, require_generator, run_generators
+
+
+def _sample_batch(args, predictions, sample_method, runs):
+    import utils
+    start, stop = runs
+    return utils.get_samples_topk_batch(args, *predictions.columns, predictions.num_classes, predictions.num_samples,
+                                        sample_method, stop - start, random_seed=start)
+
+
+def test_run_generators_depend_on_the_seed_only():
+    pool_rngs, sample_rngs = batch_generators(3, 4)
+    for run, seed in enumerate(range(3, 7)):
+        pool_rng, sample_rng = run_generators(seed)
+        assert pool_rngs[run].random() == pool_rng.random()
+        assert sample_rngs[run].random() == sample_rng.random()
+    pool_rng, sample_rng = run_generators(0)
+    assert pool_rng.random() != sample_rng.random()
+
+
+def test_missing_generators_raise():
+    with pytest.raises(ValueError):
+        require_generator(None)
+    # evaluation only models need no generator, sampling does
+    model = BetaBernoulli(3)
+    model.update(0, True)
+    assert model.eval.shape == (3,)
+    with pytest.raises(ValueError):
+        model.sample()
+    with pytest.raises(ValueError):
+        random_sampling(ClassPool([0, 1, 1], 2), rng=None)
+    with pytest.raises(ValueError):
+        BatchedBetaBernoulli(2, 3).sample()
+    # runs never share a generator
+    rng = np.random.default_rng(0)
+    with pytest.raises(ValueError):
+        BatchedBetaBernoulli(2, 3, rngs=[rng, rng]).sample()
+    with pytest.raises(ValueError):
+        BATCH_SAMPLE_CATEGORY['random'](np.ones((2, 3), dtype=bool), rngs=[rng, rng])
+
+
+@pytest.mark.parametrize('sample_method', list(BATCH_SAMPLE_CATEGORY))
+def test_batched_runs_do_not_depend_on_their_batch(predictions, sample_method):
+    pytest.importorskip('utils')
+    args = argparse.Namespace(metric='accuracy', mode='min', topk=2)
+    batch = _sample_batch(args, predictions, sample_method, (0, 10))
+    for runs in [(4, 7), (5, 6)]:
+        samples = _sample_batch(args, predictions, sample_method, runs)
+        for column, batch_column in zip(samples, batch):
+            np.testing.assert_array_equal(column, batch_column[runs[0]:runs[1]])
+    assert not np.array_equal(batch[0][0], batch[0][1])
+
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_runs_do_not_depend_on_the_number_of_processes(predictions, processes):
+    pytest.importorskip('utils')
+    args = argparse.Namespace(metric='accuracy', mode='max', topk=1)
+    expected = _sample_batch(args, predictions, 'ttts', (0, 12))
+    with RunExecutor(processes=processes) as executor:
+        batches = executor.map(partial(_sample_batch, args, predictions, 'ttts'), [(0, 5), (5, 8), (8, 12)])
+    for column, expected_column in zip(zip(*batches), expected):
+        np.testing.assert_array_equal(np.concatenate(column), expected_column)
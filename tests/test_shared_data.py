@@ -0,0 +1,72 @@
+"""
+Checks of the arrays published in shared memory and of the result buffers filled by worker processes.
+"""
+import gc
+import os
+import pickle
+from functools import partial
+
+import numpy as np
+
+from executor import RunExecutor
+from shared_data import SharedArrays, SharedResultBuffer
+
+
+def _column_sum(arrays: SharedArrays, name: str) -> float:
+    if arrays[name] is None:
+        return None
+    assert not arrays[name].flags.writeable
+    return float(arrays[name].sum())
+
+
+def _fill_row(buffer: SharedResultBuffer, run_idx: int) -> int:
+    buffer[run_idx] = run_idx * 10 + np.arange(buffer.array.shape[1])
+    return os.getpid()
+
+
+def _is_attached(state) -> bool:
+    try:
+        pickle.loads(state)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_shared_arrays_read_by_workers():
+    columns = {'indices': np.arange(100), 'scores': np.linspace(0, 1, 30).reshape(3, 10), 'weights': None}
+    arrays = SharedArrays(columns)
+    try:
+        with RunExecutor(processes=2) as executor:
+            sums = executor.map(partial(_column_sum, arrays), list(columns), chunksize=1)
+        assert sums == [4950., 15., None]
+        attached = pickle.loads(pickle.dumps(arrays))
+        np.testing.assert_array_equal(attached['scores'], columns['scores'])
+        assert 'weights' in attached and attached['weights'] is None
+    finally:
+        arrays.unlink()
+    assert not _is_attached(pickle.dumps(arrays))
+
+
+def test_shared_result_buffer_written_by_workers():
+    buffer = SharedResultBuffer((12, 5))
+    with RunExecutor(processes=3) as executor:
+        pids = executor.map(partial(_fill_row, buffer), range(12), chunksize=1)
+    assert os.getpid() not in pids
+    expected = np.arange(12)[:, np.newaxis] * 10 + np.arange(5)
+    np.testing.assert_array_equal(buffer.array, expected)
+
+    # the array stays valid after the block is unlinked, but no process can attach to it anymore
+    array = buffer.array
+    state = pickle.dumps(buffer)
+    buffer.unlink()
+    np.testing.assert_array_equal(array, expected)
+    assert not _is_attached(state)
+
+
+def test_shared_result_buffer_freed_when_collected():
+    buffer = SharedResultBuffer((3, 2), dtype=np.int64)
+    state = pickle.dumps(buffer)
+    assert _is_attached(state)
+    del buffer
+    gc.collect()
+    assert not _is_attached(state)
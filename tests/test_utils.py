@@ -0,0 +1,76 @@
+"""
+Checks of the vectorized evaluation of sampled runs against the per-sample evaluation.
+"""
+import argparse
+
+import numpy as np
+import pytest
+
+from ranking import select_topk
+
+
+def _ground_truth(predictions, topk: int, mode: str) -> np.ndarray:
+    categories, observations = predictions.columns[:2]
+    accuracy = np.bincount(categories, weights=observations, minlength=predictions.num_classes) / np.bincount(
+        categories, minlength=predictions.num_classes)
+    ground_truth = np.zeros((predictions.num_classes,), dtype=bool)
+    ground_truth[select_topk(accuracy, topk, mode)] = True
+    return ground_truth
+
+
+@pytest.mark.parametrize('mode', ['min', 'max'])
+@pytest.mark.parametrize('topk', [1, 3])
+@pytest.mark.parametrize('prior_scale', [None, 2.])
+def test_evaluate_batch_matches_evaluate(predictions, monkeypatch, mode, topk, prior_scale):
+    utils = pytest.importorskip('utils')
+    # several chunks of runs
+    monkeypatch.setattr(utils, 'EVAL_CHUNK_SIZE', 500)
+    args = argparse.Namespace(metric='accuracy', mode=mode, topk=topk)
+    prior = None if prior_scale is None else np.ones((predictions.num_classes, 2)) * prior_scale
+    ground_truth = _ground_truth(predictions, topk, mode)
+    samples = utils.get_samples_topk_batch(args, *predictions.columns, predictions.num_classes,
+                                           predictions.num_samples, 'ts', 4, random_seed=3)
+    agreement, mrr = utils.evaluate_batch(args, samples[0], samples[1], ground_truth, predictions.num_classes,
+                                          prior=prior)
+    for run in range(4):
+        expected = utils.evaluate(args, *(column[run] for column in samples), ground_truth, predictions.num_classes,
+                                  prior=prior)
+        np.testing.assert_allclose(agreement[run], expected[0], rtol=1e-12)
+        np.testing.assert_allclose(mrr[run], expected[1], rtol=1e-12)
+
+
+@pytest.mark.parametrize('mode', ['min', 'max'])
+def test_online_batched_evaluation_matches_evaluate_batch(predictions, mode):
+    utils = pytest.importorskip('utils')
+    args = argparse.Namespace(metric='accuracy', mode=mode, topk=2)
+    ground_truth = _ground_truth(predictions, 2, mode)
+    evaluators = [utils.BatchedTopkEvaluator(args, ground_truth, predictions.num_classes, predictions.num_samples, 5,
+                                             prior=prior) for prior in [None, np.ones((predictions.num_classes, 2))]]
+    samples = utils.get_samples_topk_batch(args, *predictions.columns, predictions.num_classes,
+                                           predictions.num_samples, 'ttts', 5, random_seed=2, evaluators=evaluators)
+    for evaluator, prior in zip(evaluators, [None, np.ones((predictions.num_classes, 2))]):
+        expected = utils.evaluate_batch(args, samples[0], samples[1], ground_truth, predictions.num_classes,
+                                        prior=prior)
+        np.testing.assert_allclose(evaluator.result()[0], expected[0], rtol=1e-12)
+        np.testing.assert_allclose(evaluator.result()[1], expected[1], rtol=1e-12)
+
+
+@pytest.mark.parametrize('metric, calibration_model', [('accuracy', None),
+                                                       ('calibration_error', 'histogram_binning'),
+                                                       ('calibration_error', 'classwise_histogram_binning')])
+def test_online_evaluation_matches_evaluate(predictions, metric, calibration_model):
+    utils = pytest.importorskip('utils')
+    args = argparse.Namespace(metric=metric, mode='max', topk=2, pseudocount=2, calibration_model=calibration_model)
+    ground_truth = _ground_truth(predictions, 2, 'max')
+    # the first half is sampled, the second half is the holdout set of the recalibration
+    columns = [column[:300] for column in predictions.columns]
+    holdout = {'holdout_' + name: column[300:] for name, column in
+               zip(['categories', 'observations', 'confidences', 'labels', 'indices'], predictions.columns)}
+    evaluator = utils.TopkEvaluator(args, ground_truth, predictions.num_classes, 300, **holdout)
+    samples = utils.get_samples_topk(args, *columns, predictions.num_classes, 300, 'ts', random_seed=1,
+                                     evaluator=evaluator)
+    expected = utils.evaluate(args, *samples, ground_truth, predictions.num_classes, **holdout)
+    assert len(evaluator.result()) == len(expected)
+    assert all(np.any(result) for result in expected)
+    for online, posthoc in zip(evaluator.result(), expected):
+        np.testing.assert_allclose(online, posthoc, rtol=1e-12)